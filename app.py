@@ -10,22 +10,39 @@ Pazarmetre – Geliştirilmiş Versiyon v2.0
 """
 
 from __future__ import annotations
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import Optional, List, Tuple
 from pathlib import Path
-import os, json, sqlite3, hashlib
-from urllib.parse import quote, unquote
+import os, re, gc, sys, json, gzip, mmap, queue, sqlite3, hashlib, threading, time, asyncio, tracemalloc
+from urllib.parse import quote, unquote, parse_qs
 
 from fastapi import FastAPI, Request, Form, Depends, HTTPException, status
 from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlmodel import SQLModel, Field, Session, create_engine, select
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, event as sa_event
+from sqlalchemy.exc import DBAPIError
+from starlette.requests import cookie_parser
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from collections import OrderedDict, deque
 from itertools import zip_longest
+from functools import partial
+from bisect import bisect_left
+from contextvars import ContextVar, Context
 import uuid
 import traceback
 from passlib.context import CryptContext
+try:
+    import numpy as np
+except ImportError:  # numpy yoksa saf Python yoluna düşülür
+    np = None
+try:
+    import brotli
+except ImportError:  # brotli yoksa sadece gzip sunulur
+    brotli = None
 from jose import JWTError, jwt
 from dotenv import load_dotenv
 from fastapi import Response
@@ -37,6 +54,7 @@ load_dotenv()
 
 
 # ================== Ayarlar ==================
+PROCESS_T0 = time.perf_counter()  # açılış / ilk yanıt süresi ölçümü için
 # PostgreSQL bağlantı URL'i - environment variable'dan al, yoksa Internal URL kullan
 DATABASE_URL = os.environ.get(
     "DATABASE_URL",
@@ -54,6 +72,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 gün
 DAYS_STALE = int(os.environ.get("DAYS_STALE", "2"))
 DAYS_HARD_DROP = int(os.environ.get("DAYS_HARD_DROP", "7"))
 ANALYTICS_SALT = os.environ.get("PAZAR_SALT", "pazarmetre_salt")  # IP hash için
+PAZAR_DEBUG = os.environ.get("PAZAR_DEBUG", "0") == "1"  # geliştirme: N+1 uyarıları vb.
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -379,13 +398,854 @@ if Path("templates").exists():
 else:
     templates = None
 
-# Opsiyonel statik
-if Path("static").exists():
-    app.mount("/static", StaticFiles(directory="static"), name="static")
+# Statik dosyalar. Sayfalarda asset_url() ile içerik hash'li isim kullanılır
+# (js/brand-map.js -> /static/js/brand-map.<hash>.js); hash güncelse yanıt
+# "immutable" olarak işaretlenir, dosya değişince URL de değişir.
+STATIC_DIR = Path(__file__).resolve().parent / "static"
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+_HASHED_NAME = re.compile(r"^(?P<stem>.+)\.(?P<hash>[0-9a-f]{10})(?P<ext>\.[A-Za-z0-9]+)$")
+_asset_hashes: dict = {}
+
+def asset_url(rel: str) -> str:
+    digest = _asset_hashes.get(rel)
+    if digest is None:
+        digest = hashlib.sha256((STATIC_DIR / rel).read_bytes()).hexdigest()[:10]
+        _asset_hashes[rel] = digest
+    stem, ext = os.path.splitext(rel)
+    return f"/static/{stem}.{digest}{ext}"
+
+class HashedStaticFiles(StaticFiles):
+    async def get_response(self, path: str, scope):
+        m = _HASHED_NAME.match(path)
+        if not m:
+            return await super().get_response(path, scope)
+        rel = m["stem"] + m["ext"]
+        response = await super().get_response(rel, scope)
+        if response.status_code == 200 and _asset_hashes.get(rel.replace(os.sep, "/")) == m["hash"]:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE
+        return response
+
+if STATIC_DIR.exists():
+    app.mount("/static", HashedStaticFiles(directory=STATIC_DIR), name="static")
 
 def get_session():
     return Session(engine)
 
+# ================== Veri değişikliği bildirimi ==================
+# Offer/Product/Store/Branch yazan her commit'ten sonra DATA_CHANGE_HOOKS
+# hook(kinds, districts) olarak çağrılır (sayfa önbelleği temizliği vb.).
+# districts: etkilenen {(şehir, ilçe)} kümesi; tüm ilçeleri etkiliyorsa None.
+# Yazılan Product/Store satırları {(model, id)} olarak hook'lar süresince
+# _changed_rows'ta durur (None: bilinmiyor, ör. başka worker'ın yazması).
+# İlk hook kataloğu yeniler: sonraki hook'ların temizlediği önbellekler eski
+# katalogla yeniden üretilmesin. Visit yazmaları tetiklemez.
+PUBLIC_DATA_MODELS = ("Offer", "Product", "Store", "Branch")
+DATA_CHANGE_HOOKS: list = []
+_changed_rows: ContextVar = ContextVar("pz_changed_rows", default=None)
+
+def notify_data_change(kinds: set, districts: Optional[set] = None, rows: Optional[set] = None):
+    token = _changed_rows.set(rows)
+    try:
+        for hook in DATA_CHANGE_HOOKS:
+            try:
+                hook(kinds, districts)
+            except Exception as e:
+                print("WARN data change hook:", repr(e))
+    finally:
+        _changed_rows.reset(token)
+
+def _refresh_catalog(kinds: set, districts: Optional[set]):
+    if kinds & {"Product", "Store"}:
+        catalog.apply_changes(_changed_rows.get())
+
+DATA_CHANGE_HOOKS.append(_refresh_catalog)
+
+@sa_event.listens_for(Session, "after_flush")
+def _collect_data_changes(session, flush_context):
+    kinds = session.info.setdefault("pz_changed", set())
+    locs = session.info.setdefault("pz_locs", set())
+    rows = session.info.setdefault("pz_rows", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        name = type(obj).__name__
+        if name not in PUBLIC_DATA_MODELS:
+            continue
+        kinds.add(name)
+        if name in ("Product", "Store"):
+            rows.add((name, obj.id))
+        if name == "Offer":
+            locs.add(("store", obj.store_id))
+        elif name in ("Store", "Branch"):
+            locs.add((obj.city, obj.district))
+        else:
+            locs.add(None)  # ürün değişikliği tüm ilçeleri etkiler
+
+@sa_event.listens_for(Session, "after_commit")
+def _fire_data_changes(session):
+    kinds = session.info.pop("pz_changed", None)
+    locs = session.info.pop("pz_locs", set())
+    rows = session.info.pop("pz_rows", set())
+    if kinds:
+        notify_data_change(kinds, _resolve_districts(locs), rows)
+
+@sa_event.listens_for(Session, "after_rollback")
+def _drop_data_changes(session):
+    session.info.pop("pz_changed", None)
+    session.info.pop("pz_locs", None)
+    session.info.pop("pz_rows", None)
+
+def _resolve_districts(locs: set) -> Optional[set]:
+    """Offer'ların store_id'lerini katalog üzerinden (şehir, ilçe)'ye çevirir."""
+    out = set()
+    for loc in locs:
+        if loc is None:
+            return None
+        if loc[0] == "store":
+            st = catalog.stores.get(loc[1])
+            if st is None:
+                return None
+            loc = (st.city, st.district)
+        out.add(loc)
+    return out
+
+# ================== Sıkıştırma (gzip / brotli) ==================
+# HTML/JSON/XML yanıtları COMPRESS_MIN_BYTES üstündeyse Accept-Encoding'e göre
+# sıkıştırılır (brotli kuruluysa önce br). Sayfa önbelleği girişleri sıkıştırılmış
+# varyantları da saklar; hit'te tekrar sıkıştırılmaz. İstatistikler /admin/perf'te.
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_TYPES = (b"text/html", b"application/json", b"application/xml", b"text/xml")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+class CompressionStats:
+    """Kodlama başına sıkıştırma işi ve kabloya giden bayt sayaçları."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compress: dict = {}  # enc -> [adet, giren bayt, çıkan bayt, saniye]
+        self.wire: dict = {}      # enc/identity -> [yanıt, bayt]
+
+    def add_compress(self, enc: str, n_in: int, n_out: int, seconds: float):
+        with self._lock:
+            c = self.compress.setdefault(enc, [0, 0, 0, 0.0])
+            c[0] += 1; c[1] += n_in; c[2] += n_out; c[3] += seconds
+
+    def add_wire(self, enc: str, n: int):
+        with self._lock:
+            w = self.wire.setdefault(enc, [0, 0])
+            w[0] += 1; w[1] += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "compress": {
+                    enc: {"count": c[0], "bytes_in": c[1], "bytes_out": c[2],
+                          "ratio": round(c[1] / c[2], 2) if c[2] else None, "ms_total": round(c[3] * 1000, 2)}
+                    for enc, c in self.compress.items()
+                },
+                "wire": {enc: {"responses": w[0], "bytes": w[1]} for enc, w in self.wire.items()},
+            }
+
+compression_stats = CompressionStats()
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for k, v in scope.get("headers", ()):
+        if k == name:
+            return v.decode("latin-1")
+    return None
+
+def accepted_encoding(scope) -> Optional[str]:
+    """Accept-Encoding'den sunabildiğimiz en iyi kodlama (q=0 reddedilir)."""
+    ae = _header(scope, b"accept-encoding")
+    if not ae:
+        return None
+    accepted = set()
+    for part in ae.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            q = 1.0
+        if q > 0:
+            accepted.add(token.strip())
+    for enc in ENCODINGS:
+        if enc in accepted or "*" in accepted:
+            return enc
+    return None
+
+def compressible(headers: list, size: int) -> bool:
+    if size < COMPRESS_MIN_BYTES:
+        return False
+    ctype = b""
+    for k, v in headers:
+        lk = k.lower()
+        if lk == b"content-encoding":
+            return False
+        if lk == b"content-type":
+            ctype = v
+    return ctype.startswith(COMPRESS_TYPES)
+
+def compress_body(body: bytes, enc: str) -> bytes:
+    t0 = time.perf_counter()
+    if enc == "br":
+        out = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        out = gzip.compress(body, GZIP_LEVEL, mtime=0)
+    compression_stats.add_compress(enc, len(body), len(out), time.perf_counter() - t0)
+    return out
+
+def encoded_headers(headers: list, enc: str, length: int) -> list:
+    out = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+    out += [(b"content-encoding", enc.encode()), (b"content-length", str(length).encode()),
+            (b"vary", b"Accept-Encoding")]
+    return out
+
+class CompressionMiddleware:
+    """Tek parça (more_body olmayan) uygun yanıtları sıkıştırır; akışları olduğu gibi geçirir."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        enc = accepted_encoding(scope)
+        pending = {}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                pending["start"] = message
+                return
+            start = pending.pop("start", None)
+            if start is None:
+                return await send(message)
+            body = message.get("body", b"")
+            headers = list(start.get("headers", []))
+            if not message.get("more_body", False) and compressible(headers, len(body)):
+                if enc is not None:
+                    body = compress_body(body, enc)
+                    headers = encoded_headers(headers, enc, len(body))
+                    message = {**message, "body": body}
+                else:
+                    headers.append((b"vary", b"Accept-Encoding"))
+                compression_stats.add_wire(enc or "identity", len(body))
+                start = {**start, "headers": headers}
+            await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if "start" in pending:  # gövdesiz yanıt
+            await send(pending.pop("start"))
+
+# ================== Sayfa önbelleği (anonim GET) ==================
+# Public sayfalar admin/işletme olmayan ziyaretçi için sadece path, query ve
+# city/district/nb çerezlerine bağlı. Bu girdilerle anahtarlanan tam yanıt
+# ASGI seviyesinde saklanır; hit'te route handler'a hiç girilmez. Giriş,
+# doldurulurken üretilen gzip/br varyantlarını da taşır.
+PAGE_CACHE_TTL = float(os.environ.get("PAGE_CACHE_TTL", "30"))
+PAGE_CACHE_MAX_BYTES = int(os.environ.get("PAGE_CACHE_MAX_MB", "32")) * 1024 * 1024
+PAGE_CACHE_PATHS = {"/", "/urun", "/magazalar", "/hukuk", "/iletisim", "/cerez-politikasi", "/kvkk-aydinlatma"}
+PAGE_CACHE_PREFIXES = ("/magaza/",)
+PAGE_CACHE_BYPASS_COOKIES = ("adm", "business_token")
+LOC_COOKIES = ("city", "district", "nb")
+
+class TTLCache:
+    """TTL + bayt sınırlı LRU. Değerler: (expires_at, value, size, stored_at).
+    stale > 0 ise ömrü dolan girdi bu kadar saniye daha bayat olarak tutulur;
+    get() sadece tazeyi, lookup() bayatı da döndürür."""
+
+    def __init__(self, ttl: float, max_bytes: int, stale: float = 0):
+        self.ttl = ttl
+        self.stale = stale
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.generation = 0
+        self.hits = self.misses = self.stale_hits = self.evictions = 0
+
+    def get(self, key):
+        hit = self.lookup(key, allow_stale=False)
+        return None if hit is None else hit[0]
+
+    def lookup(self, key, allow_stale: bool = True) -> Optional[tuple]:
+        """(değer, taze mi, saklanma zamanı [epoch sn]) ya da None."""
+        with self._lock:
+            entry = self._data.get(key)
+            now = time.monotonic()
+            if entry is not None and entry[0] + self.stale < now:
+                self._pop(key)
+                entry = None
+            if entry is None or (entry[0] < now and not allow_stale):
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            fresh = entry[0] >= now
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+            return entry[1], fresh, entry[3]
+
+    def put(self, key, value, size: int, generation: int):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            # Değer hesaplanırken yazma olduysa eski içeriği saklama
+            if generation != self.generation:
+                return
+            self._insert(key, (time.monotonic() + self.ttl, value, size, time.time()))
+
+    def put_stale(self, key, value, size: int, stored_at: float):
+        """Ömrü dolmuş (bayat) girdi ekler; stale süresi şimdiden başlar."""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._insert(key, (time.monotonic(), value, size, stored_at))
+
+    def _insert(self, key, entry: tuple):
+        self._pop(key)
+        self._data[key] = entry
+        self.size += entry[2]
+        while self.size > self.max_bytes and self._data:
+            self._pop(next(iter(self._data)))
+            self.evictions += 1
+
+    def shrink(self, max_bytes: int) -> int:
+        """En eski girdileri boyut max_bytes altına inene dek atar; atılan girdi sayısı."""
+        n = 0
+        with self._lock:
+            while self.size > max_bytes and self._data:
+                self._pop(next(iter(self._data)))
+                n += 1
+            self.evictions += n
+        return n
+
+    def contains(self, key) -> bool:
+        """Taze girdi var mı (sayaçlara dokunmaz)."""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and entry[0] >= time.monotonic()
+
+    def entries(self, match=None) -> list:
+        """[(anahtar, değer, saklanma zamanı)], bayat girdiler dahil."""
+        with self._lock:
+            return [(k, e[1], e[3]) for k, e in self._data.items() if match is None or match(k)]
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self, match=None):
+        """Tümünü ya da match(key) doğru olan anahtarları siler."""
+        with self._lock:
+            if match is None:
+                self._data.clear()
+                self.size = 0
+            else:
+                for key in [k for k in self._data if match(k)]:
+                    self._pop(key)
+            self.generation += 1
+
+page_cache = TTLCache(PAGE_CACHE_TTL, PAGE_CACHE_MAX_BYTES)
+DATA_CHANGE_HOOKS.append(lambda kinds, districts: page_cache.clear())
+
+def _scope_cookies(scope) -> dict:
+    for k, v in scope.get("headers", ()):
+        if k == b"cookie":
+            return cookie_parser(v.decode("latin-1"))
+    return {}
+
+def page_cache_key(scope) -> Optional[tuple]:
+    """Önbelleğe uygun istekse anahtar, değilse None."""
+    if scope["type"] != "http" or scope["method"] != "GET":
+        return None
+    path = scope["path"]
+    if district_from_path(path) is not None:
+        # Çerezsiz ilçe sayfası: içerik çerezlerden bağımsız
+        return (path, scope.get("query_string", b""))
+    if path not in PAGE_CACHE_PATHS and not path.startswith(PAGE_CACHE_PREFIXES):
+        return None
+    cookies = _scope_cookies(scope)
+    if any(cookies.get(c) for c in PAGE_CACHE_BYPASS_COOKIES):
+        return None
+    return (path, scope.get("query_string", b""), *(cookies.get(c, "") for c in LOC_COOKIES))
+
+class PageCacheMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        key = page_cache_key(scope) if PAGE_CACHE_TTL > 0 else None
+        if key is None:
+            return await self.app(scope, receive, send)
+
+        hit = page_cache.get(key)
+        if hit is not None:
+            return await _send_cached(send, hit, accepted_encoding(scope), b"HIT")
+
+        generation = page_cache.generation
+        start = {}
+        chunks = []
+
+        async def buffer(message):
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, buffer)
+        body = b"".join(chunks)
+        entry = _cache_entry(start, body)
+        if entry is not None:
+            size = len(body) + sum(len(v) for v in entry[3].values()) \
+                + sum(len(k) + len(v) for k, v in entry[1]) + 200
+            page_cache.put(key, entry, size, generation)
+            return await _send_cached(send, entry, accepted_encoding(scope), b"MISS")
+        headers = list(start.get("headers", [])) + [(b"x-page-cache", b"MISS")]
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+def _cache_entry(start: dict, body: bytes) -> Optional[tuple]:
+    """Saklanabilir yanıtsa (status, headers, body, {kodlama: sıkıştırılmış gövde})."""
+    if start.get("status") != 200:
+        return None
+    headers = list(start.get("headers", []))
+    ctype = b""
+    for k, v in headers:
+        lk = k.lower()
+        if lk in (b"set-cookie", b"x-stale-snapshot"):
+            return None
+        if lk == b"content-type":
+            ctype = v
+    if not ctype.startswith(b"text/html"):
+        return None
+    variants = {}
+    if compressible(headers, len(body)):
+        variants = {enc: compress_body(body, enc) for enc in ENCODINGS}
+    return 200, headers, body, variants
+
+async def _send_cached(send, entry: tuple, enc: Optional[str], state: bytes):
+    status_code, headers, body, variants = entry
+    # Sıkıştırılmamış gövde dış CompressionMiddleware'den geçer (Vary + sayaç orada)
+    if enc in variants:
+        body = variants[enc]
+        headers = encoded_headers(headers, enc, len(body))
+        compression_stats.add_wire(enc, len(body))
+    await send({"type": "http.response.start", "status": status_code,
+                "headers": headers + [(b"x-page-cache", state)]})
+    await send({"type": "http.response.body", "body": body})
+
+app.add_middleware(PageCacheMiddleware)
+
+# ================== Gövde parçası önbelleği ==================
+# layout() sayfayı sabit kabuk + gövde + kişisel parça (admin ziyaretçi sayısı)
+# olarak birleştirir. Vitrin, ürün ve mağaza gövdeleri (başlık, html) olarak
+# (sayfa, şehir, ilçe, mahalle, ...) anahtarıyla saklanır; admin/işletme dahil
+# ilçenin tüm ziyaretçileri aynı gövdeyi paylaşır. Yazmada yalnızca etkilenen
+# ilçelerin parçaları silinir. Ömrü dolan parça FRAGMENT_STALE_TTL boyunca
+# bayat kopya olarak tutulur (bkz. shared_fragment).
+FRAGMENT_CACHE_TTL = float(os.environ.get("FRAGMENT_CACHE_TTL", "60"))
+FRAGMENT_CACHE_MAX_BYTES = int(os.environ.get("FRAGMENT_CACHE_MAX_MB", "32")) * 1024 * 1024
+FRAGMENT_STALE_TTL = float(os.environ.get("FRAGMENT_STALE_TTL", "900"))
+
+fragment_cache = TTLCache(FRAGMENT_CACHE_TTL, FRAGMENT_CACHE_MAX_BYTES, FRAGMENT_STALE_TTL)
+
+def _drop_fragments(kinds: set, districts: Optional[set]):
+    if districts is None:
+        fragment_cache.clear()
+    else:
+        fragment_cache.clear(lambda key: (key[1], key[2]) in districts)
+
+DATA_CHANGE_HOOKS.append(_drop_fragments)
+
+def cached_fragment(key: tuple, build) -> tuple:
+    """key = (sayfa, şehir, ilçe, ...). build() -> (başlık, gövde, *ek).
+    Gövde UTF-8 bayt olarak saklanır ve döner; layout() doğrudan birleştirir.
+    Ek alanlar (ör. layout tail'i) olduğu gibi saklanır."""
+    if FRAGMENT_CACHE_TTL > 0:
+        hit = fragment_cache.get(key)
+        if hit is not None:
+            return hit
+    return _build_fragment(key, build)
+
+def _build_fragment(key: tuple, build) -> tuple:
+    generation = fragment_cache.generation
+    title, body, *extra = build()
+    value = (title, body.encode("utf-8"), *extra)
+    if FRAGMENT_CACHE_TTL > 0:
+        fragment_cache.put(key, value, len(value[1]) + 2 * len(title) + 200, generation)
+    return value
+
+# ================== Tekil üretim (single-flight) ==================
+# Önbellek kaçırıldığında aynı anahtar için eşzamanlı gelen istekler sayfayı
+# ayrı ayrı üretmez: ilk gelen üretimi threadpool'da başlatır, aynı anahtarla
+# gelenler bitene kadar onun sonucunu bekler. Üretim ayrı bir task olduğundan
+# başlatan istemcinin kopması bekleyenleri etkilemez. Sayaçlar /admin/perf'te.
+class SingleFlight:
+    def __init__(self):
+        self._inflight: dict = {}
+        self._started: dict = {}
+        self.leaders: dict = {}
+        self.coalesced: dict = {}
+        self.errors: dict = {}
+
+    async def do(self, key: tuple, fn, *args):
+        """fn(*args) sonucunu döner; key[0] sayaçlardaki sayfa adıdır."""
+        return await asyncio.shield(self.start(key, fn, *args))
+
+    def start(self, key: tuple, fn, *args) -> "asyncio.Future":
+        """Anahtar için üretim yoksa başlatır; beklemeden task'ı döner."""
+        name = key[0]
+        task = self._inflight.get(key)
+        if task is None:
+            self.leaders[name] = self.leaders.get(name, 0) + 1
+            task = asyncio.ensure_future(run_in_threadpool(stack_sampler.attributed, fn, *args))
+            self._inflight[key] = task
+            self._started[key] = time.monotonic()
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced[name] = self.coalesced.get(name, 0) + 1
+        return task
+
+    def age(self, key: tuple) -> float:
+        """Anahtarın süren üretimi kaç saniyedir çalışıyor (yoksa 0)."""
+        started = self._started.get(key)
+        return time.monotonic() - started if started is not None else 0.0
+
+    def _done(self, key: tuple, task):
+        self._inflight.pop(key, None)
+        self._started.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            self.errors[key[0]] = self.errors.get(key[0], 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            "inflight": len(self._inflight),
+            "pages": {
+                name: {"computed": self.leaders.get(name, 0), "coalesced": self.coalesced.get(name, 0),
+                       "errors": self.errors.get(name, 0)}
+                for name in sorted(set(self.leaders) | set(self.coalesced))
+            },
+        }
+
+single_flight = SingleFlight()
+
+# ================== Bayat sunum (stale-while-revalidate) ==================
+# Public sayfalar parçalarını shared_fragment() ile alır. Ömrü dolmuş ama
+# FRAGMENT_STALE_TTL içindeki parça beklemeden sunulur, yenisi arka planda
+# üretilir. DB'ye ulaşılamıyorsa (son yenileme DB hatası verdi ya da yenileme
+# FRAGMENT_OUTAGE_AFTER saniyedir sürüyor) bayat parça "fiyatlar ... itibarıyla"
+# bandıyla sunulur. Bayat yanıtlar X-Stale-Snapshot taşır; sayfa önbelleğine
+# girmez, ETag almaz.
+FRAGMENT_OUTAGE_AFTER = float(os.environ.get("FRAGMENT_OUTAGE_AFTER", "3"))
+TR_TZ = timezone(timedelta(hours=3))
+
+class StaleStats:
+    """Bayat sunum ve arka plan yenileme sayaçları + DB erişilebilirlik durumu."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stale_served = 0
+        self.outage_served = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.refresh_seconds = 0.0
+        self.refresh_max = 0.0
+        self.last_refresh = 0.0
+        self.db_down_since: Optional[float] = None
+        self.last_failure = 0.0
+
+    def served(self, outage: bool):
+        with self._lock:
+            self.stale_served += 1
+            self.outage_served += outage
+
+    def refreshed(self, seconds: float, ok: bool):
+        with self._lock:
+            self.refreshes += 1
+            self.refresh_errors += not ok
+            self.refresh_seconds += seconds
+            self.refresh_max = max(self.refresh_max, seconds)
+            self.last_refresh = seconds
+
+    def db_ok(self):
+        self.db_down_since = None
+
+    def db_failed(self):
+        now = time.time()
+        self.last_failure = now
+        if self.db_down_since is None:
+            self.db_down_since = now
+            print("WARN DB erişilemiyor, public sayfalar bayat kopyadan sunuluyor")
+
+    def should_refresh(self) -> bool:
+        # DB düşükken her istek yeni yenileme denemesi başlatmasın
+        return self.db_down_since is None or time.time() - self.last_failure >= FRAGMENT_OUTAGE_AFTER
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = self.refreshes
+            return {
+                "stale_ttl": FRAGMENT_STALE_TTL,
+                "stale_served": self.stale_served,
+                "outage_served": self.outage_served,
+                "refreshes": n,
+                "refresh_errors": self.refresh_errors,
+                "refresh_ms": {
+                    "avg": round(self.refresh_seconds / n * 1000, 2) if n else None,
+                    "max": round(self.refresh_max * 1000, 2),
+                    "last": round(self.last_refresh * 1000, 2),
+                },
+                "db_down_since": datetime.fromtimestamp(self.db_down_since, timezone.utc).isoformat()
+                if self.db_down_since else None,
+            }
+
+stale_stats = StaleStats()
+
+def _tracked_build(key: tuple, build, refresh: bool) -> tuple:
+    """Threadpool'da çalışır; DB hatasını erişilemezlik olarak işaretler."""
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        value = _build_fragment(key, build)
+        ok = True
+    except DBAPIError:
+        stale_stats.db_failed()
+        raise
+    finally:
+        if refresh:
+            stale_stats.refreshed(time.perf_counter() - t0, ok)
+    stale_stats.db_ok()
+    return value
+
+def stale_banner(stored_at: float) -> bytes:
+    ts = datetime.fromtimestamp(stored_at, TR_TZ).strftime("%d.%m.%Y %H:%M")
+    return f"""
+    <div class="mb-4 p-3 rounded-lg bg-amber-50 text-amber-800 text-sm">
+      ⚠️ Fiyatlar şu an güncellenemiyor; <b>{ts}</b> itibarıyla gösteriliyor.
+    </div>
+    """.encode("utf-8")
+
+async def shared_fragment(key: tuple, build) -> Tuple[tuple, Optional[float]]:
+    """cached_fragment'in async hâli; (değer, bayatsa saklanma zamanı) döner.
+    Önbellek kaçırıldığında aynı anahtar için tek bir build() çalışır,
+    eşzamanlı istekler sonucu paylaşır; bayat parça beklemeden sunulur."""
+    hit = fragment_cache.lookup(key) if FRAGMENT_CACHE_TTL > 0 else None
+    if hit is None:
+        return await single_flight.do(key, _tracked_build, key, build, False), None
+    value, fresh, stored_at = hit
+    if fresh:
+        return value, None
+    if stale_stats.should_refresh():
+        single_flight.start(key, _tracked_build, key, build, True)
+    outage = stale_stats.db_down_since is not None or single_flight.age(key) >= FRAGMENT_OUTAGE_AFTER
+    stale_stats.served(outage)
+    if outage:
+        title, body, *extra = value
+        value = (title, stale_banner(stored_at) + body, *extra)
+    return value, stored_at
+
+def mark_stale(resp: Response, stored_at: Optional[float]) -> Response:
+    """Bayat parçadan üretilen yanıtı paylaşılan önbelleklere kapatır."""
+    if stored_at is not None:
+        resp.headers["Cache-Control"] = "no-cache"
+        resp.headers["X-Stale-Snapshot"] = format_datetime(
+            datetime.fromtimestamp(stored_at, timezone.utc), usegmt=True)
+    return resp
+
+# ================== Koşullu GET (ETag / Last-Modified) ==================
+# / ve /urun (ve çerezsiz ilçe sayfaları) için doğrulayıcı, ilçedeki son fiyat değişikliği
+# zamanından türetilir. İlçe başına zaman damgası bellekte tutulur (O(1)),
+# açılışta DB'den (max updated_at/created_at) doldurulur, yazmalarda ilerletilir.
+# ETag süreç başına benzersiz BOOT_ID içerir: farklı worker'lar sahte 304 üretmez.
+# Birden fazla worker'da (gunicorn --workers N) bir worker'ın yazması diğerlerinin
+# hook'larını çalıştırmaz; bu yüzden her worker CONDITIONAL_REFRESH saniyede bir
+# DB'deki ilçe imzalarını (teklif sayısı, son zaman) ve ürün/mağaza imzasını okur, değişen
+# ilçeler için notify_data_change'i kendisi çağırır (katalog, doğrulayıcı, önbellekler).
+# Başka worker'daki yazma en geç bu kadar sürede görünür; yazan worker kendi
+# yazmasını bir kez daha algılar (fazladan bir önbellek temizliği). 0: kapalı
+# (tek worker). İmzaya yansımayan düzenlemeler saatlik doğrulayıcı değişimiyle düşer.
+# "Yeni" rozeti zamana bağlı olduğu için doğrulayıcı saatte bir de değişir.
+CONDITIONAL_PATHS = {"/", "/urun"}
+CONDITIONAL_REFRESH = float(os.environ.get("CONDITIONAL_REFRESH", "5"))
+BOOT_ID = uuid.uuid4().hex[:8]
+
+def _db_datetime(v) -> Optional[datetime]:
+    if isinstance(v, str):  # SQLite eski şema: TEXT
+        try:
+            v = datetime.fromisoformat(v.replace(" ", "T").split(".")[0])
+        except ValueError:
+            return None
+    return v.replace(microsecond=0) if v else None
+
+class DistrictVersions:
+    """İlçe başına (son değişiklik zamanı, sürüm). Ürün değişiklikleri global sayılır."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.boot = datetime.utcnow().replace(microsecond=0)
+        self.global_lm = self.boot
+        self.global_written: Optional[datetime] = None  # yalnız gerçek global yazmada dolar
+        self.global_ver = 0
+        self.by_district: dict = {}
+        self._sigs: Optional[dict] = None  # (şehir, ilçe) -> (son zaman, teklif sayısı)
+        self._product_sig = None
+        self.refreshes = 0
+
+    def load(self):
+        """DB imzalarını okur. İlk yüklemede zamanları doldurur; sonrakilerde imzası
+        değişen ilçeleri (başka worker'ın ya da doğrudan DB yazmaları) bildirir."""
+        with get_session() as s:
+            ts = func.max(func.coalesce(Offer.updated_at, Offer.created_at))
+            rows = s.execute(
+                select(Store.city, Store.district, ts, func.count(Offer.id))
+                .join(Store, Offer.store_id == Store.id)
+                .group_by(Store.city, Store.district)
+            ).all()
+            product_sig = tuple(s.execute(
+                select(func.max(func.coalesce(Product.updated_at, Product.created_at)), func.count(Product.id))
+            ).one()) + tuple(s.execute(select(func.max(Store.id), func.count(Store.id))).one())
+        sigs = {}
+        for city, dist, lm, n in rows:
+            lm = _db_datetime(lm)
+            if lm:
+                sigs[(city, dist)] = (lm, n)
+        with self._lock:
+            first, old = self._sigs is None, self._sigs or {}
+            self._sigs = sigs
+            product_changed = not first and product_sig != self._product_sig
+            self._product_sig = product_sig
+            if first:
+                for key, (lm, _n) in sigs.items():
+                    _old, ver = self.by_district.get(key, (None, 0))
+                    self.by_district[key] = (lm, ver)
+        if first:
+            return
+        self.refreshes += 1
+        if product_changed:  # hangi satır olduğu bilinmez: katalog tam yüklenir
+            notify_data_change({"Product", "Store"}, None)
+            return
+        changed = {key for key in old.keys() | sigs.keys() if old.get(key) != sigs.get(key)}
+        if changed:
+            notify_data_change({"Offer"}, changed)
+
+    def run(self):
+        while True:
+            time.sleep(CONDITIONAL_REFRESH)
+            try:
+                self.load()
+            except Exception as e:
+                print("WARN district_versions:", repr(e))
+
+    def bump(self, kinds: set, districts: Optional[set]):
+        now = datetime.utcnow().replace(microsecond=0)
+        with self._lock:
+            if districts is None:
+                self.global_ver += 1
+                self.global_lm = self.global_written = now
+                return
+            # sürüm sayacı aynı saniyedeki iki yazmada da ETag'i değiştirir
+            for key in districts:
+                _lm, ver = self.by_district.get(key, (None, 0))
+                self.by_district[key] = (now, ver + 1)
+
+    def validator(self, city: str, dist: str) -> Tuple[datetime, str]:
+        lm, ver = self.by_district.get((city, dist), (self.boot, 0))
+        return max(lm, self.global_lm), f"{self.global_ver}.{ver}"
+
+    def last_write(self, city: str, dist: str) -> Optional[datetime]:
+        """Bilinen son gerçek yazma (DB'den yüklenen ya da bump edilen); açılış zamanı sayılmaz."""
+        lm, _ver = self.by_district.get((city, dist), (None, 0))
+        if self.global_written is not None:
+            lm = max(lm, self.global_written) if lm else self.global_written
+        return lm
+
+district_versions = DistrictVersions()
+DATA_CHANGE_HOOKS.append(district_versions.bump)
+
+@app.on_event("startup")
+def start_district_refresh():
+    if CONDITIONAL_REFRESH > 0:
+        threading.Thread(target=district_versions.run, daemon=True).start()
+
+class ConditionalGetMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        loc = district_from_path(scope["path"])
+        if loc is not None:
+            # Çerezsiz ilçe sayfası: Cache-Control'ü route belirler
+            city, dist = loc
+            nb = ""
+            extra = [(b"cache-control", PUBLIC_CACHE_CONTROL.encode())]
+        elif scope["path"] in CONDITIONAL_PATHS:
+            cookies = _scope_cookies(scope)
+            city, dist, nb = cookies.get("city"), cookies.get("district"), cookies.get("nb", "")
+            if not city or not dist or any(cookies.get(c) for c in PAGE_CACHE_BYPASS_COOKIES):
+                return await self.app(scope, receive, send)
+            city, dist = unquote(city), unquote(dist)
+            extra = [(b"cache-control", b"private, no-cache"), (b"vary", b"Cookie")]
+        else:
+            return await self.app(scope, receive, send)
+
+        lm, version = district_versions.validator(city, dist)
+        hour = int(time.time() // 3600)
+        lm = max(lm, datetime.utcfromtimestamp(hour * 3600))
+        raw = "|".join((
+            BOOT_ID, version, lm.isoformat(), str(hour), scope["path"],
+            scope.get("query_string", b"").decode("latin-1"), city, dist, nb,
+        ))
+        etag = 'W/"%s"' % hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+        headers = [
+            (b"etag", etag.encode()),
+            (b"last-modified", format_datetime(lm.replace(tzinfo=timezone.utc), usegmt=True).encode()),
+        ]
+        if loc is None:
+            headers += extra
+
+        if _not_modified(scope, etag, lm):
+            await send({"type": "http.response.start", "status": 304, "headers": headers + (extra if loc else [])})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                hdrs = list(message.get("headers", []))
+                if any(k.lower() == b"x-stale-snapshot" for k, _v in hdrs):
+                    # bayat kopya doğrulayıcı almaz; sonradan 304 ile korunmasın
+                    hdrs += [h for h in headers if h[0] == b"vary"]
+                else:
+                    hdrs += headers
+                message = {**message, "headers": hdrs}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+def _not_modified(scope, etag: str, lm: datetime) -> bool:
+    inm = _header(scope, b"if-none-match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or etag[2:] in tags
+    ims = _header(scope, b"if-modified-since")
+    if ims:
+        try:
+            since = parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        return lm <= since
+    return False
+
+app.add_middleware(ConditionalGetMiddleware)
+app.add_middleware(CompressionMiddleware)
+
 # ================== Middleware: basit ziyaret kaydı ==================
 def _client_ip(request: Request) -> str:
     # Reverse proxy arkasında X-Forwarded-For kullanılabilir
@@ -397,12 +1257,74 @@ def _client_ip(request: Request) -> str:
 def _hash_ip(ip: str) -> str:
     return hashlib.sha256((ip + ANALYTICS_SALT).encode("utf-8")).hexdigest()
 
+class VisitWriter:
+    """Visit satırlarını istek yolu dışında, tek arka plan thread'inde yazar.
+    Kuyruk doluysa (DB yavaş/erişilemez) kayıt atılır; sayfa beklemez."""
+
+    def __init__(self):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=1000)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def put(self, visit: "Visit"):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(visit)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            t0 = time.perf_counter()
+            try:
+                with get_session() as s:
+                    s.add_all(batch)
+                    s.commit()
+            except Exception as e:
+                self.dropped += len(batch)
+                print("WARN visit writer:", repr(e))
+            metrics.observe("pz_visit_write_seconds", (), time.perf_counter() - t0)
+
+    def flush(self):
+        """Kuyrukta kalanları yazar (kapanışta)."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            with get_session() as s:
+                s.add_all(batch)
+                s.commit()
+
+visit_writer = VisitWriter()
+
+@app.on_event("shutdown")
+def flush_visits():
+    try:
+        visit_writer.flush()
+    except Exception as e:
+        print("WARN visit writer:", repr(e))
+
 @app.middleware("http")
 async def log_visit(request: Request, call_next):
     path = request.url.path or "/"
     existing_sess = request.cookies.get("pz_sess")
 
     response = await call_next(request)
+    warm_start.first_response(path)
 
     try:
         if request.method != "GET":
@@ -415,7 +1337,8 @@ async def log_visit(request: Request, call_next):
         if (
             path.startswith("/static")
             or path.startswith("/healthz")
-            or path in ("/favicon.ico", "/robots.txt", "/sitemap.xml")
+            or path in ("/favicon.ico", "/robots.txt")
+            or path.startswith("/sitemap")
         ):
             return response
 
@@ -432,21 +1355,22 @@ async def log_visit(request: Request, call_next):
             path="/",
             httponly=True,
         )
+        # Çerez taşıyan yanıt paylaşılan önbelleğe girmemeli
+        if "public" in response.headers.get("cache-control", ""):
+            response.headers["Cache-Control"] = "private, no-cache"
 
         ip = _client_ip(request)
         ip_h = _hash_ip(ip)
         visitor_h = hashlib.sha256((sess + ANALYTICS_SALT).encode("utf-8")).hexdigest()
 
-        from datetime import datetime as _dt
-        with get_session() as s:
-            s.add(Visit(
-                path=path,
-                ip_hash=ip_h,
-                visitor_hash=visitor_h,
-                ua=(request.headers.get("user-agent", "")[:255]),
-                ts=_dt.utcnow()
-            ))
-            s.commit()
+        # DB yazması event loop'ta yapılmaz: DB takılırsa public sayfalar da takılmasın
+        visit_writer.put(Visit(
+            path=path,
+            ip_hash=ip_h,
+            visitor_hash=visitor_h,
+            ua=(request.headers.get("user-agent", "")[:255]),
+            ts=datetime.utcnow()
+        ))
 
     except Exception as e:
         print("WARN log_visit:", repr(e))
@@ -461,26 +1385,620 @@ def healthz():
 def healthz_head():
     # HEAD isteği için sadece 200 dönmesi yeterli, body boş olabilir
     return PlainTextResponse("")
+
+# ================== Metrikler (/metrics, Prometheus metin formatı) ==================
+# Route başına istek sayısı + gecikme histogramı, route başına DB sorgu sayısı
+# ve süresi, bağlantı havuzu, önbellek isabetleri, ziyaret yazma ve bcrypt
+# süreleri. Sıcak yolda kilit yok: her thread kendi parçasına (shard) yazar,
+# /metrics okurken parçalar toplanır. Havuz ve önbellek değerleri okuma anında
+# nesnelerden alınır. Admin çerezi ya da METRICS_TOKEN (Bearer) ile okunur.
+#
+# Aynı middleware istek başına SQL sayısını/süresini de izler (RequestTrace):
+# yanıta Server-Timing (db, render, total) eklenir; PAZAR_DEBUG'da tek istekte
+# N_PLUS_ONE_MIN+ kez tekrarlanan sorgu şekilleri route adıyla N+1 şüphesi
+# olarak loglanır ve /admin/perf'te listelenir.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "1") == "1"
+N_PLUS_ONE_MIN = int(os.environ.get("N_PLUS_ONE_MIN", "3"))
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class Metrics:
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()  # sadece yeni thread parçası eklerken
+        self._shards: list = []
+        self._meta: dict = {}  # ad -> (tür, açıklama, kovalar)
+
+    def describe(self, name: str, kind: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self._meta[name] = (kind, help_text, buckets)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            return shard
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float):
+        shard = self._shard()
+        key = (name, labels)
+        h = shard.get(key)
+        if h is None:
+            h = shard[key] = [0] * (len(self._meta[name][2]) + 1) + [0.0]  # kovalar, +Inf, toplam
+        h[bisect_left(self._meta[name][2], value)] += 1
+        h[-1] += value
+
+    def collect(self) -> dict:
+        with self._lock:
+            shards = list(self._shards)
+        out: dict = {}
+        for shard in shards:
+            for key, v in list(shard.items()):
+                if isinstance(v, list):
+                    acc = out.get(key)
+                    out[key] = list(v) if acc is None else [a + b for a, b in zip(acc, v)]
+                else:
+                    out[key] = out.get(key, 0) + v
+        return out
+
+    def render(self, extra: List[Tuple[str, str, str, list]] = ()) -> str:
+        """extra: okuma anında hesaplanan [(ad, tür, açıklama, [(etiketler, değer)])]."""
+        by_name: dict = {}
+        for (name, labels), v in sorted(self.collect().items()):
+            by_name.setdefault(name, []).append((labels, v))
+        lines = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            samples = by_name.get(name)
+            if not samples:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, v in samples:
+                if kind != "histogram":
+                    lines.append(f"{name}{_prom_labels(labels)} {_prom_num(v)}")
+                    continue
+                cum = 0
+                for le, n in zip((*buckets, "+Inf"), v):
+                    cum += n
+                    lines.append(f"{name}_bucket{_prom_labels(labels + (('le', str(le)),))} {cum}")
+                lines.append(f"{name}_sum{_prom_labels(labels)} {_prom_num(v[-1])}")
+                lines.append(f"{name}_count{_prom_labels(labels)} {cum}")
+        for name, kind, help_text, samples in extra:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_prom_labels(labels)} {_prom_num(v)}" for labels, v in samples]
+        return "\n".join(lines) + "\n"
+
+def _prom_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+def _prom_num(v) -> str:
+    return str(int(v)) if isinstance(v, int) or float(v).is_integer() else repr(float(v))
+
+metrics = Metrics()
+metrics.describe("pz_http_requests_total", "counter", "HTTP istek sayısı (route, method, status)")
+metrics.describe("pz_http_request_duration_seconds", "histogram", "Route başına yanıt süresi")
+metrics.describe("pz_db_queries_total", "counter", "Route başına SQL sorgu sayısı")
+metrics.describe("pz_db_query_seconds_total", "counter", "Route başına SQL sorgu süresi toplamı")
+metrics.describe("pz_visit_write_seconds", "histogram", "Ziyaret kaydı yazma süresi (arka plan, toplu)")
+metrics.describe("pz_bcrypt_seconds", "histogram", "bcrypt hash/verify süresi (event loop'u bloklar)")
+
+class RequestTrace:
+    """Tek isteğin SQL sayacı; ContextVar ile threadpool build'lerine de geçer."""
+    __slots__ = ("scope", "t0", "db_count", "db_time", "shapes")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.t0 = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.shapes: Optional[dict] = {} if PAZAR_DEBUG else None
+
+    def server_timing(self) -> bytes:
+        total = (time.perf_counter() - self.t0) * 1000
+        db = self.db_time * 1000
+        return (f'db;dur={db:.1f};desc="{self.db_count} sorgu", '
+                f"render;dur={max(total - db, 0):.1f}, total;dur={total:.1f}").encode()
+
+_request_trace: ContextVar = ContextVar("pz_request_trace", default=None)
+_ROUTE_LABELS: dict = {}
+n_plus_one_log: "deque[dict]" = deque(maxlen=200)
+
+_SQL_STR = re.compile(r"'(?:[^']|'')*'")
+_SQL_PARAM_LIST = re.compile(r"\((?:\s*(?:\?|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%\(\w+\)s|:\w+)\s*\)")
+_SQL_NUM = re.compile(r"\b\d+\b")
+
+def sql_shape(statement: str) -> str:
+    """Sorgu şekli: literal ve IN listeleri ? olur, boşluklar tekilleşir."""
+    s = _SQL_STR.sub("?", statement)
+    s = _SQL_PARAM_LIST.sub("(?)", s)
+    s = _SQL_NUM.sub("?", s)
+    return " ".join(s.split())
+
+def _flag_n_plus_one(route: str, shapes: dict):
+    for shape, n in shapes.items():
+        if n >= N_PLUS_ONE_MIN:
+            print(f"WARN N+1 şüphesi {route}: {n}× {shape[:200]}")
+            n_plus_one_log.append({"at": datetime.utcnow().isoformat(timespec="seconds"),
+                                   "route": route, "count": n, "sql": shape})
+
+def route_label(scope) -> str:
+    """Route şablonu (/urun, /sakarya/{dist_slug}/...). Sayfa önbelleği hit'inde
+    router'a girilmediğinden path route'larla eşleştirilir (path başına önbellekli)."""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "<unknown>")
+    path = scope["path"]
+    label = _ROUTE_LABELS.get(path)
+    if label is None:
+        label = "<unmatched>"
+        for r in app.router.routes:
+            if r.matches(scope)[0] != Match.NONE:
+                label = getattr(r, "path", "<unknown>")
+                break
+        if len(_ROUTE_LABELS) < 10000:
+            _ROUTE_LABELS[path] = label
+    return label
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (METRICS_ENABLED or SERVER_TIMING or PAZAR_DEBUG):
+            return await self.app(scope, receive, send)
+        trace = RequestTrace(scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SERVER_TIMING:
+                    message = {**message, "headers": list(message.get("headers", []))
+                               + [(b"server-timing", trace.server_timing())]}
+            await send(message)
+
+        token = _request_trace.set(trace)
+        task = stack_sampler.enter(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_trace.reset(token)
+            if task is not None:
+                stack_sampler.task_traces.pop(task, None)
+            route = route_label(scope)
+            if METRICS_ENABLED:
+                metrics.inc("pz_http_requests_total",
+                            (("route", route), ("method", scope["method"]), ("status", str(status_code))))
+                metrics.observe("pz_http_request_duration_seconds", (("route", route),),
+                                time.perf_counter() - trace.t0)
+            if trace.shapes:
+                _flag_n_plus_one(route, trace.shapes)
+
+app.add_middleware(MetricsMiddleware)
+
+@sa_event.listens_for(engine, "before_cursor_execute")
+def _metrics_query_start(conn, cursor, statement, parameters, context, executemany):
+    if METRICS_ENABLED or SLOW_QUERY_MS > 0 or _request_trace.get() is not None:
+        conn.info.setdefault("pz_query_t0", []).append(time.perf_counter())
+
+@sa_event.listens_for(engine, "after_cursor_execute")
+def _metrics_query_end(conn, cursor, statement, parameters, context, executemany):
+    stack = conn.info.get("pz_query_t0")
+    if not stack:
+        return
+    elapsed = time.perf_counter() - stack.pop()
+    trace = _request_trace.get()
+    if trace is not None:
+        trace.db_count += 1
+        trace.db_time += elapsed
+        if trace.shapes is not None:
+            shape = sql_shape(statement)
+            trace.shapes[shape] = trace.shapes.get(shape, 0) + 1
+    if METRICS_ENABLED:
+        labels = (("route", route_label(trace.scope) if trace is not None else "<background>"),)
+        metrics.inc("pz_db_queries_total", labels)
+        metrics.inc("pz_db_query_seconds_total", labels, elapsed)
+    if SLOW_QUERY_MS > 0 and elapsed * 1000 >= SLOW_QUERY_MS and not conn.info.get("pz_explain"):
+        slow_queries.record(statement, parameters, executemany,
+                            route_label(trace.scope) if trace is not None else "<background>", elapsed)
+
+@sa_event.listens_for(engine, "handle_error")
+def _metrics_query_error(ctx):
+    if ctx.connection is not None:
+        stack = ctx.connection.info.get("pz_query_t0")
+        if stack:
+            stack.pop()
+
+# ================== Yavaş sorgu kaydı ==================
+# SLOW_QUERY_MS üstündeki sorgular şekil (sql_shape), maskelenmiş parametreler,
+# route ve süreyle bellekte bir halkaya (SLOW_QUERY_RING) yazılır. Plan (SQLite:
+# EXPLAIN QUERY PLAN, Postgres: EXPLAIN (FORMAT JSON)) ve SLOW_QUERY_LOG
+# dosyasına JSON satırı ekleme istek yolunda değil, arka plan thread'inde
+# yapılır; plan şekil başına bir kez alınır. /admin/slow-queries şekle göre
+# gruplar.
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_RING = int(os.environ.get("SLOW_QUERY_RING", "500"))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", "slow_queries.log")
+
+def redact_params(parameters, executemany: bool):
+    """Sayı/tarih/bool olduğu gibi, metin ve bayt değerler uzunluğuyla maskelenir."""
+    def one(v):
+        if v is None or isinstance(v, (bool, int, float)):
+            return v
+        if isinstance(v, datetime):
+            return v.isoformat()
+        if isinstance(v, (str, bytes)):
+            return f"<{type(v).__name__} len={len(v)}>"
+        return f"<{type(v).__name__}>"
+
+    def row(p):
+        if isinstance(p, dict):
+            return {k: one(v) for k, v in p.items()}
+        if isinstance(p, (list, tuple)):
+            return [one(v) for v in p]
+        return one(p)
+
+    if executemany and isinstance(parameters, (list, tuple)):
+        return {"rows": len(parameters), "first": row(parameters[0]) if parameters else None}
+    return row(parameters)
+
+class SlowQueryLog:
+    def __init__(self):
+        self.ring: "deque[dict]" = deque(maxlen=SLOW_QUERY_RING)
+        self.plans: dict = {}  # şekil -> plan metni
+        self._queue: "queue.Queue" = queue.Queue(maxsize=200)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self.dropped = 0
+
+    def record(self, statement: str, parameters, executemany: bool, route: str, elapsed: float):
+        rec = {"at": datetime.utcnow().isoformat(timespec="seconds"), "route": route,
+               "ms": round(elapsed * 1000, 1), "sql": sql_shape(statement),
+               "params": redact_params(parameters, executemany)}
+        self.ring.append(rec)
+        if self._thread is None:
+            with self._start_lock:  # iki istek thread'i aynı anda ilk yavaş sorguyu görebilir
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        try:
+            # ham parametreler sadece EXPLAIN için kuyrukta tutulur
+            self._queue.put_nowait((rec, statement, None if executemany else parameters))
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            rec, statement, parameters = self._queue.get()
+            if rec["sql"] not in self.plans and len(self.plans) < 1000:
+                self.plans[rec["sql"]] = self._explain(statement, parameters)
+            rec["plan"] = self.plans.get(rec["sql"])
+            if SLOW_QUERY_LOG:
+                try:
+                    with open(SLOW_QUERY_LOG, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+                except OSError as e:
+                    print("WARN slow query log:", repr(e))
+
+    def _explain(self, statement: str, parameters) -> Optional[str]:
+        if parameters is None or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return None
+        if engine.dialect.name == "postgresql":
+            prefix = "EXPLAIN (FORMAT JSON) "
+        elif engine.dialect.name == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN "
+        else:
+            return None
+        try:
+            with engine.connect() as conn:
+                conn.info["pz_explain"] = True
+                try:
+                    rows = conn.exec_driver_sql(prefix + statement, parameters).all()
+                finally:
+                    conn.info.pop("pz_explain", None)
+        except Exception as e:
+            return f"EXPLAIN hatası: {e!r}"
+        if engine.dialect.name == "postgresql":
+            plan = rows[0][0]
+            return json.dumps(plan, ensure_ascii=False, indent=1) if not isinstance(plan, str) else plan
+        # SQLite: (id, parent, notused, detail)
+        return "\n".join(str(r[-1]) for r in rows)
+
+    def grouped(self) -> List[dict]:
+        """Şekle göre: adet, toplam/en yüksek/ortalama ms, route'lar, plan; toplam süreye göre sıralı."""
+        groups: dict = {}
+        for rec in list(self.ring):
+            g = groups.setdefault(rec["sql"], {"sql": rec["sql"], "count": 0, "total_ms": 0.0,
+                                               "max_ms": 0.0, "routes": {}, "last": rec["at"],
+                                               "params": rec["params"]})
+            g["count"] += 1
+            g["total_ms"] += rec["ms"]
+            if rec["ms"] >= g["max_ms"]:
+                g["max_ms"], g["params"] = rec["ms"], rec["params"]
+            g["routes"][rec["route"]] = g["routes"].get(rec["route"], 0) + 1
+            g["last"] = rec["at"]
+        for g in groups.values():
+            g["avg_ms"] = round(g["total_ms"] / g["count"], 1)
+            g["total_ms"] = round(g["total_ms"], 1)
+            g["plan"] = self.plans.get(g["sql"])
+        return sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
+
+slow_queries = SlowQueryLog()
+
+# ================== Örnekleyici profil ==================
+# /admin/profile: N saniye boyunca sys._current_frames() ile event loop ve
+# worker thread yığınlarını örnekler, flame graph araçlarının okuduğu
+# "collapsed" biçimde döner (route;thread;çerçeve;...;yaprak adet). Route,
+# event loop'ta o an koşan task'ın, threadpool'da işi başlatan isteğin
+# RequestTrace'inden bulunur. Aynı anda tek profil çalışır.
+PROFILE_MAX_SECONDS = int(os.environ.get("PROFILE_MAX_SECONDS", "60"))
+
+# bekleyen thread'lerin yaprak çerçeveleri (idle=0 iken atlanır)
+_IDLE_LEAVES = {("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+                ("queue.py", "get"), ("selectors.py", "select"), ("base_events.py", "_run_once"),
+                ("runners.py", "run")}  # uvloop: döngü C'de beklerken
+
+class StackSampler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.task_traces: dict = {}    # asyncio task -> RequestTrace
+        self.thread_traces: dict = {}  # thread ident -> RequestTrace
+        self._labels: dict = {}        # code -> "fonksiyon (dosya:satır)"
+        self.last: Optional[dict] = None
+
+    def enter(self, trace) -> Optional["asyncio.Task"]:
+        """Profil sürerken isteğin task'ını route'a bağlar (middleware çağırır)."""
+        if not self.active:
+            return None
+        task = asyncio.current_task()
+        self.task_traces[task] = trace
+        return task
+
+    def attributed(self, fn, *args):
+        """Threadpool işi: profil sürerken thread'i isteğin route'una bağlar."""
+        if not self.active:
+            return fn(*args)
+        tid = threading.get_ident()
+        self.thread_traces[tid] = _request_trace.get()
+        try:
+            return fn(*args)
+        finally:
+            self.thread_traces.pop(tid, None)
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def run(self, seconds: float, hz: int, idle: bool, loop, loop_tid: int) -> dict:
+        """Bloklayarak örnekler; çağıran lock'u almış olmalı. {yığın: adet} döner."""
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        counts: dict = {}
+        names: dict = {}
+        samples = 0
+        self.active = True
+        t0 = next_t = time.perf_counter()
+        try:
+            while True:
+                if time.perf_counter() - t0 >= seconds:
+                    break
+                task = asyncio.current_task(loop)
+                for tid, frame in sys._current_frames().items():
+                    if tid == me:
+                        continue
+                    code = frame.f_code
+                    if not idle and (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                        continue
+                    if tid == loop_tid:
+                        thread, trace = "event-loop", self.task_traces.get(task) if task is not None else None
+                    else:
+                        if tid not in names:
+                            names = {t.ident: t.name for t in threading.enumerate()}
+                        thread = re.sub(r"[\d;]+", "", names.get(tid, "thread")).strip() or "thread"
+                        trace = self.thread_traces.get(tid)
+                    stack = []
+                    while frame is not None:
+                        stack.append(self._label(frame.f_code))
+                        frame = frame.f_back
+                    route = route_label(trace.scope) if trace is not None else "<background>"
+                    key = f"{route};{thread};" + ";".join(reversed(stack))
+                    counts[key] = counts.get(key, 0) + 1
+                samples += 1
+                next_t += interval
+                time.sleep(max(0.0, next_t - time.perf_counter()))
+        finally:
+            self.active = False
+            self.task_traces.clear()
+            self.thread_traces.clear()
+        self.last = {"at": datetime.utcnow().isoformat(timespec="seconds"), "seconds": seconds,
+                     "hz": hz, "samples": samples, "stacks": len(counts)}
+        return counts
+
+stack_sampler = StackSampler()
+
+def _gauge_samples() -> list:
+    pool = engine.pool
+    pool_samples = [((("state", attr),), getattr(pool, attr)())
+                    for attr in ("size", "checkedout", "checkedin", "overflow") if hasattr(pool, attr)]
+    caches = (("page", page_cache), ("fragment", fragment_cache))
+    ratio = []
+    for name, cache in caches:
+        total = cache.hits + cache.misses + cache.stale_hits
+        ratio.append(((("cache", name),), round(cache.hits / total, 4) if total else 0))
+    return [
+        ("pz_db_pool_connections", "gauge", "Bağlantı havuzu durumu", pool_samples),
+        ("pz_cache_requests_total", "counter", "Önbellek okumaları (hit, stale, miss)",
+         [((("cache", n), ("result", r)), getattr(c, attr)) for n, c in caches
+          for r, attr in (("hit", "hits"), ("stale", "stale_hits"), ("miss", "misses"))]),
+        ("pz_cache_hit_ratio", "gauge", "Taze isabet oranı", ratio),
+        ("pz_cache_bytes", "gauge", "Önbellek boyutu (bayt)", [((("cache", n),), c.size) for n, c in caches]),
+        ("pz_cache_evictions_total", "counter", "LRU tahliyeleri", [((("cache", n),), c.evictions) for n, c in caches]),
+        ("pz_singleflight_coalesced_total", "counter", "Paylaşılan (tekrar üretilmeyen) build sayısı",
+         [((("page", n),), v) for n, v in sorted(single_flight.coalesced.items())]),
+    ]
+
+@app.get("/metrics")
+async def metrics_endpoint(request: Request):
+    bearer = request.headers.get("authorization", "")
+    if not (METRICS_TOKEN and bearer == f"Bearer {METRICS_TOKEN}"):
+        r = require_admin(request)
+        if r:
+            return r
+    return PlainTextResponse(metrics.render(_gauge_samples()), media_type="text/plain; version=0.0.4")
+# =============== Sitemap ===============
+# Aktif ürün × ilçe sayfaları, lastmod = o ilçedeki son teklif değişikliği.
+# İlçe başına URL listesi tutulur; yazmalar sadece etkilenen ilçeleri kirli
+# işaretler, sonraki istekte yalnız onlar yeniden sorgulanır. Üretilen XML
+# belgeleri gzip/br varyantlarıyla saklanır. SITEMAP_MAX_URLS aşılırsa
+# /sitemap.xml bir sitemap index olur, parçalar /sitemap-<n>.xml'de.
+SITE_URL = os.environ.get("SITE_URL", "https://pazarmetre.com.tr").rstrip("/")
+SITEMAP_MAX_URLS = int(os.environ.get("SITEMAP_MAX_URLS", "40000"))
+SITEMAP_TTL = float(os.environ.get("SITEMAP_TTL", "3600"))  # diğer worker'ların yazmaları için
+SITEMAP_NS = "http://www.sitemaps.org/schemas/sitemap/0.9"
+
+def _xml_escape(s: str) -> str:
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def _w3c_date(dt: Optional[datetime]) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ") if dt else ""
+
+class SitemapBuilder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.urls: dict = {}        # (şehir, ilçe) -> [(loc, lastmod)]
+        self.dirty: Optional[set] = None  # None = hepsi kirli
+        self.docs: dict = {}        # "sitemap.xml" / "sitemap-1.xml" -> (ham, {kodlama: bayt})
+        self.built_at = 0.0
+
+    def invalidate(self, kinds: set, districts: Optional[set]):
+        with self._lock:
+            if districts is None or self.dirty is None:
+                self.dirty = None
+            else:
+                self.dirty |= districts
+
+    def _districts(self) -> List[Tuple[str, str]]:
+        return [(p["name"], d["name"]) for p in LOC_JSON["provinces"] for d in p["districts"]]
+
+    def _load(self, districts: List[Tuple[str, str]]):
+        wanted = set(districts)
+        ts = func.max(func.coalesce(Offer.updated_at, Offer.created_at))
+        with get_session() as s:
+            rows = s.execute(
+                select(Store.city, Store.district, Offer.product_id, ts)
+                .join(Store, Offer.store_id == Store.id)
+                .where(Offer.approved == True, Store.district.in_([d for _c, d in wanted]))
+                .group_by(Store.city, Store.district, Offer.product_id)
+            ).all()
+        latest: dict = {key: {} for key in wanted}  # (şehir, ilçe) -> {norm: (ad, lastmod)}
+        for city, dist, pid, lm in rows:
+            prod = catalog.product(pid)
+            if (city, dist) not in wanted or prod is None or not prod.is_active:
+                continue
+            if isinstance(lm, str):  # SQLite eski şema: TEXT
+                try:
+                    lm = datetime.fromisoformat(lm.replace(" ", "T").split(".")[0])
+                except ValueError:
+                    lm = None
+            by_norm = latest[(city, dist)]
+            name, prev = by_norm.get(prod.norm, (catalog.products_by_norm(prod.norm)[0].name, None))
+            by_norm[prod.norm] = (name, max(filter(None, (prev, lm)), default=None))
+        for key, by_norm in latest.items():
+            city, dist = key
+            items = sorted(by_norm.values())
+            district_lm = max((lm for _n, lm in items if lm), default=None)
+            urls = [(district_url(city, dist), district_lm)] if items else []
+            urls += [(district_url(city, dist, name), lm) for name, lm in items]
+            self.urls[key] = urls
+
+    def _render(self):
+        all_urls = [("/", None)]
+        for key in self._districts():
+            all_urls += self.urls.get(key, [])
+
+        def urlset(urls) -> str:
+            parts = [f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NS}">\n']
+            for loc, lm in urls:
+                lastmod = f"<lastmod>{_w3c_date(lm)}</lastmod>" if lm else ""
+                parts.append(f"  <url><loc>{_xml_escape(SITE_URL + loc)}</loc>{lastmod}</url>\n")
+            parts.append("</urlset>\n")
+            return "".join(parts)
+
+        if len(all_urls) <= SITEMAP_MAX_URLS:
+            docs = {"sitemap.xml": urlset(all_urls)}
+        else:
+            chunks = [all_urls[i:i + SITEMAP_MAX_URLS] for i in range(0, len(all_urls), SITEMAP_MAX_URLS)]
+            docs = {f"sitemap-{n}.xml": urlset(chunk) for n, chunk in enumerate(chunks, 1)}
+            index = [f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{SITEMAP_NS}">\n']
+            for n, chunk in enumerate(chunks, 1):
+                lm = max((lm for _loc, lm in chunk if lm), default=None)
+                lastmod = f"<lastmod>{_w3c_date(lm)}</lastmod>" if lm else ""
+                index.append(f"  <sitemap><loc>{SITE_URL}/sitemap-{n}.xml</loc>{lastmod}</sitemap>\n")
+            index.append("</sitemapindex>\n")
+            docs["sitemap.xml"] = "".join(index)
+
+        self.docs = {}
+        for name, xml in docs.items():
+            raw = xml.encode("utf-8")
+            self.docs[name] = (raw, {enc: compress_body(raw, enc) for enc in ENCODINGS})
+
+    def document(self, name: str) -> Optional[tuple]:
+        with self._lock:
+            if time.monotonic() - self.built_at > SITEMAP_TTL:
+                self.dirty = None
+            if self.dirty is None or self.dirty or not self.docs:
+                if self.dirty is None:
+                    todo = self._districts()
+                    self.built_at = time.monotonic()
+                else:
+                    todo = sorted(self.dirty)
+                self._load(todo)
+                self._render()
+                self.dirty = set()
+            return self.docs.get(name)
+
+sitemap_builder = SitemapBuilder()
+DATA_CHANGE_HOOKS.append(sitemap_builder.invalidate)
+
+def sitemap_response(request: Request, name: str) -> Response:
+    try:
+        doc = sitemap_builder.document(name)
+    except Exception as e:
+        print("WARN sitemap:", repr(e))
+        return PlainTextResponse("sitemap geçici olarak üretilemedi", status_code=503)
+    if doc is None:
+        return PlainTextResponse("Not Found", status_code=404)
+    raw, variants = doc
+    headers = {"Cache-Control": "public, max-age=3600"}
+    enc = accepted_encoding(request.scope)
+    if enc in variants:
+        compression_stats.add_wire(enc, len(variants[enc]))
+        headers.update({"Content-Encoding": enc, "Vary": "Accept-Encoding"})
+        return Response(content=variants[enc], media_type="application/xml", headers=headers)
+    return Response(content=raw, media_type="application/xml", headers=headers)
+
 @app.get("/sitemap.xml", include_in_schema=False)
-def sitemap_xml():
-    xml = """<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
-
-  <url>
-    <loc>https://pazarmetre.com.tr/</loc>
-    <changefreq>daily</changefreq>
-    <priority>1.0</priority>
-  </url>
-
-  <url>
-    <loc>https://pazarmetre.com.tr/vitrin</loc>
-    <changefreq>daily</changefreq>
-    <priority>0.9</priority>
-  </url>
-
-</urlset>
-"""
-    return Response(content=xml, media_type="application/xml")
+def sitemap_xml(request: Request):
+    return sitemap_response(request, "sitemap.xml")
+
+@app.get("/sitemap-{n}.xml", include_in_schema=False)
+def sitemap_part(request: Request, n: int):
+    return sitemap_response(request, f"sitemap-{n}.xml")
 # =============== Mini lokasyon verisi ===============
 LOC_JSON = {
     "provinces": [
@@ -526,6 +2044,51 @@ def turkish_lower(s: str) -> str:
             result.append(c.lower())
     return ''.join(result)
 
+_SLUG_TRANS = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+
+def slugify(s: str) -> str:
+    """URL parçası: "Dana Kıyma" -> "dana-kiyma", "Söğütlü" -> "sogutlu"."""
+    s = turkish_lower(s).translate(_SLUG_TRANS)
+    return re.sub(r"[^a-z0-9]+", "-", s).strip("-")
+
+# ==== Çerezsiz ilçe URL'leri ====
+# /sakarya/hendek/ ve /sakarya/hendek/urun/<slug>: lokasyon path'te taşınır,
+# sayfa çerezden bağımsızdır ve paylaşılan önbellekte tutulabilir.
+PROVINCE_BY_SLUG = {slugify(p["name"]): p["name"] for p in LOC_JSON["provinces"]}
+DISTRICT_BY_SLUG = {
+    (slugify(p["name"]), slugify(d["name"])): (p["name"], d["name"])
+    for p in LOC_JSON["provinces"] for d in p["districts"]
+}
+
+def district_url(city: str, dist: str, product_name: Optional[str] = None,
+                 brand: Optional[str] = None) -> str:
+    base = f"/{slugify(city)}/{slugify(dist)}/"
+    if product_name:
+        return f"{base}urun/{catalog.product_slug(product_name)}"
+    if brand:
+        return f"{base}magaza/{slugify(brand)}"
+    return base
+
+def product_href(base: str, name: str) -> str:
+    """Vitrin kartı linki: çerezli sayfada /urun?name=, ilçe sayfasında path."""
+    if base == "/":
+        return f"/urun?name={quote(name)}"
+    return f"{base}urun/{catalog.product_slug(name)}"
+
+def district_from_path(path: str) -> Optional[Tuple[str, str]]:
+    """/sakarya/hendek/... -> ("Sakarya", "Hendek"); ilçe path'i değilse None."""
+    parts = path.split("/", 3)
+    if len(parts) < 4 or parts[1] not in PROVINCE_BY_SLUG:
+        return None
+    return DISTRICT_BY_SLUG.get((parts[1], parts[2]))
+
+def rebase_district_path(next_path: str, city: str, dist: str) -> str:
+    """İlçe path'ini yeni ilçeye taşır; diğer path'ler aynen döner."""
+    if district_from_path(next_path) is None:
+        return next_path
+    parts = next_path.split("/", 3)
+    return f"/{slugify(city)}/{slugify(dist)}/{parts[3]}"
+
 # ==== Türkçe Tarih Formatı ====
 TURKISH_MONTHS = {
     1: "Ocak", 2: "Şubat", 3: "Mart", 4: "Nisan",
@@ -619,38 +2182,928 @@ def only_fresh_and_latest(rows: List[tuple], days_stale: int = 7, per_brand: boo
 
     return sorted(latest.values(), key=lambda t: t[0].price)
 
-TAILWIND_CDN = "https://cdn.tailwindcss.com"
+# =============== Kolon projeksiyonu (hafif satır nesneleri) ===============
+# Public sayfalar Offer/Store/Product'ın sadece birkaç alanını kullanıyor.
+# Tam ORM nesnesi (identity map + state takibi) yerine sadece gereken kolonları
+# seçip __slots__'lu küçük nesnelere dolduruyoruz. Alan adları ORM ile aynı,
+# böylece dedupe_by_brand_latest / only_fresh_and_latest aynen çalışır.
+class OfferRow:
+    __slots__ = (
+        "id", "product_id", "store_id", "price", "currency",
+        "created_at", "updated_at", "source_url", "branch_address",
+    )
 
-def header_right_html(request: Request) -> str:
-    city, dist, nb = get_loc(request)
+    def __init__(self, id, product_id, store_id, price, currency,
+                 created_at, updated_at, source_url, branch_address):
+        self.id = id
+        self.product_id = product_id
+        self.store_id = store_id
+        self.price = price
+        self.currency = currency
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.source_url = source_url
+        self.branch_address = branch_address
+
+class StoreRow:
+    __slots__ = ("id", "name", "address", "city", "district", "neighborhood")
+
+    def __init__(self, id, name, address, city, district, neighborhood):
+        self.id = id
+        self.name = name
+        self.address = address
+        self.city = city
+        self.district = district
+        self.neighborhood = neighborhood
+
+class ProductRow:
+    __slots__ = ("id", "name", "unit", "category")
+
+    def __init__(self, id, name, unit, category):
+        self.id = id
+        self.name = name
+        self.unit = unit
+        self.category = category
+
+OFFER_ROW_COLS = (
+    Offer.id, Offer.product_id, Offer.store_id, Offer.price, Offer.currency,
+    Offer.created_at, Offer.updated_at, Offer.source_url, Offer.branch_address,
+)
+STORE_ROW_COLS = (Store.id, Store.name, Store.address, Store.city, Store.district, Store.neighborhood)
+PRODUCT_ROW_COLS = (Product.id, Product.name, Product.unit, Product.category)
 
-    districts = [d["name"] for d in LOC_JSON["provinces"][0]["districts"]]
-    dist_opts = "".join(f"<option value='{d}'>{d}</option>" for d in districts)
+_N_OFF = len(OFFER_ROW_COLS)
+_N_ST = len(STORE_ROW_COLS)
 
-    js = """
-    <script>
-    (function(){
-      const qs=id=>document.getElementById(id);
-      const cookies = Object.fromEntries(
-        document.cookie.split('; ').filter(Boolean).map(s=>s.split('='))
-      );
-      const citySel = qs('cityQuick');
-      const distSel = qs('distQuick');
-
-      if(cookies.city) citySel.value = decodeURIComponent(cookies.city);
-      if(cookies.district) distSel.value = decodeURIComponent(cookies.district);
-
-      function go(){
-        const next = encodeURIComponent(location.pathname + location.search);
-        location.href =
-          `/setloc?city=${encodeURIComponent(citySel.value)}&district=${encodeURIComponent(distSel.value)}&next=${next}`;
-      }
+def fetch_offer_store_rows(s: Session, *where, order_by=None, with_product: bool = False) -> List[tuple]:
+    """
+    (OfferRow, StoreRow) veya with_product=True ise (OfferRow, StoreRow, ProductRow)
+    listesi döndürür. Aynı mağaza için tek StoreRow paylaşılır.
+    """
+    cols = OFFER_ROW_COLS + STORE_ROW_COLS + (PRODUCT_ROW_COLS if with_product else ())
+    q = select(*cols).join(Store, Offer.store_id == Store.id)
+    if with_product:
+        q = q.join(Product, Offer.product_id == Product.id)
+    if where:
+        q = q.where(*where)
+    if order_by is not None:
+        q = q.order_by(*order_by)
+
+    stores = {}
+    products = {}
+    out = []
+    for r in s.execute(q):
+        o = OfferRow(*r[:_N_OFF])
+        sid = r[_N_OFF]
+        st = stores.get(sid)
+        if st is None:
+            st = stores[sid] = StoreRow(*r[_N_OFF:_N_OFF + _N_ST])
+        if with_product:
+            pid = r[_N_OFF + _N_ST]
+            p = products.get(pid)
+            if p is None:
+                p = products[pid] = ProductRow(*r[_N_OFF + _N_ST:])
+            out.append((o, st, p))
+        else:
+            out.append((o, st))
+    return out
+
+def fetch_store_row(s: Session, *where) -> Optional[StoreRow]:
+    r = s.execute(select(*STORE_ROW_COLS).where(*where).limit(1)).first()
+    return StoreRow(*r) if r else None
+
+# =============== İlçe geneli en ucuz fiyat (vektörel) ===============
+def _district_best_offers_py(rows: List[tuple], nb: Optional[str] = None) -> dict:
+    """district_best_offers'ın saf Python karşılığı (numpy yoksa)."""
+    groups = {}
+    for o, st, p in rows:
+        groups.setdefault(turkish_lower(p.name), []).append((o, st))
+
+    best = {}
+    for norm_name, grp in groups.items():
+        # Mahalle filtresi (varsa)
+        if nb:
+            rows_nb = [(o, st) for (o, st) in grp if (st.neighborhood or "").lower() == nb.lower()]
+            if rows_nb:
+                grp = rows_nb
+        # Marka bazında en yeni teklif, sonra gerçek fiyat filtresi (boş / 0 fiyat kart basmasın)
+        grp = [(o, st) for (o, st) in dedupe_by_brand_latest(grp) if float(o.price or 0) > 0]
+        if grp:
+            best[norm_name] = grp[0]
+    return best
+
+def district_best_offers(rows: List[tuple], nb: Optional[str] = None) -> dict:
+    """
+    (OfferRow, StoreRow, ProductRow) satırlarından ürün grubu (turkish_lower(ad))
+    başına en ucuz teklifi döndürür: {norm_name: (OfferRow, StoreRow)}.
 
-      citySel.addEventListener('change', go);
-      distSel.addEventListener('change', go);
-    })();
-    </script>
+    Kurallar vitrinle aynı: mahalle eşleşmesi varsa sadece o mahalle, marka
+    başına en yeni teklif, fiyatı 0 olanlar elenir, kalanların en ucuzu.
+    Gruplama numpy lexsort ile tek geçişte yapılır; eşitlikte en yeni,
+    sonra girdi sırası kazanır (dedupe_by_brand_latest ile aynı).
     """
+    if not rows:
+        return {}
+    if np is None:
+        return _district_best_offers_py(rows, nb)
+
+    n = len(rows)
+    # Ürün ve marka anahtarlarını tam sayı koduna çevir (ProductRow/StoreRow paylaşımlı → id ile önbellek)
+    pcode, p_by_id = {}, {}
+    bcode, b_by_id = {}, {}
+    for _o, st, p in rows:
+        if p.id not in p_by_id:
+            p_by_id[p.id] = pcode.setdefault(turkish_lower(p.name), len(pcode))
+        if st.id not in b_by_id:
+            key = (
+                (st.name or "").casefold().strip(),
+                (st.city or "").casefold().strip(),
+                (st.district or "").casefold().strip(),
+            )
+            b_by_id[st.id] = bcode.setdefault(key, len(bcode))
+
+    pk = np.fromiter((p_by_id[p.id] for _o, _st, p in rows), dtype=np.int64, count=n)
+    bk = np.fromiter((b_by_id[st.id] for _o, st, _p in rows), dtype=np.int64, count=n)
+    ts = np.array([o.created_at for o, _st, _p in rows], dtype="datetime64[us]").view(np.int64)
+    price = np.fromiter((float(o.price or 0) for o, _st, _p in rows), dtype=np.float64, count=n)
+    idx = np.arange(n)
+
+    # Mahalle filtresi: grupta eşleşen varsa sadece onlar, yoksa hepsi
+    if nb:
+        nb_l = nb.lower()
+        nb_match = np.fromiter(
+            ((st.neighborhood or "").lower() == nb_l for _o, st, _p in rows), dtype=bool, count=n
+        )
+        has_nb = np.zeros(len(pcode), dtype=bool)
+        has_nb[pk[nb_match]] = True
+        idx = idx[nb_match | ~has_nb[pk]]
+
+    # (ürün, marka) başına en yeni teklif
+    order = np.lexsort((idx, -ts[idx], bk[idx], pk[idx]))
+    cand = idx[order]
+    first = np.ones(len(cand), dtype=bool)
+    first[1:] = (pk[cand[1:]] != pk[cand[:-1]]) | (bk[cand[1:]] != bk[cand[:-1]])
+    latest = cand[first]
+
+    # Gerçek fiyat filtresi, sonra ürün başına en ucuz
+    latest = latest[price[latest] > 0]
+    order = np.lexsort((latest, -ts[latest], price[latest], pk[latest]))
+    cand = latest[order]
+    first = np.ones(len(cand), dtype=bool)
+    first[1:] = pk[cand[1:]] != pk[cand[:-1]]
+
+    names = {code: name for name, code in pcode.items()}
+    best = {}
+    for i in cand[first].tolist():
+        o, st, _p = rows[i]
+        best[names[p_by_id[_p.id]]] = (o, st)
+    return best
+
+# =============== Ürün / Mağaza kataloğu (süreç içi) ===============
+# Product ve Store küçük ve seyrek değişen tablolar; neredeyse her istek
+# bunlara isimle bakıyor. Katalog açılışta bir kez yüklenir; yazmalarda ilk
+# veri değişikliği hook'u yazılan satırları yeniler (apply_changes), başka
+# worker'ın yazması DistrictVersions yoklamasıyla tam yüklemeye yol açar.
+# CATALOG_TTL dolunca arka planda tam yenilenir (istekler eski katalogla
+# sürer); içerik değiştiyse önbellekler geçersiz kılınır. DB hatasında eski
+# katalog kalır, yeniden deneme CATALOG_RETRY saniyede birdir.
+CATALOG_TTL = int(os.environ.get("CATALOG_TTL", "300"))
+CATALOG_RETRY = 30
+CATALOG_REFRESH_MAX = 50  # tek commit'te bundan fazla satır değiştiyse tam yükle
+
+class CatalogProduct(ProductRow):
+    __slots__ = ("featured", "is_active", "norm", "slug")
+
+    def __init__(self, id, name, unit, category, featured, is_active):
+        super().__init__(id, name, unit, category)
+        self.featured = bool(featured)
+        self.is_active = bool(is_active) if is_active is not None else True
+        self.norm = turkish_lower(name or "")
+        self.slug = slugify(name or "")
+
+class CatalogStore(StoreRow):
+    __slots__ = ("business_id", "key")
+
+    def __init__(self, id, name, address, city, district, neighborhood, business_id):
+        super().__init__(id, name, address, city, district, neighborhood)
+        self.business_id = business_id
+        self.key = store_key(name, city, district)
+
+def store_key(name: Optional[str], city: Optional[str], district: Optional[str]) -> tuple:
+    """Kanonik mağaza anahtarı: (marka casefold, şehir, ilçe)."""
+    return ((name or "").casefold().strip(), city, district)
+
+_CATALOG_PRODUCT_COLS = PRODUCT_ROW_COLS + (Product.featured, Product.is_active)
+_CATALOG_STORE_COLS = STORE_ROW_COLS + (Store.business_id,)
+
+class Catalog:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded_at = 0.0
+        self.failed_at = 0.0
+        self._reloading = False
+        self.products: dict = {}
+        self.stores: dict = {}
+        self._by_norm: dict = {}
+        self._by_name: dict = {}
+        self._by_slug: dict = {}      # taban slug -> ürün id'leri
+        self._base_norms: dict = {}   # taban slug -> isimler (norm), ilk id sırasıyla
+        self._norm_slug: dict = {}    # norm -> benzersiz URL slug'ı
+        self._slug_norm: dict = {}
+        self._store_by_key: dict = {}
+
+    # ---- yükleme ----
+    def load(self):
+        with get_session() as s:
+            prods = s.execute(select(*_CATALOG_PRODUCT_COLS)).all()
+            stores = s.execute(select(*_CATALOG_STORE_COLS)).all()
+        self.load_rows(prods, stores)
+
+    def load_rows(self, prod_rows, store_rows):
+        """_CATALOG_*_COLS sırasındaki ham satırlardan yükler (DB ya da warm snapshot)."""
+        prods = [CatalogProduct(*r) for r in prod_rows]
+        stores = [CatalogStore(*r) for r in store_rows]
+        with self._lock:
+            self.products, self._by_norm, self._by_name, self._by_slug = {}, {}, {}, {}
+            self._base_norms, self._norm_slug, self._slug_norm = {}, {}, {}
+            self.stores, self._store_by_key = {}, {}
+            for p in sorted(prods, key=lambda p: p.id):
+                self._add_product(p)
+            for st in sorted(stores, key=lambda st: st.id):
+                self._add_store(st)
+            self.loaded_at = time.monotonic()
+
+    def rows(self) -> Tuple[list, list]:
+        """load_rows() ile geri yüklenebilecek ham satırlar."""
+        with self._lock:
+            return (
+                [[p.id, p.name, p.unit, p.category, p.featured, p.is_active] for p in self.products.values()],
+                [[st.id, st.name, st.address, st.city, st.district, st.neighborhood, st.business_id]
+                 for st in self.stores.values()],
+            )
+
+    def _ensure(self):
+        now = time.monotonic()
+        if self.loaded_at and now - self.loaded_at <= CATALOG_TTL:
+            return
+        if now - self.failed_at < CATALOG_RETRY:
+            return
+        if not self.loaded_at:  # ilk yükleme: elde katalog yok, beklemek gerekir
+            try:
+                self.load()
+            except Exception:
+                self.failed_at = time.monotonic()
+                raise
+            return
+        with self._lock:
+            if self._reloading:
+                return
+            self._reloading = True
+        threading.Thread(target=self._reload, daemon=True).start()
+
+    def _reload(self):
+        """TTL yenilemesi (arka plan). Başka worker'ın ya da doğrudan DB düzenlemesi
+        kataloğu değiştirdiyse sayfa/parça önbellekleri ve doğrulayıcılar da düşer."""
+        try:
+            before = self._signature()
+            self.load()
+            if self._signature() != before:
+                notify_data_change({"Product", "Store"}, None, set())
+        except Exception as e:
+            self.failed_at = time.monotonic()
+            if isinstance(e, DBAPIError):
+                stale_stats.db_failed()
+            print("WARN catalog reload:", repr(e))
+        finally:
+            self._reloading = False
+
+    def _signature(self) -> tuple:
+        prods, stores = self.rows()
+        return sorted(prods, key=lambda r: r[0]), sorted(stores, key=lambda r: r[0])
+
+    def apply_changes(self, rows: Optional[set]):
+        """Yazılan ürün/mağaza satırlarını yeniler; rows None (bilinmiyor) ya da
+        çoksa tam yükler."""
+        if not self.loaded_at:
+            return
+        if rows is None or len(rows) > CATALOG_REFRESH_MAX:
+            self.load()
+            return
+        for kind, rid in sorted(rows):
+            if kind == "Product":
+                self.refresh_product(rid)
+            else:
+                self.refresh_store(rid)
+
+    def _add_product(self, p: CatalogProduct):
+        self.products[p.id] = p
+        self._by_norm.setdefault(p.norm, []).append(p.id)
+        self._by_name.setdefault(p.name, []).append(p.id)
+        self._by_slug.setdefault(p.slug, []).append(p.id)
+        self._reslug(p.slug)
+
+    def _reslug(self, base: str):
+        """Aynı taban slug'a düşen farklı isimlerden (ör. "Çay" / "Cay") ilki tabanı,
+        diğerleri ilk ürün id'si ekini alır: her isim grubunun kendi URL'si olur."""
+        for norm in self._base_norms.pop(base, []):
+            slug = self._norm_slug.pop(norm, None)
+            if self._slug_norm.get(slug) == norm:
+                del self._slug_norm[slug]
+        ids = sorted(self._by_slug.get(base, []))
+        firsts = {}
+        for pid in ids:
+            firsts.setdefault(self.products[pid].norm, pid)
+        if not firsts:
+            return
+        shadowed = self._slug_norm.get(base)  # başka tabanın ekli slug'ı bu tabana denk geldiyse
+        self._base_norms[base] = list(firsts)
+        for i, (norm, pid) in enumerate(firsts.items()):
+            slug = base if i == 0 else f"{base}-{pid}"
+            if i and (slug in self._by_slug or slug in self._slug_norm):
+                slug = f"{base}--{pid}"  # slugify çift tire üretmez, taban slug'la çakışmaz
+            self._norm_slug[norm] = slug
+            self._slug_norm[slug] = norm
+        if shadowed is not None and shadowed not in firsts:
+            self._reslug(slugify(shadowed))
+
+    def _drop_product(self, pid: int):
+        p = self.products.pop(pid, None)
+        if p is None:
+            return
+        for idx, k in ((self._by_norm, p.norm), (self._by_name, p.name), (self._by_slug, p.slug)):
+            ids = [i for i in idx.get(k, []) if i != pid]
+            if ids:
+                idx[k] = ids
+            else:
+                idx.pop(k, None)
+        self._reslug(p.slug)
+
+    def _add_store(self, st: CatalogStore):
+        self.stores[st.id] = st
+        self._store_by_key.setdefault(st.key, []).append(st.id)
+
+    def _drop_store(self, sid: int):
+        st = self.stores.pop(sid, None)
+        if st is None:
+            return
+        ids = [i for i in self._store_by_key.get(st.key, []) if i != sid]
+        if ids:
+            self._store_by_key[st.key] = ids
+        else:
+            self._store_by_key.pop(st.key, None)
+
+    # ---- artımlı yenileme (yazmalardan sonra çağrılır) ----
+    def refresh_product(self, pid: Optional[int]):
+        if not pid or not self.loaded_at:
+            return
+        with get_session() as s:
+            r = s.execute(select(*_CATALOG_PRODUCT_COLS).where(Product.id == pid)).first()
+        with self._lock:
+            self._drop_product(pid)
+            if r:
+                self._add_product(CatalogProduct(*r))
+                p = self.products[pid]
+                for ids in (self._by_norm[p.norm], self._by_name[p.name], self._by_slug[p.slug]):
+                    ids.sort()
+
+    def refresh_store(self, sid: Optional[int]):
+        if not sid or not self.loaded_at:
+            return
+        with get_session() as s:
+            r = s.execute(select(*_CATALOG_STORE_COLS).where(Store.id == sid)).first()
+        with self._lock:
+            self._drop_store(sid)
+            if r:
+                st = CatalogStore(*r)
+                self._add_store(st)
+                self._store_by_key[st.key].sort()
+
+    # ---- okuma ----
+    def product(self, pid: int) -> Optional[CatalogProduct]:
+        self._ensure()
+        return self.products.get(pid)
+
+    def products_by_norm(self, norm: str) -> List[CatalogProduct]:
+        """turkish_lower(ad) eşleşen ürünler (id sırasıyla)."""
+        self._ensure()
+        return [self.products[i] for i in self._by_norm.get(norm, [])]
+
+    def product_slug(self, name: str) -> str:
+        """Ürün sayfası URL slug'ı (katalogda yoksa düz slugify)."""
+        self._ensure()
+        return self._norm_slug.get(turkish_lower(name or "")) or slugify(name)
+
+    def product_by_slug(self, slug: str) -> Optional[CatalogProduct]:
+        """Benzersiz URL slug'ının isim grubundaki ilk ürün (aktifler önce)."""
+        self._ensure()
+        prods = [self.products[i] for i in self._by_norm.get(self._slug_norm.get(slug), [])]
+        prods.sort(key=lambda p: not p.is_active)
+        return prods[0] if prods else None
+
+    def product_by_name(self, name: str) -> Optional[CatalogProduct]:
+        """Birebir isim eşleşmesi (Product.name == name)."""
+        self._ensure()
+        ids = self._by_name.get(name)
+        return self.products[ids[0]] if ids else None
+
+    def featured_products(self, category: Optional[str] = None) -> List[CatalogProduct]:
+        self._ensure()
+        return [
+            p for p in self.products.values()
+            if p.featured and (category is None or p.category == category)
+        ]
+
+    def active_products(self) -> List[CatalogProduct]:
+        """Aktif ürünler, kategori + isim sıralı."""
+        self._ensure()
+        return sorted(
+            (p for p in self.products.values() if p.is_active),
+            key=lambda p: (p.category is not None, p.category or "", p.name),
+        )
+
+    def find_store(self, name: str, city: Optional[str], district: Optional[str],
+                   no_neighborhood: bool = False) -> Optional[CatalogStore]:
+        self._ensure()
+        for sid in self._store_by_key.get(store_key(name, city, district), []):
+            st = self.stores[sid]
+            if no_neighborhood and st.neighborhood is not None:
+                continue
+            return st
+        return None
+
+    def stores_for_business(self, district: Optional[str], business_id: int) -> List[CatalogStore]:
+        """İşletmenin ilçesindeki mağazalar + kendi mağazası, isme göre sıralı."""
+        self._ensure()
+        return sorted(
+            (st for st in self.stores.values() if st.district == district or st.business_id == business_id),
+            key=lambda st: st.name or "",
+        )
+
+catalog = Catalog()
+
+def load_catalog():
+    t0 = time.perf_counter()
+    try:
+        catalog.load()
+    except Exception as e:
+        print("WARN load_catalog:", repr(e))
+    try:
+        district_versions.load()
+    except Exception as e:
+        print("WARN district_versions:", repr(e))
+    warm_start.live_load_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+# =============== Warm-start snapshot ===============
+# Render uykudan uyandığında ilk ziyaretçi katalog yüklemesini ve vitrin
+# hesabını beklemesin diye katalog satırları ve önbellekteki vitrin parçaları
+# WARM_SNAPSHOT_PATH'e yazılır (WARM_SNAPSHOT_INTERVAL sn'de bir, değiştiyse;
+# kapanışta da). Açılışta dosya mmap'lenir: katalog ondan kurulur, vitrin
+# parçaları bayat girdi olarak önbelleğe konur (ilk istek beklemeden sunulur,
+# taze hâli arka planda üretilir), canlı yükleme ayrı thread'de yapılır.
+# Dosya: MAGIC + 8 bayt index uzunluğu + JSON index + art arda gövdeler.
+# Boş bırakılırsa kapalı. Açılış ve ilk yanıt süreleri /admin/perf'te.
+WARM_SNAPSHOT_PATH = os.environ.get("WARM_SNAPSHOT_PATH", "")
+WARM_SNAPSHOT_INTERVAL = float(os.environ.get("WARM_SNAPSHOT_INTERVAL", "60"))
+WARM_SNAPSHOT_MAGIC = b"PZWARM1\n"
+
+class WarmStart:
+    def __init__(self, path: str):
+        self.path = Path(path) if path else None
+        self._mm = None
+        self._sig = None
+        self.restored = 0
+        self.restore_ms: Optional[float] = None
+        self.snapshot_at: Optional[float] = None
+        self.live_load_ms: Optional[float] = None
+        self.ready_ms: Optional[float] = None
+        self.first_response_ms: Optional[float] = None
+        self.first_response_path: Optional[str] = None
+        self.last_write: Optional[dict] = None
+
+    def restore(self) -> bool:
+        """Snapshot varsa katalog ve vitrin parçalarını ondan kurar."""
+        if self.path is None or not self.path.exists():
+            return False
+        t0 = time.perf_counter()
+        try:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            head = len(WARM_SNAPSHOT_MAGIC)
+            if mm[:head] != WARM_SNAPSHOT_MAGIC:
+                print("WARN warm snapshot: tanınmayan dosya", self.path)
+                return False
+            n = int.from_bytes(mm[head:head + 8], "little")
+            index = json.loads(mm[head + 8:head + 8 + n])
+            data = memoryview(mm)[head + 8 + n:]
+            catalog.load_rows(index["catalog"]["products"], index["catalog"]["stores"])
+            for key, title, off, length, stored_at in index["fragments"]:
+                # gövde mmap'ten kopyalanmadan sunulur
+                fragment_cache.put_stale(tuple(key), (title, data[off:off + length]),
+                                         length + 2 * len(title) + 200, stored_at)
+        except Exception as e:
+            print("WARN warm snapshot restore:", repr(e))
+            return False
+        self._mm = mm
+        self.restored = len(index["fragments"])
+        self.snapshot_at = index["written_at"]
+        self.restore_ms = round((time.perf_counter() - t0) * 1000, 1)
+        return True
+
+    def write(self, force: bool = False) -> bool:
+        """Katalog + vitrin parçalarını yazar; son yazımdan beri değişiklik yoksa atlar."""
+        if self.path is None or not catalog.loaded_at:
+            return False
+        frags = [(k, v, st) for k, v, st in fragment_cache.entries(lambda k: k[0] == "vitrin") if len(v) == 2]
+        sig = hash((catalog.loaded_at, frozenset((k, st) for k, _v, st in frags)))
+        if sig == self._sig and not force:
+            return False
+        t0 = time.perf_counter()
+        prods, stores = catalog.rows()
+        index, off = [], 0
+        for key, (title, body), stored_at in frags:
+            index.append([list(key), title, off, len(body), stored_at])
+            off += len(body)
+        raw = json.dumps({"written_at": time.time(), "catalog": {"products": prods, "stores": stores},
+                          "fragments": index}, ensure_ascii=False).encode("utf-8")
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(WARM_SNAPSHOT_MAGIC)
+                f.write(len(raw).to_bytes(8, "little"))
+                f.write(raw)
+                for _key, (_title, body), _st in frags:
+                    f.write(body)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print("WARN warm snapshot write:", repr(e))
+            return False
+        self._sig = sig
+        self.last_write = {"at": datetime.utcnow().isoformat(timespec="seconds"), "fragments": len(frags),
+                           "bytes": len(WARM_SNAPSHOT_MAGIC) + 8 + len(raw) + off,
+                           "ms": round((time.perf_counter() - t0) * 1000, 1)}
+        return True
+
+    def run(self):
+        while True:
+            time.sleep(WARM_SNAPSHOT_INTERVAL)
+            self.write()
+
+    def first_response(self, path: str):
+        if self.first_response_ms is None:
+            self.first_response_ms = round((time.perf_counter() - PROCESS_T0) * 1000, 1)
+            self.first_response_path = path
+
+    def snapshot(self) -> dict:
+        return {
+            "path": str(self.path) if self.path else None,
+            "restored_fragments": self.restored,
+            "restore_ms": self.restore_ms,
+            "snapshot_age_s": round(time.time() - self.snapshot_at) if self.snapshot_at else None,
+            "live_load_ms": self.live_load_ms,
+            "ready_ms": self.ready_ms,
+            "first_response_ms": self.first_response_ms,
+            "first_response_path": self.first_response_path,
+            "last_write": self.last_write,
+        }
+
+warm_start = WarmStart(WARM_SNAPSHOT_PATH)
+
+@app.on_event("startup")
+def start_warm():
+    if warm_start.restore():
+        threading.Thread(target=load_catalog, daemon=True).start()
+    else:
+        load_catalog()
+    if warm_start.path is not None:
+        threading.Thread(target=warm_start.run, daemon=True).start()
+    warm_start.ready_ms = round((time.perf_counter() - PROCESS_T0) * 1000, 1)
+
+@app.on_event("shutdown")
+def write_warm_snapshot():
+    warm_start.write()
+
+# =============== Önbellek ısıtma ===============
+# Açılışta ve toplu geçersizlemelerden sonra (ürün değişikliği ya da tek
+# commit'te CACHE_WARM_BULK_DISTRICTS+ ilçe) ilçe başına vitrin kategorileri,
+# /magazalar ve Visit.path sayımlarına göre en çok görüntülenen ilçe ürün
+# sayfaları önceden üretilir. Üretim single-flight üzerinden, en fazla
+# CACHE_WARM_CONCURRENCY paralel build ile yapılır; canlı istek aynı anahtarı
+# isterse aynı build'i paylaşır, zaten taze olanlar atlanır. İlerleme ve süre
+# /admin/perf'te.
+CACHE_WARM_ON_STARTUP = os.environ.get("CACHE_WARM_ON_STARTUP", "1") == "1"
+CACHE_WARM_CONCURRENCY = max(1, int(os.environ.get("CACHE_WARM_CONCURRENCY", "2")))
+CACHE_WARM_TOP_PRODUCTS = int(os.environ.get("CACHE_WARM_TOP_PRODUCTS", "20"))
+CACHE_WARM_BULK_DISTRICTS = int(os.environ.get("CACHE_WARM_BULK_DISTRICTS", "3"))
+CACHE_WARM_DEBOUNCE = 2.0  # toplu yazmalar bitsin diye bekleme (sn)
+
+def top_product_pages(locs: List[Tuple[str, str]]) -> List[Tuple[str, str, str]]:
+    """Son 30 günde en çok görüntülenen ilçe ürün sayfaları: [(şehir, ilçe, ürün adı)].
+    /urun?name= ziyaretleri path'te ürün taşımadığından /<il>/<ilçe>/urun/<slug>
+    ziyaretleri sayılır."""
+    if CACHE_WARM_TOP_PRODUCTS <= 0:
+        return []
+    wanted = set(locs)
+    with get_session() as s:
+        rows = s.execute(
+            select(Visit.path, func.count())
+            .where(Visit.path.like("%/urun/%"), Visit.ts >= datetime.utcnow() - timedelta(days=30))
+            .group_by(Visit.path)
+            .order_by(func.count().desc())
+            .limit(CACHE_WARM_TOP_PRODUCTS * 4)
+        ).all()
+    out = []
+    for path, _n in rows:
+        loc = district_from_path(path)
+        prod = catalog.product_by_slug(path.rsplit("/", 1)[1])
+        if loc in wanted and prod is not None:
+            out.append((loc[0], loc[1], prod.name))
+            if len(out) >= CACHE_WARM_TOP_PRODUCTS:
+                break
+    return out
+
+def warm_jobs(districts: Optional[set]) -> List[Tuple[tuple, object]]:
+    """Isıtılacak (parça anahtarı, build) listesi; districts None ise tüm ilçeler."""
+    locs = [loc for loc in DISTRICT_BY_SLUG.values() if districts is None or loc in districts]
+    jobs = []
+    for city, dist in locs:
+        for cat in VITRIN_CATS:
+            jobs.append((("vitrin", city, dist, "", cat, "/"), partial(render_vitrin, city, dist, None, cat)))
+        jobs.append((("magazalar", city, dist), partial(render_brands_home, city, dist)))
+    for city, dist, name in top_product_pages(locs):
+        jobs.append((("urun", city, dist, "", name, False, "/"),
+                     partial(render_product, name, city, dist, None, False)))
+        jobs.append(public_fragment("urun", city, dist, name))
+    return jobs
+
+class CacheWarmer:
+    def __init__(self):
+        self.loop = None
+        self._task = None
+        self._pending: Optional[set] = set()  # None = tüm ilçeler
+        self._reason = ""
+        self.running = False
+        self.reason = None
+        self.done = self.built = self.total = self.errors = 0
+        self.runs = 0
+        self.last: Optional[dict] = None
+
+    def schedule(self, districts: Optional[set], reason: str):
+        """Herhangi bir thread'den çağrılabilir; ilçeleri sonraki tura ekler.
+        Boş context: çağıran isteğin _request_trace'i ısıtma sorgularına taşınmasın."""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._enqueue, districts, reason, context=Context())
+
+    def _enqueue(self, districts: Optional[set], reason: str):
+        if districts is None or self._pending is None:
+            self._pending = None
+        else:
+            self._pending |= districts
+        self._reason = reason
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(0 if reason == "startup" else CACHE_WARM_DEBOUNCE))
+
+    async def _run(self, delay: float):
+        await asyncio.sleep(delay)
+        while self._pending is None or self._pending:
+            districts, self._pending = self._pending, set()
+            await self.warm(districts, self._reason)
+
+    async def warm(self, districts: Optional[set], reason: str):
+        t0 = time.perf_counter()
+        try:
+            jobs = await run_in_threadpool(warm_jobs, districts)
+        except Exception as e:
+            print("WARN cache warm:", repr(e))
+            return
+        self.running, self.reason = True, reason
+        self.done = self.built = self.errors = 0
+        self.total = len(jobs)
+        sem = asyncio.Semaphore(CACHE_WARM_CONCURRENCY)
+
+        async def one(key: tuple, build):
+            async with sem:
+                if not fragment_cache.contains(key):
+                    try:
+                        await single_flight.do(key, _tracked_build, key, build, False)
+                        self.built += 1
+                    except Exception as e:
+                        if not self.errors:
+                            print("WARN cache warm:", key, repr(e))
+                        self.errors += 1
+                self.done += 1
+
+        await asyncio.gather(*(one(key, build) for key, build in jobs))
+        ms = round((time.perf_counter() - t0) * 1000, 1)
+        self.running = False
+        self.runs += 1
+        self.last = {"reason": reason, "at": datetime.utcnow().isoformat(timespec="seconds"),
+                     "districts": len(districts) if districts is not None else len(DISTRICT_BY_SLUG),
+                     "pages": self.total, "built": self.built, "errors": self.errors, "ms": ms}
+        print(f"cache warm ({reason}): {self.built}/{self.total} sayfa üretildi, {self.errors} hata, {ms} ms")
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self.running,
+            "progress": {"reason": self.reason, "done": self.done, "total": self.total,
+                         "built": self.built, "errors": self.errors} if self.running else None,
+            "runs": self.runs,
+            "last": self.last,
+        }
+
+cache_warmer = CacheWarmer()
+
+def _rewarm_after_bulk(kinds: set, districts: Optional[set]):
+    if districts is None or len(districts) >= CACHE_WARM_BULK_DISTRICTS:
+        cache_warmer.schedule(districts, "toplu yazma")
+
+DATA_CHANGE_HOOKS.append(_rewarm_after_bulk)
+
+@app.on_event("startup")
+async def start_cache_warmer():
+    if FRAGMENT_CACHE_TTL <= 0:
+        return
+    cache_warmer.loop = asyncio.get_running_loop()
+    if CACHE_WARM_ON_STARTUP:
+        cache_warmer.schedule(None, "startup")
+
+@app.on_event("shutdown")
+def stop_cache_warmer():
+    cache_warmer.loop = None
+
+# ================== Bellek ==================
+# MEMORY_SAMPLE_INTERVAL saniyede bir RSS örneklenir (son MEMORY_HISTORY nokta
+# /admin/memory'de). Ölçülen, paylaşılan/dosya destekli sayfalar (warm snapshot
+# mmap'i, kütüphaneler) düşülmüş RSS'tir. Bu değer MEMORY_BUDGET_MB'yi aşarsa
+# OOM killer'dan önce sayfa ve parça önbellekleri LRU sırasıyla yarıya indirilir.
+# Serbest bırakılan bellek allocator'da kalabildiği için RSS bütçenin altına hiç
+# dönmeyebilir: önbelleklerin toplamı MEMORY_TRIM_FLOOR_MB'ye indiğinde ya da bir
+# önceki kırpmadan sonra RSS düşmediyse (ve önbellekler yeniden büyümediyse)
+# kırpma durur; bayat kopya yedeği için gereken girdiler korunur. tracemalloc
+# isteğe bağlı açılır; başlangıç snapshot'ına göre en çok büyüyen satırlar gösterilir.
+MEMORY_BUDGET_MB = int(os.environ.get("MEMORY_BUDGET_MB", "0"))
+MEMORY_TRIM_FLOOR_MB = float(os.environ.get("MEMORY_TRIM_FLOOR_MB", "4"))
+MEMORY_SAMPLE_INTERVAL = float(os.environ.get("MEMORY_SAMPLE_INTERVAL", "30"))
+MEMORY_HISTORY = int(os.environ.get("MEMORY_HISTORY", "240"))
+TRACEMALLOC_FRAMES = int(os.environ.get("TRACEMALLOC_FRAMES", "1"))
+
+def rss_bytes() -> Optional[int]:
+    """Anlık RSS eksi paylaşılan/dosya destekli sayfalar (Linux /proc); okunamazsa None."""
+    try:
+        with open("/proc/self/statm") as f:
+            fields = f.read().split()
+        return (int(fields[1]) - int(fields[2])) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def deep_size(obj, limit: int = 2_000_000) -> int:
+    """sys.getsizeof ile yaklaşık özyinelemeli boyut; paylaşılan nesneler bir kez
+    sayılır, limit nesneden sonra durur."""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < limit:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, type):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif hasattr(o, "__dict__"):
+            stack.append(o.__dict__)
+        elif hasattr(o, "__slots__"):
+            stack.extend(getattr(o, n) for c in type(o).__mro__
+                         for n in getattr(c, "__slots__", ()) if hasattr(o, n))
+    return total
+
+def cache_sizes() -> List[dict]:
+    """Uygulama içi önbellek/halka başına girdi sayısı ve tahmini bayt."""
+    def ttl(name, cache: TTLCache):
+        with cache._lock:
+            values = list(cache._data.items())
+        return {"name": name, "entries": len(values), "bytes": deep_size(values),
+                "accounted": cache.size, "max_bytes": cache.max_bytes}
+
+    with catalog._lock:
+        cat = dict(catalog.__dict__)
+    out = [
+        ttl("page_cache", page_cache),
+        ttl("fragment_cache", fragment_cache),
+        {"name": "catalog", "entries": len(cat["products"]) + len(cat["stores"]), "bytes": deep_size(cat)},
+        {"name": "slow_queries", "entries": len(slow_queries.ring),
+         "bytes": deep_size((list(slow_queries.ring), dict(slow_queries.plans)))},
+        {"name": "n_plus_one_log", "entries": len(n_plus_one_log), "bytes": deep_size(list(n_plus_one_log))},
+        {"name": "route_labels", "entries": len(_ROUTE_LABELS), "bytes": deep_size(dict(_ROUTE_LABELS))},
+        {"name": "metrics", "entries": sum(len(sh) for sh in list(metrics._shards)),
+         "bytes": deep_size([dict(sh) for sh in list(metrics._shards)])},
+    ]
+    if warm_start._mm is not None:
+        out.append({"name": "warm_snapshot (mmap)", "entries": warm_start.restored, "bytes": len(warm_start._mm)})
+    return out
+
+class MemoryMonitor:
+    def __init__(self):
+        self.history: "deque[tuple]" = deque(maxlen=MEMORY_HISTORY)  # (epoch, rss)
+        self.trims = 0
+        self.last_trim: Optional[dict] = None
+        self._after_trim: Optional[tuple] = None  # (rss, önbellek baytı) son kırpmadan sonra
+        self._baseline = None
+        self.baseline_at: Optional[float] = None
+
+    def sample(self):
+        rss = rss_bytes()
+        if rss is None:
+            return
+        self.history.append((time.time(), rss))
+        budget = MEMORY_BUDGET_MB
+        if budget <= 0 or rss <= budget * 1024 * 1024:
+            self._after_trim = None
+            return
+        cached = page_cache.size + fragment_cache.size
+        if cached <= MEMORY_TRIM_FLOOR_MB * 1024 * 1024:
+            return
+        if self._after_trim is not None:
+            last_rss, last_cached = self._after_trim
+            if rss >= last_rss and cached <= last_cached:
+                return  # kırpma RSS'i düşürmüyor; kalan girdiler bayat kopya yedeği
+        self.trim(rss, budget)
+
+    def trim(self, rss: int, budget: int):
+        evicted = freed = 0
+        floor = int(MEMORY_TRIM_FLOOR_MB * 1024 * 1024) // 2
+        for cache in (page_cache, fragment_cache):
+            before = cache.size
+            evicted += cache.shrink(max(cache.size // 2, floor))
+            freed += before - cache.size
+        gc.collect()
+        self._after_trim = (rss, page_cache.size + fragment_cache.size)
+        self.trims += 1
+        self.last_trim = {"at": datetime.utcnow().isoformat(timespec="seconds"), "rss": rss,
+                          "evicted": evicted, "freed_bytes": freed}
+        print(f"WARN bellek bütçesi aşıldı: RSS {rss >> 20} MB > {budget} MB, "
+              f"{evicted} önbellek girdisi atıldı ({freed >> 10} KB)")
+
+    def run(self):
+        while True:
+            self.sample()
+            time.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    # ---- tracemalloc ----
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+
+    def trace_start(self):
+        """tracemalloc'u açar (açıksa yalnızca başlangıç snapshot'ını yeniler)."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._baseline = self._snapshot()
+        self.baseline_at = time.time()
+
+    def trace_stop(self):
+        tracemalloc.stop()
+        self._baseline = self.baseline_at = None
+
+    def trace_report(self, limit: int = 25) -> Optional[dict]:
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            return None
+        snap = self._snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "traced": current, "peak": peak,
+            "top": [(str(st.traceback), st.size, st.count) for st in snap.statistics("lineno")[:limit]],
+            "diff": [(str(st.traceback), st.size_diff, st.count_diff, st.size)
+                     for st in snap.compare_to(self._baseline, "lineno")[:limit]],
+        }
+
+    def snapshot(self) -> dict:
+        return {"rss": self.history[-1][1] if self.history else rss_bytes(),
+                "peak_rss": max((r for _, r in self.history), default=None),
+                "budget_mb": MEMORY_BUDGET_MB or None, "trims": self.trims, "last_trim": self.last_trim,
+                "tracemalloc": tracemalloc.is_tracing()}
+
+memory_monitor = MemoryMonitor()
+
+@app.on_event("startup")
+def start_memory_monitor():
+    if MEMORY_SAMPLE_INTERVAL > 0:
+        threading.Thread(target=memory_monitor.run, daemon=True).start()
+
+TAILWIND_CDN = "https://cdn.tailwindcss.com"
+
+def _build_header_right() -> str:
+    # Seçili il/ilçe tarayıcıda çerezden okunur; sunucu tarafı HTML herkes için aynı
+    districts = [d["name"] for d in LOC_JSON["provinces"][0]["districts"]]
+    dist_opts = "".join(f"<option value='{d}'>{d}</option>" for d in districts)
+
+    js = f'<script src="{asset_url("js/header-loc.js")}" defer></script>'
 
     return f"""
       <div class="flex items-center gap-2 mr-2">
@@ -671,27 +3124,19 @@ def header_right_html(request: Request) -> str:
       {js}
     """
 
-def layout(req: Request, body: str, title: str = "Pazarmetre") -> HTMLResponse:
-    right = header_right_html(req)
-    
-    # Get visitor count from database - only show for admin
-    visitor_count_html = ""
-    if is_admin(req):
-        try:
-            with get_session() as s:
-                visitor_count = s.exec(select(func.count()).select_from(Visit)).one() or 0
-            visitor_count_html = f"""
-      <span class="text-gray-500 block mt-2">
-        👥 Toplam Ziyaretçi: <span class="font-semibold text-emerald-600">{visitor_count:,}</span>
-      </span>
-            """
-        except Exception as e:
-            print(f"WARN: Could not fetch visitor count: {e}")
-    
-    html = f"""<!doctype html>
+_HEADER_RIGHT_HTML = _build_header_right()
+
+def header_right_html(request: Request) -> str:
+    return _HEADER_RIGHT_HTML
+
+# Sabit sayfa kabuğu: açılışta bir kez üretilir, _SLOT noktalarından bölünür.
+# Sırasıyla: başlık, ek <head> içeriği, gövde, yıl, kişisel parça (admin
+# ziyaretçi sayısı).
+_SLOT = "\x00"
+_SHELL_TEMPLATE = f"""<!doctype html>
 <html lang="tr"><head>
   <meta charset="utf-8"><meta name="viewport" content="width=device-width, initial-scale=1">
-  <title>{title}</title>
+  <title>{_SLOT}</title>
   <!-- Google tag (gtag.js) -->
   <script async src="https://www.googletagmanager.com/gtag/js?id=G-M2CV5PJV2B"></script>
   <script>
@@ -709,23 +3154,23 @@ def layout(req: Request, body: str, title: str = "Pazarmetre") -> HTMLResponse:
     .card:hover{{transform:translateY(-2px); box-shadow:0 10px 20px rgba(0,0,0,.10)}}
     .chip{{padding:.2rem .55rem; border-radius:.5rem; font-weight:700; font-size:.85rem}}
   </style>
-</head>
+{_SLOT}</head>
 <body class="bg-gradient-to-b from-brand-50 to-white text-gray-900">
   <div class="max-w-6xl mx-auto p-4">
     <div class="flex items-center justify-between mb-5 flex-wrap gap-2">
       <a href="/" class="text-2xl font-extrabold tracking-tight bg-clip-text text-transparent bg-gradient-to-r from-emerald-600 to-indigo-600">Pazarmetre</a>
-      <div class="flex items-center gap-2">{right}</div>
+      <div class="flex items-center gap-2">{_HEADER_RIGHT_HTML}</div>
     </div>
-    {body}
+    {_SLOT}
     <footer class="mt-10 text-xs text-gray-400 text-center">
       <a href="/iletisim" class="text-indigo-600 hover:underline mr-3">İletişim</a>
       <a href="/hukuk" class="text-indigo-600 hover:underline mr-3">Hukuki Bilgilendirme</a>
       <a href="/cerez-politikasi" class="text-indigo-600 hover:underline mr-3">Çerez Politikası</a>
       <a href="/kvkk-aydinlatma" class="text-indigo-600 hover:underline mr-3">KVKK Aydınlatma</a>
       <span class="text-gray-400 block mt-2">
-        © {datetime.utcnow().year} Pazarmetre · Fiyatlar bilgilendirme amaçlıdır.
+        © {_SLOT} Pazarmetre · Fiyatlar bilgilendirme amaçlıdır.
       </span>
-      {visitor_count_html}
+      {_SLOT}
     </footer>
 
     <!-- Çerez Bannerı -->
@@ -771,6 +3216,41 @@ def layout(req: Request, body: str, title: str = "Pazarmetre") -> HTMLResponse:
 
   </div>
 </body></html>"""
+_SHELL_PARTS = _SHELL_TEMPLATE.split(_SLOT)
+assert len(_SHELL_PARTS) == 6
+# Yanıt bayt olarak birleştirilir; sabit parçalar bir kez encode edilir
+_SHELL_BYTES = tuple(part.encode("utf-8") for part in _SHELL_PARTS)
+
+def personal_fragment_html(req: Request) -> str:
+    """Kullanıcıya özel küçük parça; şu an sadece admin için ziyaretçi sayısı."""
+    if not is_admin(req):
+        return ""
+    try:
+        with get_session() as s:
+            visitor_count = s.exec(select(func.count()).select_from(Visit)).one() or 0
+        return f"""
+      <span class="text-gray-500 block mt-2">
+        👥 Toplam Ziyaretçi: <span class="font-semibold text-emerald-600">{visitor_count:,}</span>
+      </span>
+            """
+    except Exception as e:
+        print(f"WARN: Could not fetch visitor count: {e}")
+        return ""
+
+def layout(req: Request, body, title: str = "Pazarmetre", tail: bytes = b"", head: str = "",
+           personal: bool = True) -> HTMLResponse:
+    """body: str ya da önceden encode edilmiş bytes. tail: gövdeden hemen sonra
+    eklenen sabit bayt parçası (ör. ürün sayfasının admin scripti).
+    head: </head> öncesine eklenecek link/script etiketleri.
+    personal=False paylaşılan önbelleğe girecek sayfalarda kişisel parçayı atlar."""
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    p = _SHELL_BYTES
+    html = b"".join((
+        p[0], title.encode("utf-8"), p[1], head.encode("utf-8"), p[2], body, tail, p[3],
+        str(datetime.utcnow().year).encode(), p[4],
+        personal_fragment_html(req).encode("utf-8") if personal else b"", p[5],
+    ))
     return HTMLResponse(html)
 
 # =============== Lokasyon ===============
@@ -908,7 +3388,8 @@ async def location_set(
 
 @app.get("/setloc")
 async def setloc(city: str, district: str, nb: str = "", next: str = "/"):
-    resp = RedirectResponse(next or "/", status_code=302)
+    # Çerezsiz ilçe sayfasından gelindiyse aynı sayfanın yeni ilçedeki karşılığına git
+    resp = RedirectResponse(rebase_district_path(next or "/", city, district), status_code=302)
     max_age = 60 * 60 * 24 * 90
     resp.set_cookie("city", quote(city, safe=""), max_age=max_age, samesite="lax")
     resp.set_cookie("district", quote(district, safe=""), max_age=max_age, samesite="lax")
@@ -938,6 +3419,16 @@ async def dashboard(request: Request):
     if selected_cat not in ("hepsi", "et", "tavuk", "diger"):
         selected_cat = "hepsi"
 
+    (title, body), stale = await shared_fragment(
+        ("vitrin", city, dist, nb or "", selected_cat, "/"),
+        lambda: render_vitrin(city, dist, nb, selected_cat),
+    )
+    return mark_stale(layout(request, body, title), stale)
+
+def render_vitrin(city: str, dist: str, nb: Optional[str], selected_cat: str,
+                  base: str = "/") -> Tuple[str, str]:
+    """Vitrin gövdesi; (başlık, html) döner. base: sekme ve ürün linklerinin
+    kökü ("/" çerezli, "/sakarya/hendek/" çerezsiz ilçe sayfası)."""
     # Sekme butonları
     tabs = []
     for slug, label in [
@@ -951,7 +3442,7 @@ async def dashboard(request: Request):
             if selected_cat == slug
             else "bg-white text-gray-700 border-gray-200"
         )
-        href = "/" if slug == "hepsi" else f"/?cat={slug}"
+        href = base if slug == "hepsi" else f"{base}?cat={slug}"
         tabs.append(
             f'<a href="{href}" class="px-3 py-1 rounded-full border text-sm {active}">{label}</a>'
         )
@@ -966,11 +3457,9 @@ async def dashboard(request: Request):
     }
 
     with get_session() as s:
-        q = select(Product).where(Product.featured == True)
-        if selected_cat in ("et", "tavuk", "diger"):
-            q = q.where(Product.category == selected_cat)
-
-        prods = s.exec(q).all()
+        prods = catalog.featured_products(
+            selected_cat if selected_cat in ("et", "tavuk", "diger") else None
+        )
         if not prods:
             body = """
             <div class="bg-white card p-6 text-gray-600 text-center">
@@ -978,7 +3467,7 @@ async def dashboard(request: Request):
                 <br>Yeni ürünler çok yakında burada olacak.
             </div>
             """
-            return layout(request, body, "Pazarmetre | Vitrin")
+            return "Pazarmetre | Vitrin", body
 
         # Türkçe case-insensitive ürün gruplama
         # Aynı isme sahip ürünleri (Dana Kıyma, dana kıyma, DANA KIYMA) tek ürün olarak ele al
@@ -996,63 +3485,32 @@ async def dashboard(request: Request):
                 product_groups[norm_name] = []
             product_groups[norm_name].append(p)
         
+        # İlçedeki tüm vitrin tekliflerini TEK sorguda çek,
+        # ürün grubu başına en iyi teklifi tek geçişte hesapla
+        group_ids = [p.id for grp in product_groups.values() for p in grp]
+        rows = fetch_offer_store_rows(
+            s,
+            Offer.product_id.in_(group_ids),
+            Offer.approved == True,
+            Store.city == city,
+            Store.district == dist,
+            order_by=(Offer.product_id, Offer.price.asc(), Offer.created_at.desc()),
+            with_product=True,
+        ) if group_ids else []
+        best_by_group = district_best_offers(rows, nb)
+
         # Her ürün grubu için tek bir kart oluştur
         for norm_name, group_prods in product_groups.items():
             # Grubun ilk ürününü referans olarak kullan (display için)
             ref_prod = group_prods[0]
             cat_key = (ref_prod.category or "").lower()
-            
-            # Gruptaki TÜM ürünlerin tekliflerini topla
-            all_rows = []
-            for p in group_prods:
-                q_off = (
-                    select(Offer, Store)
-                    .join(Store, Offer.store_id == Store.id)
-                    .where(
-                        Offer.product_id == p.id,
-                        Offer.approved == True,
-                        Store.city == city,
-                        Store.district == dist,
-                    )
-                    .order_by(Offer.price.asc(), Offer.created_at.desc())
-                )
-                rows = s.exec(q_off).all()
-                all_rows.extend(rows)
 
-            # Bu lokasyonda hiç teklif yoksa ürünü vitrine koyma
-            if not all_rows:
+            # Bu lokasyonda geçerli teklif yoksa ürünü vitrine koyma
+            best = best_by_group.get(norm_name)
+            if not best:
                 continue
 
-            # Mahalle filtresi (varsa)
-            if nb:
-                rows_nb = [
-                    (o, st) for (o, st) in all_rows
-                    if (st.neighborhood or "").lower() == nb.lower()
-                ]
-                if rows_nb:
-                    all_rows = rows_nb
-
-            # Marka bazında en yeni teklifi tut
-            all_rows = dedupe_by_brand_latest(all_rows)
-
-            # ✅ GERÇEK FİYAT FİLTRESİ (boş / 0 / saçma fiyatlar kart basmasın)
-            clean_rows = []
-            for o, st in all_rows:
-                try:
-                    price = float(o.price or 0)
-                    if price > 0:
-                        clean_rows.append((o, st))
-                except Exception:
-                    pass
-
-            all_rows = clean_rows
-            if not all_rows:
-                continue
-
-            # En ucuz fiyata göre sırala
-            all_rows = sorted(all_rows, key=lambda t: t[0].price)
-            
-            off, st = all_rows[0]
+            off, st = best
             best_price = off.price
 
             is_new = (datetime.utcnow() - off.created_at).total_seconds() < 86400
@@ -1074,7 +3532,7 @@ async def dashboard(request: Request):
             date_display = format_turkish_date_short(price_date)
 
             card_html = f"""
-              <a href="/urun?name={quote(display_name)}" class="bg-white card p-4 block hover:shadow-lg transition">
+              <a href="{product_href(base, display_name)}" class="bg-white card p-4 block hover:shadow-lg transition">
                 <div class="flex items-start justify-between gap-3">
                   <div class="flex-1 min-w-0">
                     <div class="font-semibold text-gray-900 mb-1">{new_dot}{display_name}</div>
@@ -1145,44 +3603,53 @@ async def dashboard(request: Request):
         </div>
         """
 
-    return layout(request, body, "Pazarmetre – Vitrin")
+    return "Pazarmetre – Vitrin", body
 # =============== Ürün Detay ===============
+# Admin düzenle/sil modal scripti static/js/product-admin.js'te; sadece
+# admin'e, gövdenin hemen arkasına eklenir.
+PRODUCT_ADMIN_SCRIPT = f'\n    <script src="{asset_url("js/product-admin.js")}" defer></script>\n    '.encode("utf-8")
+
 @app.get("/urun", response_class=HTMLResponse)
 async def product_detail(request: Request, name: str):
     # URL’den gelen ismi çözüp normalize edelim
     name = unquote(name).strip()
 
     city, dist, nb = get_loc(request)
+    is_adm = is_admin(request)
 
-    with get_session() as s:
-        # Türkçe karakter uyumluluğu için önce tüm ürünleri çekip Python'da filtrele
-        # SQLite'ın lower() fonksiyonu Türkçe karakterleri doğru işlemez (ş, ğ, ü, ö, ç, ı)
-        all_rows = s.exec(
-            select(Offer, Store, Product)
-            .join(Store, Offer.store_id == Store.id)
-            .join(Product, Offer.product_id == Product.id)
-            .where(
-                Offer.approved == True,
-                Store.city == city,
-                Store.district == dist,
-            )
-            .order_by(Offer.price.asc(), Offer.created_at.desc())
-        ).all()
-        
-        # Python'da Türkçe karaktere duyarlı case-insensitive karşılaştırma
-        name_normalized = turkish_lower(name)
-        rows = [
-            (o, st, p) for (o, st, p) in all_rows 
-            if turkish_lower(p.name) == name_normalized
-        ]
+    (title, body, tail), stale = await shared_fragment(
+        ("urun", city, dist, nb or "", name, is_adm, "/"),
+        lambda: render_product(name, city, dist, nb, is_adm),
+    )
+    return mark_stale(layout(request, body, title, tail=tail), stale)
+
+def render_product(name: str, city: Optional[str], dist: Optional[str], nb: Optional[str],
+                   is_adm: bool, base: str = "/") -> Tuple[str, str, bytes]:
+    """Ürün detay gövdesi; (başlık, html, layout tail) döner.
+    is_adm admin düzenleme araçlarını ekler; base vitrine dönüş linkidir."""
+    # SQLite'ın lower() fonksiyonu Türkçe karakterleri doğru işlemez (ş, ğ, ü, ö, ç, ı);
+    # eşleşen ürün id'lerini katalogdan Türkçe duyarlı normalize isimle bul
+    name_normalized = turkish_lower(name)
+    product_ids = [p.id for p in catalog.products_by_norm(name_normalized)]
+
+    rows = []
+    if product_ids:
+        with get_session() as s:
+            rows = [
+                (o, st, catalog.product(o.product_id))
+                for (o, st) in fetch_offer_store_rows(
+                    s,
+                    Offer.product_id.in_(product_ids),
+                    Offer.approved == True,
+                    Store.city == city,
+                    Store.district == dist,
+                    order_by=(Offer.price.asc(), Offer.created_at.desc()),
+                )
+            ]
 
     # Hiç satır yoksa: bu lokasyonda bu isimle ürün yok
     if not rows:
-        return layout(
-            request,
-            "<div class='bg-white card p-6'>Bu lokasyonda teklif yok.</div>",
-            name,
-        )
+        return name, "<div class='bg-white card p-6'>Bu lokasyonda teklif yok.</div>", b""
 
     # İlk satırdan Product’ı al
     prod = rows[0][2]
@@ -1205,14 +3672,9 @@ async def product_detail(request: Request, name: str):
     rows_os = dedupe_by_brand_latest(rows_os)
 
     if not rows_os:
-        return layout(
-            request,
-            "<div class='bg-white card p-6'>Bu ürün için geçerli fiyat bulunamadı.</div>",
-            prod.name,
-        )
+        return prod.name, "<div class='bg-white card p-6'>Bu ürün için geçerli fiyat bulunamadı.</div>", b""
 
     best_price = min(o.price for (o, _st) in rows_os)
-    is_adm = is_admin(request)
 
     # --- UYARI BANDI (kısa ve net) ---
     note_html = """
@@ -1273,216 +3735,12 @@ async def product_detail(request: Request, name: str):
             f"</tr>"
         )
 
-    extra_js = """
-        <script>
-        /* =======================
-        MODAL: SİL
-        ======================= */
-        function showDelModal(id, btn){
-        const old = document.getElementById("pm-del-modal");
-        if(old) old.remove();
-
-        const wrap = document.createElement("div");
-        wrap.id = "pm-del-modal";
-        wrap.className = "fixed inset-0 z-50 flex items-center justify-center bg-black/40 p-4";
-
-        wrap.innerHTML = `
-            <div class="w-full max-w-md rounded-2xl bg-white shadow-xl p-5">
-            <div class="text-lg font-semibold mb-2">Silme işlemi nasıl uygulansın?</div>
-            <div class="text-sm text-gray-600 mb-4">
-                <b>Bu ilçe</b> sadece seçili ilçedeki kaydı siler.<br/>
-                <b>Bütün ilçeler</b> aynı kaydı tüm ilçelerden kaldırır.
-            </div>
-
-            <div class="flex flex-col gap-2">
-                <button id="pm-del-local"
-                class="w-full rounded-xl px-4 py-2 bg-gray-900 text-white hover:bg-gray-800">
-                Bu ilçe
-                </button>
-
-                <button id="pm-del-all"
-                class="w-full rounded-xl px-4 py-2 bg-red-600 text-white hover:bg-red-700">
-                Bütün ilçeler
-                </button>
-
-                <button id="pm-del-cancel"
-                class="w-full rounded-xl px-4 py-2 bg-gray-100 text-gray-800 hover:bg-gray-200">
-                Vazgeç
-                </button>
-            </div>
-            </div>
-        `;
-
-        wrap.addEventListener("click", (e) => {
-            if(e.target === wrap) wrap.remove();
-        });
-
-        document.body.appendChild(wrap);
-
-        document.getElementById("pm-del-cancel").onclick = () => wrap.remove();
-
-        document.getElementById("pm-del-local").onclick = async () => {
-            wrap.remove();
-            await delOffer(id, btn, "local");
-        };
-
-        document.getElementById("pm-del-all").onclick = async () => {
-            const ok = confirm("Emin misin?\\nBu kayıt TÜM ilçelerde silinecek!");
-            if(!ok) return;
-            wrap.remove();
-            await delOffer(id, btn, "all");
-        };
-        }
-
-        async function delOffer(id, btn, scope){
-        const fd = new FormData();
-        fd.append("offer_id", id);
-        fd.append("scope", scope);
-
-        const r = await fetch("/admin/del", {
-            method: "POST",
-            body: fd,
-            credentials: "same-origin"
-        });
-
-        if(r.status === 401){
-            alert("Admin oturumu yok / süre dolmuş. Giriş ekranına yönlendiriyorum.");
-            location.href = "/admin/login";
-            return;
-        }
-
-        if(r.ok){
-            if(scope === "local"){
-            const tr = btn.closest("tr");
-            if(tr) tr.remove();
-            } else {
-            location.reload();
-            }
-        } else {
-            alert("Silinemedi");
-        }
-        }
-
-        /* =======================
-        MODAL: DÜZENLE (scope seçimi)
-        ======================= */
-        function showEditModal(payload){
-        // payload: {id, price, url, addr}
-        const old = document.getElementById("pm-edit-modal");
-        if(old) old.remove();
-
-        const wrap = document.createElement("div");
-        wrap.id = "pm-edit-modal";
-        wrap.className = "fixed inset-0 z-50 flex items-center justify-center bg-black/40 p-4";
-
-        wrap.innerHTML = `
-            <div class="w-full max-w-md rounded-2xl bg-white shadow-xl p-5">
-            <div class="text-lg font-semibold mb-2">Düzenleme nasıl uygulansın?</div>
-            <div class="text-sm text-gray-600 mb-4">
-                <b>Bu ilçe</b> sadece seçili ilçedeki kaydı günceller.<br/>
-                <b>Bütün ilçeler</b> aynı ürün + aynı market için tüm ilçeleri günceller.
-            </div>
-
-            <div class="flex flex-col gap-2">
-                <button id="pm-edit-local"
-                class="w-full rounded-xl px-4 py-2 bg-gray-900 text-white hover:bg-gray-800">
-                Bu ilçe
-                </button>
-
-                <button id="pm-edit-all"
-                class="w-full rounded-xl px-4 py-2 bg-indigo-600 text-white hover:bg-indigo-700">
-                Bütün ilçeler
-                </button>
-
-                <button id="pm-edit-cancel"
-                class="w-full rounded-xl px-4 py-2 bg-gray-100 text-gray-800 hover:bg-gray-200">
-                Vazgeç
-                </button>
-            </div>
-            </div>
-        `;
-
-        wrap.addEventListener("click", (e) => {
-            if(e.target === wrap) wrap.remove();
-        });
-
-        document.body.appendChild(wrap);
-
-        document.getElementById("pm-edit-cancel").onclick = () => wrap.remove();
-
-        document.getElementById("pm-edit-local").onclick = async () => {
-            wrap.remove();
-            await applyEdit(payload, "local");
-        };
-
-        document.getElementById("pm-edit-all").onclick = async () => {
-            const ok = confirm("Emin misin?\\nBu değişiklik TÜM ilçelere uygulanacak!");
-            if(!ok) return;
-            wrap.remove();
-            await applyEdit(payload, "all");
-        };
-        }
-
-        async function applyEdit(payload, scope){
-        const fd = new FormData();
-        fd.append("offer_id", payload.id);
-        fd.append("price", payload.price);
-        fd.append("source_url", payload.url);
-        fd.append("branch_address", payload.addr);
-        fd.append("scope", scope);
-
-        const r = await fetch("/admin/edit", {
-            method: "POST",
-            body: fd,
-            credentials: "same-origin"
-        });
-
-        if(r.status === 401){
-            alert("Admin oturumu yok / süre dolmuş. Giriş ekranına yönlendiriyorum.");
-            location.href = "/admin/login";
-            return;
-        }
 
-        if(r.ok){
-            location.reload();
-        } else {
-            alert("Güncellenemedi");
-        }
-        }
-
-        /* =======================
-        DÜZENLE (eski akış aynı: prompt prompt prompt -> sonra scope sor)
-        ======================= */
-        async function editOffer(id, currentPrice, currentUrl, currentAddr){
-        // 1) Fiyat
-        let p = prompt("Yeni fiyat (örn: 459.90):", String(currentPrice ?? ""));
-        if(p === null) return;
-        p = p.trim().replace(",", ".");
-        if(!p || isNaN(parseFloat(p))){
-            alert("Geçerli bir sayı gir lütfen.");
-            return;
-        }
-
-        // 2) Adres
-        let a = prompt("Şube adresi (boş bırakabilirsin):", currentAddr || "");
-        if(a === null) return;
-        a = a.trim();
-
-        // 3) URL
-        let u = prompt("Kaynak URL (boş bırakabilirsin):", currentUrl || "");
-        if(u === null) return;
-        u = u.trim();
-
-        // 4) en sonda scope seçtir
-        showEditModal({ id: id, price: p, url: u, addr: a });
-        }
-        </script>
-        """
     body = f"""
     <div class="bg-white card p-4">
       <div class="flex items-center justify-between mb-3">
         <div class="text-lg font-bold">{prod.name}</div>
-        <a href="/" class="text-sm text-indigo-600">← Vitrine dön</a>
+        <a href="{base}" class="text-sm text-indigo-600">← Vitrine dön</a>
       </div>
       {note_html}
       <div class="overflow-x-auto">
@@ -1494,32 +3752,139 @@ async def product_detail(request: Request, name: str):
         </table>
       </div>
     </div>
-    {extra_js}
     """
-    return layout(request, body, f"{prod.name} – Pazarmetre")
+    return f"{prod.name} – Pazarmetre", body, (PRODUCT_ADMIN_SCRIPT if is_adm else b"")
+
+# =============== Çerezsiz ilçe sayfaları ===============
+# Aynı render_* yolları; kişisel parça ve admin araçları olmadan üretilir,
+# böylece CDN/ters vekil Cache-Control + Surrogate-Key ile saklayıp
+# ilçe/ürün bazında temizleyebilir.
+PUBLIC_CACHE_CONTROL = os.environ.get(
+    "PUBLIC_CACHE_CONTROL", "public, max-age=60, s-maxage=300, stale-while-revalidate=120"
+)
+VITRIN_CATS = ("hepsi", "et", "tavuk", "diger")
+
+def _public_page(request: Request, city: str, dist: str, title: str, body, tail: bytes,
+                 surrogate_keys: List[str], head: str = "") -> HTMLResponse:
+    head = (
+        f'<link rel="canonical" href="{SITE_URL}{request.url.path}">\n'
+        f'  <meta name="pz-loc" content="{city}|{dist}">\n'
+    ) + head
+    resp = layout(request, body, title, tail=tail, head=head, personal=False)
+    return _public_headers(resp, surrogate_keys)
+
+def _public_headers(resp: Response, surrogate_keys: List[str]) -> Response:
+    resp.headers["Cache-Control"] = PUBLIC_CACHE_CONTROL
+    resp.headers["Surrogate-Key"] = " ".join(surrogate_keys)
+    return resp
+
+def _exported_or_none(request: Request, city: str, dist: str, surrogate_keys: List[str]) -> Optional[Response]:
+    """Statik export ağacında taze bir kopya varsa onu döndürür."""
+    html = static_export.page(export_rel_path(request.url.path, request.url.query), city, dist)
+    if html is None:
+        return None
+    resp = HTMLResponse(html, headers={"X-Static-Export": "HIT"})
+    return _public_headers(resp, surrogate_keys)
+
+def _district_or_404(request: Request, dist_slug: str) -> Tuple[str, str]:
+    loc = DISTRICT_BY_SLUG.get((request.url.path.split("/")[1], dist_slug))
+    if loc is None:
+        raise HTTPException(status_code=404)
+    return loc
+
+def _district_key(city: str, dist: str) -> str:
+    return f"district-{slugify(city)}-{slugify(dist)}"
+
+def public_fragment(kind: str, city: str, dist: str, arg: str) -> Tuple[tuple, object]:
+    """Çerezsiz ilçe sayfasının parça (anahtar, build) çifti."""
+    base = district_url(city, dist)
+    if kind == "vitrin":
+        return ("vitrin", city, dist, "", arg, base), lambda: render_vitrin(city, dist, None, arg, base=base)
+    if kind == "urun":
+        return (("urun", city, dist, "", arg, False, base),
+                lambda: render_product(arg, city, dist, None, False, base=base))
+    return ("magaza", city, dist, arg), lambda: render_brand(arg, city, dist)
+
+def public_page_response(request: Request, kind: str, city: str, dist: str, arg: str,
+                         fragment: Optional[tuple] = None) -> Response:
+    """Çerezsiz ilçe sayfası. kind: "vitrin" (arg=kategori), "urun" (arg=ürün adı),
+    "magaza" (arg=marka). Route'lar ve statik export aynı yolu kullanır;
+    fragment verilmezse parça cached_fragment ile alınır."""
+    title, body, *extra = fragment or cached_fragment(*public_fragment(kind, city, dist, arg))
+    tail = extra[0] if extra else b""
+    dkey = _district_key(city, dist)
+    if kind == "vitrin":
+        return _public_page(request, city, dist, title, body, tail, [dkey, "vitrin"])
+    if kind == "urun":
+        return _public_page(request, city, dist, title, body, tail, [dkey, f"product-{catalog.product_slug(arg)}"])
+    return _public_page(request, city, dist, title, body, tail, [dkey, f"brand-{slugify(arg)}"],
+                        head=LEAFLET_HEAD)
+
+async def shared_public_page(request: Request, kind: str, city: str, dist: str, arg: str) -> Response:
+    fragment, stale = await shared_fragment(*public_fragment(kind, city, dist, arg))
+    return mark_stale(public_page_response(request, kind, city, dist, arg, fragment), stale)
+
+async def district_vitrin(request: Request, dist_slug: str):
+    city, dist = _district_or_404(request, dist_slug)
+    selected_cat = request.query_params.get("cat", "hepsi").lower()
+    if selected_cat not in VITRIN_CATS:
+        selected_cat = "hepsi"
+    exported = _exported_or_none(request, city, dist, [_district_key(city, dist), "vitrin"])
+    return exported or await shared_public_page(request, "vitrin", city, dist, selected_cat)
+
+async def district_product(request: Request, dist_slug: str, slug: str):
+    city, dist = _district_or_404(request, dist_slug)
+    prod = catalog.product_by_slug(slug)
+    if prod is None:
+        raise HTTPException(status_code=404)
+    exported = _exported_or_none(request, city, dist, [_district_key(city, dist), f"product-{slug}"])
+    return exported or await shared_public_page(request, "urun", city, dist, prod.name)
+
+async def district_brand(request: Request, dist_slug: str, slug: str):
+    city, dist = _district_or_404(request, dist_slug)
+    brand = BRAND_BY_SLUG.get(slug)
+    if brand is None:
+        raise HTTPException(status_code=404)
+    exported = _exported_or_none(request, city, dist, [_district_key(city, dist), f"brand-{slug}"])
+    return exported or await shared_public_page(request, "magaza", city, dist, brand)
+
+for _pslug in PROVINCE_BY_SLUG:
+    app.add_api_route(f"/{_pslug}/{{dist_slug}}/", district_vitrin,
+                      methods=["GET"], response_class=HTMLResponse)
+    app.add_api_route(f"/{_pslug}/{{dist_slug}}/urun/{{slug}}", district_product,
+                      methods=["GET"], response_class=HTMLResponse)
+    app.add_api_route(f"/{_pslug}/{{dist_slug}}/magaza/{{slug}}", district_brand,
+                      methods=["GET"], response_class=HTMLResponse)
 
 # =============== Mağazalar (isteğe bağlı, link yok) ===============
+# Mağazalar sayfasında listelenen markalar (statik export marka sayfaları da bunlar)
+BRANDS = ["Migros", "A101", "BİM"]
+BRAND_BY_SLUG = {slugify(b): b for b in BRANDS}
+
 @app.get("/magazalar", response_class=HTMLResponse)
 async def brands_home(request: Request):
     city, dist, _ = get_loc(request)
     if not city or not dist:
         return RedirectResponse("/lokasyon", status_code=302)
 
-    brands = ["Migros", "A101", "BİM"]
+    (title, body), stale = await shared_fragment(
+        ("magazalar", city, dist), lambda: render_brands_home(city, dist),
+    )
+    return mark_stale(layout(request, body, title), stale)
+
+def render_brands_home(city: str, dist: str) -> Tuple[str, str]:
+    """Mağazalar gövdesi; (başlık, html) döner."""
     cards = []
     with get_session() as s:
-        for brand in brands:
-            st = s.exec(select(Store).where(
-                func.lower(Store.name)==brand.casefold(),
-                Store.city==city, Store.district==dist
-            )).first()
+        for brand in BRANDS:
+            st = catalog.find_store(brand, city, dist)
             price_html = "<div class='text-sm text-gray-500'>Fiyat yok</div>"
             if st:
-                offs = s.exec(select(Offer)
-                    .where(Offer.store_id==st.id, Offer.approved==True)
-                    .order_by(Offer.price.asc(), Offer.created_at.desc())
-                ).all()
-                rows = only_fresh_and_latest([(o, st) for o in offs])
+                rows = only_fresh_and_latest(fetch_offer_store_rows(
+                    s,
+                    Offer.store_id==st.id, Offer.approved==True,
+                    order_by=(Offer.price.asc(), Offer.created_at.desc()),
+                ))
                 if rows:
                     off = rows[0][0]
                     price_html = f"<div class='chip bg-accent-50 text-accent-700'>{off.price:.2f} {off.currency}</div>"
@@ -1544,28 +3909,38 @@ async def brands_home(request: Request):
     </div>
     <div class="grid md:grid-cols-2 gap-3">{''.join(cards)}</div>
     """
-    return layout(request, body, "Mağazalar – Pazarmetre")
+    return "Mağazalar – Pazarmetre", body
 
 # =============== Marka sayfası (tek fiyat + şubeler + harita) ===============
+LEAFLET_HEAD = """
+      <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
+      <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+    
+"""
+
 @app.get("/magaza/{brand}", response_class=HTMLResponse)
 async def brand_view(request: Request, brand: str):
     city, dist, _ = get_loc(request)
     if not city or not dist:
         return RedirectResponse("/lokasyon", status_code=302)
 
+    (title, body), stale = await shared_fragment(
+        ("magaza", city, dist, brand), lambda: render_brand(brand, city, dist),
+    )
+    return mark_stale(layout(request, body, title, head=LEAFLET_HEAD), stale)
+
+def render_brand(brand: str, city: str, dist: str) -> Tuple[str, str]:
+    """Marka sayfası gövdesi (tek fiyat + şubeler + harita); (başlık, html) döner."""
     # 1) TEK FİYAT
     best_html = "<div class='text-sm text-gray-500'>Bu ilçede fiyat yok.</div>"
     with get_session() as s:
-        st = s.exec(select(Store).where(
-            func.lower(Store.name)==brand.casefold(),
-            Store.city==city, Store.district==dist
-        )).first()
+        st = catalog.find_store(brand, city, dist)
         if st:
-            offs = s.exec(select(Offer)
-                .where(Offer.store_id==st.id, Offer.approved==True)
-                .order_by(Offer.price.asc(), Offer.created_at.desc())
-            ).all()
-            rows = only_fresh_and_latest([(o, st) for o in offs])
+            rows = only_fresh_and_latest(fetch_offer_store_rows(
+                s,
+                Offer.store_id==st.id, Offer.approved==True,
+                order_by=(Offer.price.asc(), Offer.created_at.desc()),
+            ))
             if rows:
                 off = rows[0][0]
                 best_html = f"""
@@ -1607,55 +3982,12 @@ async def brand_view(request: Request, brand: str):
         for b in branches if b.lat and b.lng
     ], ensure_ascii=False)
 
-    leaflet_head = """
-      <link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css"/>
-      <script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+    js_data = js_data.replace("</", "<\\/")  # JSON'u <script> içinde güvenle göm
+    map_js = f"""
+    <script id="branchData" type="application/json">{js_data}</script>
+    <script src="{asset_url("js/brand-map.js")}" defer></script>
     """
 
-    map_js = """
-    <script>
-      const BR = __DATA__;
-      let map, markers=[];
-      function initMap(){
-        const center = BR.length ? [BR[0].lat, BR[0].lng] : [40.78, 30.40];
-        map = L.map('map').setView(center, 13);
-        L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
-          maxZoom: 19, attribution: '&copy; OpenStreetMap'
-        }).addTo(map);
-        BR.forEach(p=>{
-          const m = L.marker([p.lat, p.lng]).addTo(map)
-            .bindPopup(`<b>${p.name}</b><br>${p.address||''}`);
-          markers.push(m);
-        });
-        if (markers.length > 1){
-          const g = L.featureGroup(markers); map.fitBounds(g.getBounds().pad(0.2));
-        }
-      }
-      function distKm(lat1, lon1, lat2, lon2){
-        if(!lat1||!lon1||!lat2||!lon2) return null;
-        const R=6371, toRad=d=>d*Math.PI/180;
-        const dLat=toRad(lat2-lat1), dLon=toRad(lon2-lon1);
-        const a=Math.sin(dLat/2)**2 + Math.cos(toRad(lat1))*Math.cos(toRad(lat2))*Math.sin(dLon/2)**2;
-        return R*2*Math.atan2(Math.sqrt(a), Math.sqrt(1-a));
-      }
-      function showNearby(){
-        if(!navigator.geolocation){ alert('Konum desteklenmiyor'); return; }
-        navigator.geolocation.getCurrentPosition(pos=>{
-          const myLat=pos.coords.latitude, myLng=pos.coords.longitude;
-          if(map) map.setView([myLat,myLng], 13);
-          document.querySelectorAll('[data-lat]').forEach(el=>{
-            const lat=parseFloat(el.getAttribute('data-lat')), lng=parseFloat(el.getAttribute('data-lng'));
-            if(!isNaN(lat) && !isNaN(lng)){
-              const d=distKm(myLat,myLng,lat,lng);
-              if(d) el.textContent = '📍 Size uzaklık: ~' + d.toFixed(1) + ' km';
-            }
-          });
-        }, ()=>alert('Konum alınamadı'));
-      }
-      window.addEventListener('load', initMap);
-    </script>
-    """.replace("__DATA__", js_data)
-
     # --- UYARI BANDI (kısa ve net) ---
     note_html = """
     <div class="mt-2 mb-2 p-3 rounded-lg bg-amber-50 text-amber-800 text-sm">
@@ -1686,9 +4018,7 @@ async def brand_view(request: Request, brand: str):
     {map_js}
     """
 
-    html = layout(request, body, f"{brand} – Şubeler & Fiyat").body.decode("utf-8")
-    html = html.replace("</head>", f"{leaflet_head}\n</head>")
-    return HTMLResponse(html)
+    return f"{brand} – Şubeler & Fiyat", body
 
 # =============== Admin ===========================
 @app.get("/admin/login", response_class=HTMLResponse)
@@ -1913,6 +4243,12 @@ async def admin_step1(request: Request):
               <a href="/admin/stats" class="text-sm bg-blue-600 hover:bg-blue-700 text-white px-4 py-2 rounded-lg">
                 İstatistikler
               </a>
+              <a href="/admin/slow-queries" class="text-sm border border-gray-300 hover:bg-gray-50 px-4 py-2 rounded-lg">
+                Yavaş Sorgular
+              </a>
+              <a href="/admin/memory" class="text-sm border border-gray-300 hover:bg-gray-50 px-4 py-2 rounded-lg">
+                Bellek
+              </a>
             </div>
           </div>
         </div>
@@ -2149,14 +4485,7 @@ async def admin_bulk_save(
 
         for target_dist in target_districts:
             # İLÇE BAŞINA TEK KANONİK MAĞAZA
-            st = s.exec(
-                select(Store).where(
-                    func.lower(Store.name) == store_clean.casefold(),
-                    Store.city == city,
-                    Store.district == target_dist,
-                    Store.neighborhood == None,
-                )
-            ).first()
+            st = catalog.find_store(store_clean, city, target_dist, no_neighborhood=True)
 
             if not st:
                 # varsa ilk dolu adresi mağazaya yaz
@@ -2177,7 +4506,8 @@ async def admin_bulk_save(
 
             # HER SATIR İÇİN: ÜRÜN BUL/OLUŞTUR → BU MAĞAZAYA FİYAT YAZ
             for pn, pv, un, addr, src, sw, su, cat in entries:
-                p = s.exec(select(Product).where(Product.name == pn)).first()
+                cp = catalog.product_by_name(pn)
+                p = s.get(Product, cp.id) if cp else None
                 if not p:
                     # yeni ürün: kategori ve birim ile birlikte oluştur
                     p = Product(
@@ -2608,17 +4938,22 @@ async def admin_stats(request: Request):
     if red:
         return red
 
+    title, body = await single_flight.do(("admin_stats",), render_admin_stats)
+    return layout(request, body, title)
+
+def render_admin_stats() -> Tuple[str, str]:
+    """Ziyaret istatistikleri gövdesi; (başlık, html) döner."""
     now = datetime.utcnow()
     since_30 = now - timedelta(days=30)
     since_1 = now - timedelta(days=1)
 
     with get_session() as s:
         # Sayılar tek int olarak
-        total  = s.exec(select(func.count()).select_from(Visit)).one()[0]
-        last24 = s.exec(select(func.count()).where(Visit.ts >= since_1)).one()[0]
+        total  = s.exec(select(func.count()).select_from(Visit)).one()
+        last24 = s.exec(select(func.count()).where(Visit.ts >= since_1)).one()
         uniq30 = s.exec(
             select(func.count(func.distinct(Visit.ip_hash))).where(Visit.ts >= since_30)
-        ).one()[0]
+        ).one()
 
         # Günlük özet (30 gün)
         daily = s.exec(
@@ -2697,7 +5032,212 @@ async def admin_stats(request: Request):
       <div class="text-xs text-gray-500 mt-4">IP adresleri <b>hash</b>’lenerek saklanır (salt={ANALYTICS_SALT}).</div>
     </div>
     """
-    return layout(request, body, "Admin – Stats")
+    return "Admin – Stats", body
+
+def _cache_stats(cache: TTLCache) -> dict:
+    total = cache.hits + cache.misses
+    return {"entries": len(cache._data), "bytes": cache.size, "hits": cache.hits, "misses": cache.misses,
+            "stale_hits": cache.stale_hits, "hit_ratio": round(cache.hits / total, 3) if total else None, "evictions": cache.evictions}
+
+@app.get("/admin/slow-queries", response_class=HTMLResponse)
+async def admin_slow_queries(request: Request):
+    red = require_admin(request)
+    if red:
+        return red
+
+    groups = slow_queries.grouped()
+    rows = []
+    for g in groups[:50]:
+        routes = ", ".join(f"{_xml_escape(r)} ({n})" for r, n in sorted(g["routes"].items(), key=lambda x: -x[1]))
+        plan = (f"<pre class='mt-2 text-xs bg-gray-50 p-2 rounded overflow-x-auto'>{_xml_escape(g['plan'])}</pre>"
+                if g["plan"] else "")
+        rows.append(f"""
+        <tr class="border-b align-top">
+          <td class="py-2 pr-3">
+            <code class="text-xs break-all">{_xml_escape(g['sql'])}</code>
+            <div class="text-xs text-gray-500 mt-1">Parametreler (en yavaş): {_xml_escape(json.dumps(g['params'], ensure_ascii=False, default=str))}</div>
+            {plan}
+          </td>
+          <td class="py-2 text-right">{g['count']}</td>
+          <td class="py-2 text-right">{g['total_ms']:.0f}</td>
+          <td class="py-2 text-right">{g['avg_ms']:.0f}</td>
+          <td class="py-2 text-right">{g['max_ms']:.0f}</td>
+          <td class="py-2 pl-3 text-xs">{routes}<div class="text-gray-400">{g['last']}</div></td>
+        </tr>
+        """)
+
+    body = f"""
+    <div class="bg-white card p-6">
+      <div class="flex items-center justify-between mb-4">
+        <div class="text-lg font-bold">Yavaş Sorgular</div>
+        <a class="text-sm text-gray-600" href="/admin">← Admin</a>
+      </div>
+      <div class="text-sm text-gray-500 mb-4">
+        Eşik {SLOW_QUERY_MS:.0f} ms · son {len(slow_queries.ring)} kayıt (en fazla {SLOW_QUERY_RING}) ·
+        sorgu şekline göre gruplu, toplam süreye göre sıralı
+      </div>
+      <div class="overflow-x-auto">
+        <table class="min-w-full text-sm">
+          <thead><tr class="text-left text-gray-500 border-b">
+            <th>Sorgu</th><th class="text-right">Adet</th><th class="text-right">Toplam ms</th>
+            <th class="text-right">Ort.</th><th class="text-right">En yüksek</th><th class="pl-3">Route</th>
+          </tr></thead>
+          <tbody>{''.join(rows) or "<tr><td colspan='6' class='py-2 text-gray-500'>Kayıt yok</td></tr>"}</tbody>
+        </table>
+      </div>
+    </div>
+    """
+    return layout(request, body, "Admin – Yavaş Sorgular")
+
+def _mb(n: Optional[int]) -> str:
+    return "–" if n is None else f"{n / 1048576:.1f} MB"
+
+@app.get("/admin/memory", response_class=HTMLResponse)
+async def admin_memory(request: Request):
+    red = require_admin(request)
+    if red:
+        return red
+
+    sizes = await run_in_threadpool(cache_sizes)
+    report = await run_in_threadpool(memory_monitor.trace_report)
+    snap = memory_monitor.snapshot()
+
+    cache_rows = "".join(f"""
+        <tr class="border-b">
+          <td class="py-1">{c['name']}</td>
+          <td class="py-1 text-right">{c['entries']}</td>
+          <td class="py-1 text-right">{_mb(c['bytes'])}</td>
+          <td class="py-1 text-right text-gray-500">{_mb(c.get('max_bytes'))}</td>
+        </tr>""" for c in sizes)
+
+    hist = list(memory_monitor.history)
+    chart = ""
+    if len(hist) >= 2:
+        lo, hi = min(r for _, r in hist), max(r for _, r in hist)
+        span = max(hi - lo, 1)
+        pts = " ".join(f"{i * 600 / (len(hist) - 1):.1f},{70 - (r - lo) * 60 / span:.1f}" for i, (_, r) in enumerate(hist))
+        chart = f"""
+        <svg viewBox="0 0 600 80" class="w-full h-20 bg-gray-50 rounded">
+          <polyline fill="none" stroke="#2563eb" stroke-width="2" points="{pts}"/>
+        </svg>
+        <div class="flex justify-between text-xs text-gray-500 mt-1">
+          <span>{_mb(lo)} – {_mb(hi)}</span>
+          <span>son {len(hist)} örnek, {MEMORY_SAMPLE_INTERVAL:.0f} sn aralık</span>
+        </div>"""
+
+    def site_rows(items, diff: bool) -> str:
+        out = []
+        for item in items:
+            size = f"{'+' if diff and item[1] > 0 else ''}{item[1] / 1024:.1f} KB"
+            count = f"{'+' if diff and item[2] > 0 else ''}{item[2]}"
+            out.append(f"<tr class='border-b'><td class='py-1 pr-3 break-all'><code class='text-xs'>{_xml_escape(item[0])}</code></td>"
+                       f"<td class='py-1 text-right'>{size}</td><td class='py-1 text-right'>{count}</td></tr>")
+        return "".join(out)
+
+    btn = "text-sm border border-gray-300 hover:bg-gray-50 px-3 py-1 rounded-lg"
+    if report is None:
+        trace_html = f"""
+        <form method="post" action="/admin/memory/tracemalloc">
+          <input type="hidden" name="action" value="start">
+          <button class="{btn}">tracemalloc başlat</button>
+          <span class="text-xs text-gray-500 ml-2">Açıkken tahsisler yavaşlar; ölçümden sonra durdurun.</span>
+        </form>"""
+    else:
+        since = datetime.fromtimestamp(memory_monitor.baseline_at, TR_TZ).strftime("%H:%M:%S")
+        trace_html = f"""
+        <div class="flex items-center gap-2 mb-3">
+          <span class="text-sm text-gray-600">İzlenen {_mb(report['traced'])} (tepe {_mb(report['peak'])}) · başlangıç {since}</span>
+          <form method="post" action="/admin/memory/tracemalloc"><input type="hidden" name="action" value="start"><button class="{btn}">Başlangıcı yenile</button></form>
+          <form method="post" action="/admin/memory/tracemalloc"><input type="hidden" name="action" value="stop"><button class="{btn}">Durdur</button></form>
+        </div>
+        <div class="font-semibold text-sm mb-1">Başlangıçtan beri en çok büyüyenler</div>
+        <table class="min-w-full text-sm mb-4"><tbody>{site_rows(report['diff'], True)}</tbody></table>
+        <div class="font-semibold text-sm mb-1">En çok tahsis yapan satırlar</div>
+        <table class="min-w-full text-sm"><tbody>{site_rows(report['top'], False)}</tbody></table>"""
+
+    trim = snap["last_trim"]
+    body = f"""
+    <div class="bg-white card p-6 space-y-6">
+      <div class="flex items-center justify-between">
+        <div class="text-lg font-bold">Bellek</div>
+        <a class="text-sm text-gray-600" href="/admin">← Admin</a>
+      </div>
+      <div>
+        <div class="text-sm text-gray-600 mb-2">
+          RSS (paylaşılan hariç) {_mb(snap['rss'])} · tepe {_mb(snap['peak_rss'])} ·
+          bütçe {f"{MEMORY_BUDGET_MB} MB" if MEMORY_BUDGET_MB else "yok"} ·
+          bütçe kırpması {snap['trims']}{f" (son: {trim['at']}, {trim['evicted']} girdi)" if trim else ""}
+        </div>
+        {chart}
+      </div>
+      <div>
+        <div class="font-semibold mb-2">Önbellekler</div>
+        <table class="min-w-full text-sm">
+          <thead><tr class="text-left text-gray-500 border-b">
+            <th>Ad</th><th class="text-right">Girdi</th><th class="text-right">Tahmini boyut</th><th class="text-right">Sınır</th>
+          </tr></thead>
+          <tbody>{cache_rows}</tbody>
+        </table>
+      </div>
+      <div>
+        <div class="font-semibold mb-2">tracemalloc</div>
+        {trace_html}
+      </div>
+    </div>
+    """
+    return layout(request, body, "Admin – Bellek")
+
+@app.post("/admin/memory/tracemalloc")
+async def admin_memory_tracemalloc(request: Request, action: str = Form(...)):
+    red = require_admin(request)
+    if red:
+        return red
+    if action == "start":
+        await run_in_threadpool(memory_monitor.trace_start)
+    elif action == "stop":
+        memory_monitor.trace_stop()
+    return RedirectResponse("/admin/memory", status_code=302)
+
+@app.get("/admin/profile")
+async def admin_profile(request: Request, seconds: float = 10, hz: int = 100, idle: int = 0):
+    """Örnekleyici profil; collapsed yığınlar (flamegraph.pl / speedscope)."""
+    r = require_admin(request)
+    if r:
+        return r
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    hz = min(max(hz, 1), 1000)
+    if not stack_sampler.lock.acquire(blocking=False):
+        return PlainTextResponse("Başka bir profil çalışıyor, bitmesini bekleyin.\n", status_code=409)
+    try:
+        counts = await run_in_threadpool(stack_sampler.run, seconds, hz, bool(idle),
+                                         asyncio.get_running_loop(), threading.get_ident())
+    finally:
+        stack_sampler.lock.release()
+    lines = [f"{k} {n}" for k, n in sorted(counts.items(), key=lambda x: -x[1])]
+    return PlainTextResponse("\n".join(lines) + "\n", headers={
+        "Cache-Control": "no-store",
+        "X-Profile-Samples": str(stack_sampler.last["samples"]),
+    })
+
+@app.get("/admin/perf")
+async def admin_perf(request: Request):
+    """Önbellek, tekil üretim ve sıkıştırma sayaçları (JSON)."""
+    r = require_admin(request)
+    if r:
+        return r
+    return JSONResponse({
+        "page_cache": _cache_stats(page_cache),
+        "fragment_cache": _cache_stats(fragment_cache),
+        "single_flight": single_flight.snapshot(),
+        "stale": stale_stats.snapshot(),
+        "warm_start": warm_start.snapshot(),
+        "cache_warm": cache_warmer.snapshot(),
+        "profile": {"running": stack_sampler.active, "last": stack_sampler.last},
+        "memory": memory_monitor.snapshot(),
+        "n_plus_one": list(n_plus_one_log)[-50:] if PAZAR_DEBUG else None,
+        "compression": {"min_bytes": COMPRESS_MIN_BYTES, "encodings": list(ENCODINGS),
+                        **compression_stats.snapshot()},
+    })
 
 # =============== Seed – örnek: Migros Hendek şubeleri ===============
 MIGROS_BRANCHES = {
@@ -2762,6 +5302,8 @@ async def seed_migros_branches(request: Request):
                     added_branch += 1
         s.commit()
 
+    if added_store:
+        catalog.load()
     return JSONResponse({"ok": True, "added_store": added_store, "added_branch": added_branch})
 
 
@@ -2855,6 +5397,8 @@ def seed_products():
                 count += 1
         
         s.commit()
+    if count:
+        catalog.load()
     return count
 
 # ============================================
@@ -2862,10 +5406,18 @@ def seed_products():
 # ============================================
 
 def verify_password_business(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    t0 = time.perf_counter()
+    try:
+        return pwd_context.verify(plain_password, hashed_password)
+    finally:
+        metrics.observe("pz_bcrypt_seconds", (("op", "verify"),), time.perf_counter() - t0)
 
 def get_password_hash_business(password: str) -> str:
-    return pwd_context.hash(password)
+    t0 = time.perf_counter()
+    try:
+        return pwd_context.hash(password)
+    finally:
+        metrics.observe("pz_bcrypt_seconds", (("op", "hash"),), time.perf_counter() - t0)
 
 def create_business_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -3373,34 +5925,21 @@ async def business_price_add_form(request: Request):
     if success == "added":
         success_msg = '<div class="p-3 mb-4 bg-emerald-50 text-emerald-800 rounded-lg">✅ Fiyat başarıyla eklendi!</div>'
     
-    # Ürün listesini kategoriye göre getir
-    with get_session() as s:
-        products = s.exec(
-            select(Product)
-            .where(Product.is_active == True)
-            .order_by(Product.category, Product.name)
-        ).all()
-        
-        # Mağaza listesi - İşletmenin ilçesindeki mağazalar + kendi mağazası
-        stores = s.exec(
-            select(Store)
-            .where(
-                or_(
-                    Store.district == business.district,
-                    Store.business_id == business.id
-                )
-            )
-            .order_by(Store.name)
-        ).all()
-        
-        # Eğer işletmenin kendi mağazası yoksa oluştur
-        own_store = None
-        for st in stores:
-            if st.business_id == business.id:
-                own_store = st
-                break
-        
-        if not own_store:
+    # Ürün listesi (kategori + isim sıralı) katalogdan
+    products = catalog.active_products()
+
+    # Mağaza listesi - İşletmenin ilçesindeki mağazalar + kendi mağazası
+    stores = catalog.stores_for_business(business.district, business.id)
+
+    # Eğer işletmenin kendi mağazası yoksa oluştur
+    own_store = None
+    for st in stores:
+        if st.business_id == business.id:
+            own_store = st
+            break
+
+    if not own_store:
+        with get_session() as s:
             own_store = Store(
                 name=business.business_name,
                 city=business.city,
@@ -4303,4 +6842,267 @@ async def admin_seed_products_post(request: Request):
     
     count = seed_products()
     
-    return JSONResponse({"ok": True, "added": count, "message": f"{count} ürün eklendi"})
\ No newline at end of file
+    return JSONResponse({"ok": True, "added": count, "message": f"{count} ürün eklendi"})
+
+# =============== Statik export ===============
+# Her ilçenin çerezsiz sayfaları (vitrin × kategori, ürün detay, marka) aynı
+# public_page_response() yoluyla dosya ağacına yazılır:
+#   sakarya/hendek/index.html           -> /sakarya/hendek/
+#   sakarya/hendek/cat-et.html          -> /sakarya/hendek/?cat=et
+#   sakarya/hendek/urun/dana-kiyma.html -> /sakarya/hendek/urun/dana-kiyma
+#   sakarya/hendek/magaza/migros.html   -> /sakarya/hendek/magaza/migros
+# manifest.json sayfa başına veri imzasını tutar; imzası değişmeyen sayfa
+# yeniden render edilmez. İlçeler ayrı süreçlerde işlenir.
+# STATIC_EXPORT_DIR ayarlıysa ilçe route'ları, export başladıktan sonra ilçede
+# yazma olmadıysa ve STATIC_EXPORT_MAX_AGE aşılmadıysa dosyayı doğrudan sunar.
+STATIC_EXPORT_DIR = os.environ.get("STATIC_EXPORT_DIR", "")
+STATIC_EXPORT_MAX_AGE = float(os.environ.get("STATIC_EXPORT_MAX_AGE", "3600"))
+
+def export_rel_path(path: str, query: str = "") -> str:
+    rel = path.strip("/")
+    if rel.count("/") == 1:  # vitrin
+        cat = parse_qs(query).get("cat", ["hepsi"])[0].lower()
+        return f"{rel}/index.html" if cat not in VITRIN_CATS[1:] else f"{rel}/cat-{cat}.html"
+    return rel + ".html"
+
+def _export_url(kind: str, city: str, dist: str, arg: str) -> Tuple[str, str]:
+    if kind == "vitrin":
+        return district_url(city, dist), ("" if arg == "hepsi" else f"cat={arg}")
+    if kind == "urun":
+        return district_url(city, dist, product_name=arg), ""
+    return district_url(city, dist, brand=arg), ""
+
+def _sig(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+def _ts(v) -> str:
+    return v if isinstance(v, str) else (v.isoformat() if v else "")
+
+def export_plan() -> dict:
+    """rel -> (imza, (tür, şehir, ilçe, arg)). Tek geçişte gruplu sorgularla."""
+    ts = func.max(func.coalesce(Offer.updated_at, Offer.created_at))
+    with get_session() as s:
+        offer_rows = s.execute(
+            select(Store.city, Store.district, Store.name, Offer.product_id,
+                   func.count(), func.sum(Offer.price), ts, func.max(Offer.id))
+            .join(Store, Offer.store_id == Store.id)
+            .where(Offer.approved == True)
+            .group_by(Store.city, Store.district, Store.name, Offer.product_id)
+        ).all()
+        branch_rows = s.execute(
+            select(Branch.city, Branch.district, Branch.brand, func.count(), func.max(Branch.id),
+                   func.sum(func.coalesce(Branch.lat, 0) + func.coalesce(Branch.lng, 0)))
+            .group_by(Branch.city, Branch.district, Branch.brand)
+        ).all()
+
+    offers_by_dist: dict = {}
+    for city, dist, sname, pid, n, total, lm, max_id in offer_rows:
+        offers_by_dist.setdefault((city, dist), []).append(
+            ((sname or "").casefold(), pid, n, round(total or 0, 2), _ts(lm), max_id))
+    branches_by_dist: dict = {}
+    for city, dist, brand, n, max_id, coord in branch_rows:
+        branches_by_dist.setdefault((city, dist), []).append(((brand or "").casefold(), n, max_id, coord))
+    stores_by_dist: dict = {}
+    for st in catalog.stores.values():
+        stores_by_dist.setdefault((st.city, st.district), []).append(
+            (st.id, st.name, st.address, st.neighborhood))
+    featured = sorted((p.id, p.name, p.unit, p.category) for p in catalog.featured_products())
+
+    now = datetime.utcnow()
+    hour, day = now.strftime("%Y%m%d%H"), now.strftime("%Y%m%d")
+    plan = {}
+    for city, dist in DISTRICT_BY_SLUG.values():
+        offers = sorted(offers_by_dist.get((city, dist), []))
+        stores = sorted(stores_by_dist.get((city, dist), []))
+        # "yeni" rozeti saate bağlı -> vitrin imzası saatlik
+        vitrin_sig = _sig(featured, offers, stores, hour)
+        for cat in VITRIN_CATS:
+            path, qs = _export_url("vitrin", city, dist, cat)
+            plan[export_rel_path(path, qs)] = (vitrin_sig, ("vitrin", city, dist, cat))
+
+        pids = {o[1] for o in offers}
+        groups: dict = {}
+        for pid in pids:
+            prod = catalog.product(pid)
+            if prod is not None and prod.is_active:
+                groups.setdefault(prod.norm, set()).add(pid)
+        for norm in groups:
+            group = catalog.products_by_norm(norm)
+            ids = {p.id for p in group}
+            sig = _sig([(p.id, p.name, p.unit) for p in group],
+                       [o for o in offers if o[1] in ids], stores, day)
+            path, _qs = _export_url("urun", city, dist, group[0].name)
+            plan[export_rel_path(path)] = (sig, ("urun", city, dist, group[0].name))
+
+        branches = branches_by_dist.get((city, dist), [])
+        for brand in BRANDS:
+            key = brand.casefold()
+            sig = _sig([o for o in offers if o[0] == key], [b for b in branches if b[0] == key], day)
+            path, _qs = _export_url("magaza", city, dist, brand)
+            plan[export_rel_path(path)] = (sig, ("magaza", city, dist, brand))
+    return plan
+
+def _export_worker_init():
+    try:
+        catalog.load()
+    except Exception as e:
+        print("WARN export worker:", repr(e))
+
+def _export_render_batch(out_dir: str, items: list) -> list:
+    """Bir ilçenin sayfalarını render edip yazar; [(rel, hata|None)] döner."""
+    results = []
+    for rel, (kind, city, dist, arg) in items:
+        path, qs = _export_url(kind, city, dist, arg)
+        req = Request({"type": "http", "method": "GET", "path": path,
+                       "query_string": qs.encode(), "headers": []})
+        try:
+            html = public_page_response(req, kind, city, dist, arg).body
+            target = Path(out_dir) / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = target.with_suffix(".tmp")
+            tmp.write_bytes(html)
+            os.replace(tmp, target)
+            results.append((rel, None))
+        except Exception as e:
+            results.append((rel, repr(e)))
+    return results
+
+def export_static_site(out_dir: str, workers: int = 4, force: bool = False) -> dict:
+    """Statik ağacı günceller. force=False iken imzası değişmeyen sayfalar atlanır."""
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    t0 = time.perf_counter()
+    started_at = time.time()
+    out = Path(out_dir)
+    manifest_path = out / "manifest.json"
+    old_pages = {}
+    if manifest_path.exists():
+        try:
+            old_pages = json.loads(manifest_path.read_text("utf-8")).get("pages", {})
+        except (OSError, ValueError) as e:
+            print("WARN export manifest:", repr(e))
+
+    plan = export_plan()
+    todo: dict = {}
+    for rel, (sig, task) in plan.items():
+        old = old_pages.get(rel)
+        if force or old is None or old.get("sig") != sig or not (out / rel).exists():
+            todo.setdefault((task[1], task[2]), []).append((rel, task))
+
+    errors = []
+    batches = list(todo.values())
+    if workers > 1 and len(batches) > 1:
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_export_worker_init) as ex:
+            for res in ex.map(_export_render_batch, [str(out)] * len(batches), batches):
+                errors += [(rel, err) for rel, err in res if err]
+    else:
+        for batch in batches:
+            errors += [(rel, err) for rel, err in _export_render_batch(str(out), batch) if err]
+
+    failed = {rel for rel, _err in errors}
+    pages = {
+        rel: {"sig": sig, "district": [task[1], task[2]]}
+        for rel, (sig, task) in plan.items() if rel not in failed
+    }
+    removed = 0
+    for rel in set(old_pages) - set(plan):
+        try:
+            (out / rel).unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    out.mkdir(parents=True, exist_ok=True)
+    tmp = manifest_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"exported_at": started_at, "pages": pages}, ensure_ascii=False), "utf-8")
+    os.replace(tmp, manifest_path)
+
+    rendered = sum(len(b) for b in batches)
+    return {
+        "pages": len(plan), "rendered": rendered - len(errors), "skipped": len(plan) - rendered,
+        "removed": removed, "errors": errors[:20], "seconds": round(time.perf_counter() - t0, 2),
+    }
+
+class StaticExport:
+    """Export ağacından taze sayfa okuma (manifest değişince yeniden yüklenir)."""
+
+    def __init__(self, root: str):
+        self.root = Path(root) if root else None
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self.exported_at = 0.0
+        self.pages: dict = {}
+        self.hits = 0
+
+    def _reload(self):
+        now = time.monotonic()
+        if now - self._checked < 5:
+            return
+        self._checked = now
+        try:
+            mtime = (self.root / "manifest.json").stat().st_mtime
+            if mtime != self._mtime:
+                data = json.loads((self.root / "manifest.json").read_text("utf-8"))
+                self.exported_at, self.pages, self._mtime = data["exported_at"], data["pages"], mtime
+        except (OSError, ValueError, KeyError):
+            self.pages = {}
+
+    def page(self, rel: str, city: str, dist: str) -> Optional[bytes]:
+        if self.root is None:
+            return None
+        with self._lock:
+            self._reload()
+        if rel not in self.pages or time.time() - self.exported_at > STATIC_EXPORT_MAX_AGE:
+            return None
+        # export başladıktan sonra bu ilçede (ya da ürünlerde) yazma olduysa kullanma
+        # (açılış zamanı sayılmaz: export sonrası yeniden başlayan süreç de dosyayı sunabilir)
+        lm = district_versions.last_write(city, dist)
+        if lm is not None and lm >= datetime.utcfromtimestamp(self.exported_at).replace(microsecond=0):
+            return None
+        try:
+            html = (self.root / rel).read_bytes()
+        except OSError:
+            return None
+        self.hits += 1
+        return html
+
+static_export = StaticExport(STATIC_EXPORT_DIR)
+export_status: dict = {"running": False, "last": None}
+
+def _run_export_job(workers: int, force: bool):
+    try:
+        export_status["last"] = export_static_site(STATIC_EXPORT_DIR or "export", workers, force)
+    except Exception as e:
+        print("WARN export:", repr(e))
+        traceback.print_exc()
+        export_status["last"] = {"error": repr(e)}
+    finally:
+        export_status["running"] = False
+
+@app.get("/admin/export")
+async def admin_export_status(request: Request):
+    r = require_admin(request)
+    if r:
+        return r
+    return JSONResponse({**export_status, "dir": STATIC_EXPORT_DIR or "export",
+                         "served_hits": static_export.hits})
+
+@app.post("/admin/export")
+async def admin_export_start(request: Request):
+    """Statik export'u arka planda başlatır (aynı anda tek iş)."""
+    r = require_admin(request)
+    if r:
+        return r
+    form = await request.form()
+    if export_status["running"]:
+        return JSONResponse({"ok": False, "message": "Export zaten çalışıyor"}, status_code=409)
+    try:
+        workers = int(form.get("workers") or os.cpu_count() or 2)
+    except ValueError:
+        return JSONResponse({"ok": False, "message": "workers sayı olmalı"}, status_code=400)
+    workers = max(1, min(workers, 2 * (os.cpu_count() or 2)))
+    export_status["running"] = True
+    threading.Thread(target=_run_export_job, args=(workers, bool(form.get("force"))), daemon=True).start()
+    return JSONResponse({"ok": True, "message": "Export başladı"})
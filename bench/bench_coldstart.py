@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Soğuk açılış benchmark'ı: uvicorn süreci başlatıldıktan sonra ilk GET /
+yanıtının ilk baytına kadar geçen süre (TTFB), warm-start snapshot ile ve
+snapshot'sız.
+
+  snapshot'sız : açılışta katalog DB'den yüklenir, ilk istek vitrini hesaplar
+  snapshot     : katalog ve vitrin parçaları WARM_SNAPSHOT_PATH'ten mmap'lenir,
+                 canlı yükleme arka planda yapılır
+
+Geçici bir SQLite veritabanına sentetik veri basar; her ölçüm yeni bir süreçtir.
+Snapshot, bir kez sunucuyu çalıştırıp vitrinleri gezdikten sonra düzgün
+kapatarak (shutdown'da yazılır) üretilir.
+
+Çalıştır:  python bench/bench_coldstart.py --offers 20000 --runs 5
+"""
+
+from __future__ import annotations
+import argparse, os, random, signal, socket, statistics, subprocess, sys, tempfile, time
+import urllib.request
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import quote
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--offers", type=int, default=20000, help="toplam teklif sayısı (ilçelere dağıtılır)")
+    ap.add_argument("--products", type=int, default=400)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=42)
+    return ap.parse_args()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(port: int, path: str, city: str, dist: str, limit: int = -1) -> bytes:
+    req = urllib.request.Request(f"http://127.0.0.1:{port}{path}", headers={
+        "Accept": "text/html",
+        "Cookie": f"city={quote(city)}; district={quote(dist)}; pz_sess=bench",
+    })
+    with urllib.request.urlopen(req, timeout=30) as r:
+        return r.read(limit)
+
+
+def _wait(proc: subprocess.Popen, port: int, path: str, city: str, dist: str):
+    while True:
+        try:
+            return _get(port, path, city, dist, limit=1)
+        except (ConnectionError, urllib.error.URLError):
+            if proc.poll() is not None:
+                raise SystemExit("uvicorn açılamadı")
+            time.sleep(0.005)
+
+
+def _boot(env: dict, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def _cold_ttfb(env: dict, city: str, dist: str) -> float:
+    """Süreç başlangıcından ilk yanıt baytına kadar ms."""
+    port = _free_port()
+    t0 = time.perf_counter()
+    proc = _boot(env, port)
+    try:
+        _wait(proc, port, "/", city, dist)
+        return (time.perf_counter() - t0) * 1000
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait()
+
+
+def main():
+    args = _parse_args()
+
+    tmpdir = Path(tempfile.mkdtemp(prefix="pz_bench_"))
+    db_url = f"sqlite:///{tmpdir / 'bench.db'}"
+    snap = tmpdir / "warm.bin"
+    os.environ["PAZAR_DB"] = db_url
+    sys.path.insert(0, str(ROOT))
+    import app as A
+    from sqlmodel import select
+
+    rnd = random.Random(args.seed)
+    city = "Sakarya"
+    districts = [d["name"] for d in A.LOC_JSON["provinces"][0]["districts"]]
+    brands = ["Migros", "A101", "BİM", "Şok"]
+    now = datetime.utcnow()
+
+    with A.get_session() as s:
+        conn = s.connection()
+        conn.execute(A.Product.__table__.insert(), [
+            {"name": f"Ürün {i}", "unit": "kg", "featured": True, "category": rnd.choice(["et", "tavuk", "diger"]),
+             "is_active": True, "created_by": "bench", "created_at": now}
+            for i in range(args.products)
+        ])
+        conn.execute(A.Store.__table__.insert(), [
+            {"name": b, "city": city, "district": d} for d in districts for b in brands
+        ])
+        store_ids = [r[0] for r in conn.execute(select(A.Store.id))]
+        conn.execute(A.Offer.__table__.insert(), [
+            {"product_id": rnd.randint(1, args.products), "store_id": rnd.choice(store_ids),
+             "price": round(rnd.uniform(10, 900), 2), "currency": "TRY", "quantity": 1.0,
+             "created_at": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 5)),
+             "updated_at": now, "approved": True, "source_mismatch": False,
+             "source_url": "https://example.com/p", "branch_address": "Merkez Mah."}
+            for _ in range(args.offers)
+        ])
+        s.commit()
+
+    base_env = {**os.environ, "PAZAR_DB": db_url, "WARM_SNAPSHOT_PATH": ""}
+    snap_env = {**base_env, "WARM_SNAPSHOT_PATH": str(snap)}
+
+    # snapshot üret: tüm ilçe vitrinlerini gez, düzgün kapat
+    port = _free_port()
+    proc = _boot(snap_env, port)
+    _wait(proc, port, "/healthz", city, districts[0])
+    for d in districts:
+        for cat in ("hepsi", "et", "tavuk", "diger"):
+            _get(port, f"/?cat={cat}", city, d)
+    proc.send_signal(signal.SIGTERM)
+    proc.wait()
+    if not snap.exists():
+        raise SystemExit("snapshot yazılmadı")
+
+    dist = districts[0]
+    print(f"offers={args.offers} products={args.products} districts={len(districts)} runs={args.runs} "
+          f"snapshot={snap.stat().st_size} B")
+    res = []
+    for name, env in (("snapshot'sız", base_env), ("snapshot", snap_env)):
+        times = [_cold_ttfb(env, city, dist) for _ in range(args.runs)]
+        res.append(statistics.median(times))
+        print(f"{name:<13} ilk bayt median={res[-1]:8.1f} ms  min={min(times):8.1f} ms")
+    print(f"fark          {res[0] - res[1]:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP yük benchmark'ı: public ve admin sıcak yolları sabit eşzamanlılıkla,
+senaryo başına belirli bir süre boyunca sürer.
+
+  senaryolar : /  /?cat=et  /urun?name=...  /magazalar  /magaza/Migros
+               /admin  /admin/stats  POST /admin/bulk (5 satır fiyat, tek ilçe)
+  ölçümler   : p50/p95/p99/en yüksek gecikme (ms), throughput (istek/sn), hata
+               sayısı, istek başına DB sorgusu (Server-Timing "db" desc'inden)
+
+--url verilmezse yerel bir uvicorn süreci başlatılır: --db verilmişse o
+veritabanı (ör. gen_dataset.py çıktısı), yoksa geçici SQLite'a gen_dataset.py
+ile sentetik veri basılır. --url ile admin senaryoları yalnızca açıkça verilen
+--admin-password ile (ortamdaki PAZARMETRE_ADMIN okunmaz), yazan senaryolar
+(POST /admin/bulk, ısınma dahil) ayrıca --allow-writes ile koşar. İstemci, her iş parçacığında keep-alive bir
+http.client bağlantısıdır; çerezde pz_sess olduğundan ziyaret kaydı yazılmaz.
+
+Sonuçlar --out ile JSON'a yazılır; --baseline ile önceki bir JSON'a göre p95,
+throughput ve sorgu sayısı karşılaştırılır, --tolerance aşılırsa çıkış kodu 1.
+
+Çalıştır:  python bench/bench_load.py --concurrency 16 --duration 10 --out bench/results/load.json
+           python bench/bench_load.py --db sqlite:///scale.db --baseline bench/results/load.json
+"""
+
+from __future__ import annotations
+import argparse, http.client, json, os, platform, random, re, signal, socket, statistics
+import subprocess, sys, tempfile, threading, time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote, urlencode, urlsplit
+
+ROOT = Path(__file__).resolve().parent.parent
+ADMIN_PASSWORD = "bench-admin"
+_DB_DESC = re.compile(r'db;[^,]*desc="(\d+)')
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="çalışan bir instance (ör. http://127.0.0.1:8000); yoksa yerel uvicorn")
+    ap.add_argument("--db", help="yerel uvicorn'un kullanacağı veritabanı URL'si")
+    ap.add_argument("--admin-password", help="--url ile admin senaryoları için (yoksa atlanır)")
+    ap.add_argument("--allow-writes", action="store_true",
+                    help="--url ile veri yazan senaryoları (admin_bulk) da koş; hedefe sahte fiyat girer")
+    ap.add_argument("--workers", type=int, default=1, help="yerel uvicorn worker sayısı")
+    ap.add_argument("--no-cache", action="store_true", help="yerel uvicorn'da sayfa/parça önbelleğini kapat")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--duration", type=float, default=10.0, help="senaryo başına ölçüm süresi (sn)")
+    ap.add_argument("--warmup", type=float, default=2.0, help="senaryo başına ısınma (sn, ölçülmez)")
+    ap.add_argument("--scenarios", help="virgülle ayrılmış senaryo adları (varsayılan hepsi)")
+    ap.add_argument("--city", default="Sakarya")
+    ap.add_argument("--district", default="Hendek")
+    ap.add_argument("--product", default="Dana Kıyma")
+    ap.add_argument("--products", type=int, default=1000, help="sentetik veri: ürün")
+    ap.add_argument("--offers", type=int, default=100_000, help="sentetik veri: teklif")
+    ap.add_argument("--visits", type=int, default=100_000, help="sentetik veri: ziyaret")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="sonuç JSON dosyası")
+    ap.add_argument("--baseline", help="karşılaştırılacak önceki sonuç JSON'u")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="izin verilen göreli kötüleşme (0.10 = %%10)")
+    return ap.parse_args()
+
+
+def scenarios(args) -> dict:
+    """ad -> (method, path, admin mi, gövde üretici)"""
+    def bulk_body(rnd: random.Random) -> bytes:
+        fields = [("store_name_single", "Migros"), ("featured", "0"), ("districts", args.district)]
+        for i in range(5):
+            fields += [("product_name", f"{args.product}" if i == 0 else f"Bench Ürün {i}"),
+                       ("price", f"{rnd.uniform(50, 600):.2f}"), ("unit", "kg"), ("store_address", ""),
+                       ("source_url", ""), ("source_weight_g", ""), ("source_unit", ""),
+                       ("category", rnd.choice(("et", "tavuk", "diger")))]
+        return urlencode(fields).encode()
+
+    return {
+        "vitrin": ("GET", "/", False, None),
+        "vitrin_et": ("GET", "/?cat=et", False, None),
+        "urun": ("GET", f"/urun?name={quote(args.product)}", False, None),
+        "magazalar": ("GET", "/magazalar", False, None),
+        "magaza": ("GET", "/magaza/Migros", False, None),
+        "admin": ("GET", "/admin", True, None),
+        "admin_stats": ("GET", "/admin/stats", True, None),
+        "admin_bulk": ("POST", "/admin/bulk", True, bulk_body),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _boot(args, db_url: str, tmpdir: Path) -> tuple:
+    port = _free_port()
+    env = {**os.environ, "PAZAR_DB": db_url, "PAZARMETRE_ADMIN": ADMIN_PASSWORD, "SERVER_TIMING": "1",
+           "WARM_SNAPSHOT_PATH": "", "SLOW_QUERY_LOG": str(tmpdir / "slow_queries.log")}
+    if args.no_cache:
+        env.update(PAGE_CACHE_TTL="0", FRAGMENT_CACHE_TTL="0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--workers", str(args.workers),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            if proc.poll() is not None:
+                raise SystemExit("uvicorn açılamadı")
+            time.sleep(0.05)
+    proc.kill()
+    raise SystemExit("uvicorn /healthz yanıt vermedi")
+
+
+def run_scenario(base: str, scenario: tuple, args, admin_password: str, seconds: float) -> dict:
+    method, path, admin, body_fn = scenario
+    url = urlsplit(base)
+    cookie = f"city={quote(args.city)}; district={quote(args.district)}; pz_sess=bench"
+    if admin:
+        cookie += f"; adm={quote(admin_password)}"
+    headers = {"Accept": "text/html", "Accept-Encoding": "gzip, br", "Cookie": cookie}
+    if body_fn is not None:
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+    lat, queries, sizes = [], [], []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(n: int):
+        rnd = random.Random(args.seed * 1000 + n)
+        my_lat, my_q, my_sz, my_err = [], [], [], 0
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        while time.perf_counter() < deadline:
+            body = body_fn(rnd) if body_fn is not None else None
+            t0 = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (OSError, http.client.HTTPException):
+                my_err += 1
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+                continue
+            my_lat.append((time.perf_counter() - t0) * 1000)
+            if resp.status >= 400:
+                my_err += 1
+            m = _DB_DESC.search(resp.getheader("server-timing") or "")
+            if m:
+                my_q.append(int(m.group(1)))
+            my_sz.append(len(data))
+        conn.close()
+        with lock:
+            lat.extend(my_lat)
+            queries.extend(my_q)
+            sizes.extend(my_sz)
+            errors[0] += my_err
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    if len(lat) < 2:
+        return {"requests": len(lat), "errors": errors[0]}
+    q = statistics.quantiles(lat, n=100, method="inclusive")
+    return {
+        "requests": len(lat), "errors": errors[0], "rps": round(len(lat) / elapsed, 1),
+        "p50_ms": round(q[49], 2), "p95_ms": round(q[94], 2), "p99_ms": round(q[98], 2),
+        "max_ms": round(max(lat), 2),
+        "db_queries": round(statistics.fmean(queries), 2) if queries else None,
+        "bytes": round(statistics.fmean(sizes)),
+    }
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Kötüleşen [(senaryo, metrik, eski, yeni)] listesi; ayrıca tabloyu yazdırır."""
+    print(f"\nbaseline karşılaştırması (tolerans %{tolerance * 100:.0f}, baseline {baseline['meta'].get('git', '?')})")
+    bad = []
+    for name, cur in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old or "p95_ms" not in old or "p95_ms" not in cur:
+            continue
+        checks = (
+            ("p95_ms", cur["p95_ms"] > old["p95_ms"] * (1 + tolerance)),
+            ("rps", cur["rps"] < old["rps"] * (1 - tolerance)),
+            ("db_queries", (cur["db_queries"] or 0) > (old["db_queries"] or 0) + 0.5),
+        )
+        flags = [m for m, worse in checks if worse]
+        bad += [(name, m, old[m], cur[m]) for m in flags]
+        print(f"{name:<12} p95 {old['p95_ms']:8.1f} → {cur['p95_ms']:8.1f} ms  "
+              f"rps {old['rps']:8.1f} → {cur['rps']:8.1f}  "
+              f"sorgu {old['db_queries']} → {cur['db_queries']}  {'KÖTÜLEŞME: ' + ','.join(flags) if flags else 'ok'}")
+    return bad
+
+
+def main():
+    args = _parse_args()
+    all_scenarios = scenarios(args)
+    names = args.scenarios.split(",") if args.scenarios else list(all_scenarios)
+    unknown = [n for n in names if n not in all_scenarios]
+    if unknown:
+        raise SystemExit(f"bilinmeyen senaryo: {', '.join(unknown)} (mevcut: {', '.join(all_scenarios)})")
+
+    tmpdir = Path(tempfile.mkdtemp(prefix="pz_bench_"))
+    proc = None
+    dataset = None
+    admin_password = args.admin_password
+    if args.url:
+        base = args.url.rstrip("/")
+    else:
+        db_url = args.db
+        if not db_url:
+            db_url = f"sqlite:///{tmpdir / 'load.db'}"
+            dataset = {"products": args.products, "offers": args.offers, "visits": args.visits, "seed": args.seed}
+            subprocess.run([sys.executable, str(ROOT / "bench" / "gen_dataset.py"), "--db", db_url,
+                            "--products", str(args.products), "--offers", str(args.offers),
+                            "--visits", str(args.visits), "--seed", str(args.seed)], check=True)
+        proc, base = _boot(args, db_url, tmpdir)
+        admin_password = ADMIN_PASSWORD
+
+    if admin_password is None:
+        skipped = [n for n in names if all_scenarios[n][2]]
+        if skipped:
+            print(f"admin parolası yok, atlanıyor: {', '.join(skipped)}")
+        names = [n for n in names if not all_scenarios[n][2]]
+    if args.url and not args.allow_writes:
+        skipped = [n for n in names if all_scenarios[n][0] != "GET"]
+        if skipped:
+            print(f"--url ile yazan senaryolar --allow-writes olmadan koşmaz, atlanıyor: {', '.join(skipped)}")
+        names = [n for n in names if all_scenarios[n][0] == "GET"]
+
+    meta = {"at": datetime.utcnow().isoformat(timespec="seconds"), "git": _git_rev(), "target": args.url or "local",
+            "db": "url" if args.url else (args.db or "synthetic"), "dataset": dataset,
+            "workers": None if args.url else args.workers, "cache": not args.no_cache,
+            "concurrency": args.concurrency, "duration": args.duration,
+            "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+    print(f"target={base} concurrency={args.concurrency} duration={args.duration}s warmup={args.warmup}s")
+    results = {}
+    try:
+        for name in names:
+            if args.warmup > 0:
+                run_scenario(base, all_scenarios[name], args, admin_password, args.warmup)
+            r = results[name] = run_scenario(base, all_scenarios[name], args, admin_password, args.duration)
+            if "p95_ms" not in r:
+                print(f"{name:<12} yetersiz yanıt ({r['requests']} istek, {r['errors']} hata)")
+                continue
+            print(f"{name:<12} {r['rps']:8.1f} istek/sn  p50={r['p50_ms']:7.1f}  p95={r['p95_ms']:7.1f}  "
+                  f"p99={r['p99_ms']:7.1f} ms  sorgu/istek={r['db_queries']}  hata={r['errors']}")
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait()
+
+    current = {"meta": meta, "results": results}
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"sonuçlar: {args.out}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if compare(current, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
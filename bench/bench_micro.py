@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+İstek başına defalarca çalışan yardımcılar için mikro benchmark'lar; sabit
+boyutlu sentetik girdilerle (varsayılan 10k teklif satırı / 10k ad):
+
+  turkish_lower             10k karışık büyük/küçük harfli Türkçe ürün adı
+  format_turkish_date_short 10k datetime
+  dedupe_by_brand_latest    10k (OfferRow, StoreRow), tek çağrı
+  only_fresh_and_latest     10k (OfferRow, StoreRow), tek çağrı
+  layout                    ~30 KB vitrin gövdesiyle tam sayfa yanıtı
+  header_right_html         üst bar sağ bloğu
+  metrics                   metrics.inc + metrics.observe (istek başına kayıt yükü)
+
+Her durum için saniyede işlem (ops/sn; işlem = yardımcının tek çağrısı),
+çağrı başına süre ve tracemalloc ile çağrı başına tepe bellek yazdırılır.
+--out ile JSON'a yazılır; --baseline ile önceki bir JSON'a göre ops/sn düşüşü ya
+da tepe bellek artışı --tolerance'ı aşarsa çıkış kodu 1.
+
+Çalıştır:  python bench/bench_micro.py --out bench/results/micro.json
+           python bench/bench_micro.py --baseline bench/results/micro.json --cases turkish_lower,dedupe_by_brand_latest
+"""
+
+from __future__ import annotations
+import argparse, json, os, platform, random, subprocess, sys, tempfile, time, tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--size", type=int, default=10_000, help="girdi satır/ad sayısı")
+    ap.add_argument("--repeat", type=int, default=5, help="en iyi turun alındığı tur sayısı")
+    ap.add_argument("--min-time", type=float, default=0.2, help="tur başına en az süre (sn)")
+    ap.add_argument("--cases", help="virgülle ayrılmış durum adları (varsayılan hepsi)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="sonuç JSON dosyası")
+    ap.add_argument("--baseline", help="karşılaştırılacak önceki sonuç JSON'u")
+    ap.add_argument("--tolerance", type=float, default=0.10, help="izin verilen göreli kötüleşme (0.10 = %%10)")
+    return ap.parse_args()
+
+
+def measure(fn, ops: int, repeat: int, min_time: float) -> dict:
+    """fn, ops adet yardımcı çağrısı yapar. En iyi turdan ops/sn, tracemalloc'tan
+    fn başına tepe bellek."""
+    fn()  # ısınma
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_time:
+            break
+        number *= 2
+    best = dt
+    for _ in range(repeat - 1):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return {"ops_per_sec": round(number * ops / best, 1), "us_per_op": round(best / (number * ops) * 1e6, 3),
+            "peak_bytes": peak, "ops": ops}
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Kötüleşen [(durum, metrik, eski, yeni)] listesi; ayrıca tabloyu yazdırır."""
+    print(f"\nbaseline karşılaştırması (tolerans %{tolerance * 100:.0f}, baseline {baseline['meta'].get('git', '?')})")
+    bad = []
+    for name, cur in current["results"].items():
+        old = baseline["results"].get(name)
+        if not old:
+            continue
+        flags = []
+        if cur["ops_per_sec"] < old["ops_per_sec"] * (1 - tolerance):
+            flags.append("ops_per_sec")
+        if cur["peak_bytes"] > old["peak_bytes"] * (1 + tolerance) + 1024:
+            flags.append("peak_bytes")
+        bad += [(name, m, old[m], cur[m]) for m in flags]
+        print(f"{name:<26} {old['ops_per_sec']:>14,.0f} → {cur['ops_per_sec']:>14,.0f} ops/sn "
+              f"({(cur['ops_per_sec'] / old['ops_per_sec'] - 1) * 100:+6.1f}%)  "
+              f"tepe {old['peak_bytes'] / 1024:8.1f} → {cur['peak_bytes'] / 1024:8.1f} KB  "
+              f"{'KÖTÜLEŞME: ' + ','.join(flags) if flags else 'ok'}")
+    return bad
+
+
+def main():
+    args = _parse_args()
+
+    # app import edilmeden önce DB'yi geçici SQLite'a yönlendir
+    tmp = Path(tempfile.mkdtemp(prefix="pz_bench_")) / "bench.db"
+    os.environ["PAZAR_DB"] = f"sqlite:///{tmp}"
+    sys.path.insert(0, str(ROOT))
+    import app as A
+    from starlette.requests import Request
+
+    rnd = random.Random(args.seed)
+    now = datetime.utcnow()
+    districts = [d["name"] for d in A.LOC_JSON["provinces"][0]["districts"]]
+    brands = ["Migros", "A101", "BİM", "Şok", "CarrefourSA", "Hakmar", "Kutsallar Kasap"]
+
+    # girdiler: 10k ad, 10k tarih, 10k (OfferRow, StoreRow)
+    bases = [p["name"] for p in A.SEED_PRODUCTS]
+    variants = (str, str.upper, str.lower, lambda s: s.replace("ı", "I").replace("i", "İ").upper())
+    names = [rnd.choice(variants)(rnd.choice(bases)) for _ in range(args.size)]
+    dates = [now - timedelta(minutes=rnd.randint(0, 60 * 24 * 60)) for _ in range(args.size)]
+    stores = [A.StoreRow(i, b if rnd.random() > 0.2 else b.upper(), "Merkez Mah.", "Sakarya", d, None)
+              for i, (d, b) in enumerate(((d, b) for d in districts for b in brands), 1)]
+    rows = [(A.OfferRow(i, rnd.randint(1, 60), st.id, round(rnd.uniform(10, 900), 2), "TRY",
+                        now - timedelta(minutes=rnd.randint(0, 60 * 24 * 14)), now,
+                        "https://example.com/p", "Merkez Mah."), st)
+            for i, st in enumerate((rnd.choice(stores) for _ in range(args.size)), 1)]
+
+    req = Request({"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                   "headers": [(b"cookie", "city=Sakarya; district=Hendek".encode())]})
+    card = ("<div class='bg-white card p-4'><div class='font-semibold'>{n}</div>"
+            "<div class='text-emerald-600 text-lg'>{p:.2f} TRY</div><div class='text-xs text-gray-500'>{b}</div></div>")
+    body = "<div class='grid gap-3'>" + "".join(card.format(n=rnd.choice(bases), p=rnd.uniform(10, 900), b=rnd.choice(brands))
+                                              for _ in range(180)) + "</div>"
+    body_bytes = body.encode("utf-8")
+    labels = (("route", "/"),)
+
+    def run_turkish_lower():
+        f = A.turkish_lower
+        for s in names:
+            f(s)
+
+    def run_format_date():
+        f = A.format_turkish_date_short
+        for d in dates:
+            f(d)
+
+    def run_metrics():
+        A.metrics.inc("pz_db_queries_total", labels)
+        A.metrics.observe("pz_http_request_duration_seconds", labels, 0.003)
+
+    cases = {
+        "turkish_lower": (run_turkish_lower, len(names)),
+        "format_turkish_date_short": (run_format_date, len(dates)),
+        "dedupe_by_brand_latest": (lambda: A.dedupe_by_brand_latest(rows), 1),
+        "only_fresh_and_latest": (lambda: A.only_fresh_and_latest(rows), 1),
+        "layout": (lambda: A.layout(req, body_bytes, "Pazarmetre | Vitrin"), 1),
+        "header_right_html": (lambda: A.header_right_html(req), 1),
+        "metrics": (run_metrics, 1),
+    }
+    selected = args.cases.split(",") if args.cases else list(cases)
+    unknown = [c for c in selected if c not in cases]
+    if unknown:
+        raise SystemExit(f"bilinmeyen durum: {', '.join(unknown)} (mevcut: {', '.join(cases)})")
+
+    try:
+        git = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True, timeout=10).stdout.strip()
+    except OSError:
+        git = ""
+    meta = {"at": datetime.utcnow().isoformat(timespec="seconds"), "git": git, "size": args.size,
+            "python": platform.python_version(), "machine": platform.machine()}
+    print(f"size={args.size} repeat={args.repeat} python={meta['python']}")
+    results = {}
+    for name in selected:
+        fn, ops = cases[name]
+        r = results[name] = measure(fn, ops, args.repeat, args.min_time)
+        print(f"{name:<26} {r['ops_per_sec']:>14,.0f} ops/sn  {r['us_per_op']:>10.3f} µs/op  "
+              f"tepe {r['peak_bytes'] / 1024:8.1f} KB/çağrı")
+
+    current = {"meta": meta, "results": results}
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.out).write_text(json.dumps(current, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"sonuçlar: {args.out}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if compare(current, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
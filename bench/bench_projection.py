@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Kolon projeksiyonu benchmark'ı: public sayfaların okuma sorguları
+tam ORM nesnesi (select(Offer, Store, Product)) ile mi, yoksa sadece gereken
+kolonları seçen fetch_offer_store_rows() ile mi daha hızlı?
+
+Geçici bir SQLite veritabanına sentetik veri basar, iki yolu aynı filtrelerle
+çalıştırır; süre (ms) ve tracemalloc tepe belleğini yazdırır.
+
+Çalıştır:  python bench/bench_projection.py --offers 20000 --repeat 20
+"""
+
+from __future__ import annotations
+import argparse, os, random, statistics, sys, tempfile, time, tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--offers", type=int, default=20000, help="ilçedeki toplam teklif sayısı")
+    ap.add_argument("--products", type=int, default=400)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=42)
+    return ap.parse_args()
+
+
+def main():
+    args = _parse_args()
+
+    # app import edilmeden önce DB'yi geçici SQLite'a yönlendir
+    tmp = Path(tempfile.mkdtemp(prefix="pz_bench_")) / "bench.db"
+    os.environ["PAZAR_DB"] = f"sqlite:///{tmp}"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import app as A
+    from sqlmodel import select
+
+    rnd = random.Random(args.seed)
+    city, dist = "Sakarya", "Hendek"
+    brands = ["Migros", "A101", "BİM", "Şok", "CarrefourSA", "Kutsallar Kasap"]
+    now = datetime.utcnow()
+
+    with A.get_session() as s:
+        conn = s.connection()
+        conn.execute(A.Product.__table__.insert(), [
+            {"name": f"Ürün {i}", "unit": "kg", "featured": True, "category": rnd.choice(["et", "tavuk", "diger"]),
+             "is_active": True, "created_by": "bench", "created_at": now}
+            for i in range(args.products)
+        ])
+        conn.execute(A.Store.__table__.insert(), [
+            {"name": b, "city": city, "district": d}
+            for d in (dist, "Akyazı") for b in brands
+        ])
+        store_ids = [r[0] for r in conn.execute(select(A.Store.id))]
+        conn.execute(A.Offer.__table__.insert(), [
+            {"product_id": rnd.randint(1, args.products), "store_id": rnd.choice(store_ids),
+             "price": round(rnd.uniform(10, 900), 2), "currency": "TRY", "quantity": 1.0,
+             "created_at": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 30)),
+             "updated_at": now, "approved": True, "source_mismatch": False,
+             "source_url": "https://example.com/p", "branch_address": "Merkez Mah."}
+            for _ in range(args.offers)
+        ])
+        s.commit()
+
+    def entity_path():
+        with A.get_session() as s:
+            rows = s.exec(
+                select(A.Offer, A.Store, A.Product)
+                .join(A.Store, A.Offer.store_id == A.Store.id)
+                .join(A.Product, A.Offer.product_id == A.Product.id)
+                .where(A.Offer.approved == True, A.Store.city == city, A.Store.district == dist)
+                .order_by(A.Offer.price.asc(), A.Offer.created_at.desc())
+            ).all()
+            return A.only_fresh_and_latest([(o, st) for (o, st, _p) in rows])
+
+    def projection_path():
+        with A.get_session() as s:
+            rows = A.fetch_offer_store_rows(
+                s,
+                A.Offer.approved == True, A.Store.city == city, A.Store.district == dist,
+                order_by=(A.Offer.price.asc(), A.Offer.created_at.desc()),
+                with_product=True,
+            )
+            return A.only_fresh_and_latest([(o, st) for (o, st, _p) in rows])
+
+    def measure(fn):
+        fn()  # ısınma
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - t0) * 1000)
+        tracemalloc.start()
+        fn()
+        _cur, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return statistics.median(times), min(times), peak / 1024 / 1024
+
+    assert len(entity_path()) == len(projection_path())
+
+    print(f"offers={args.offers} products={args.products} repeat={args.repeat}")
+    res = {}
+    for name, fn in (("entity", entity_path), ("projection", projection_path)):
+        med, best, peak = measure(fn)
+        res[name] = med
+        print(f"{name:<11} median={med:8.2f} ms  min={best:8.2f} ms  peak_mem={peak:7.2f} MB")
+    print(f"speedup     x{res['entity'] / res['projection']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
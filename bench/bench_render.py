@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Sayfa birleştirme benchmark'ı: vitrin (/) ve ürün detay (/urun) için
+istek başına render süresi, eski yol ile yeni yol karşılaştırması.
+
+  eski : gövde her istekte yeniden üretilir, seçici HTML'i yeniden kurulur,
+         kabuk str olarak birleştirilip yanıtta encode edilir, /urun admin
+         scripti gövdeye satır içi gömülür
+  yeni : gövde parçası önbellekten bayt olarak gelir, kabuk açılışta
+         encode edilmiş parçalardan b"".join ile birleştirilir
+  soğuk: yeni birleştirme, ama gövde önbellek kaçırmış gibi her seferinde üretilir
+  kabuk: aynı önceden üretilmiş gövdeyle yalnız birleştirme; legacy_layout ile
+         layout karşılaştırması. Bu değişikliğin kazancı buradaki x oranıdır;
+         "yeni" satırı parça önbelleği isabetidir, kabuk kazancı değildir
+
+Geçici bir SQLite veritabanına sentetik veri basar; süreleri (µs) yazdırır.
+
+Çalıştır:  python bench/bench_render.py --offers 5000 --repeat 300
+"""
+
+from __future__ import annotations
+import argparse, os, random, statistics, sys, tempfile, time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--offers", type=int, default=5000, help="ilçedeki toplam teklif sayısı")
+    ap.add_argument("--products", type=int, default=120)
+    ap.add_argument("--repeat", type=int, default=300)
+    ap.add_argument("--seed", type=int, default=42)
+    return ap.parse_args()
+
+
+def main():
+    args = _parse_args()
+
+    # app import edilmeden önce DB'yi geçici SQLite'a yönlendir
+    tmp = Path(tempfile.mkdtemp(prefix="pz_bench_")) / "bench.db"
+    os.environ["PAZAR_DB"] = f"sqlite:///{tmp}"
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import app as A
+    from sqlmodel import select
+    from starlette.requests import Request
+
+    rnd = random.Random(args.seed)
+    city, dist = "Sakarya", "Hendek"
+    brands = ["Migros", "A101", "BİM", "Şok", "CarrefourSA", "Kutsallar Kasap"]
+    now = datetime.utcnow()
+
+    with A.get_session() as s:
+        conn = s.connection()
+        conn.execute(A.Product.__table__.insert(), [
+            {"name": f"Ürün {i}", "unit": "kg", "featured": True, "category": rnd.choice(["et", "tavuk", "diger"]),
+             "is_active": True, "created_by": "bench", "created_at": now}
+            for i in range(args.products)
+        ])
+        conn.execute(A.Store.__table__.insert(), [
+            {"name": b, "city": city, "district": dist, "address": "Merkez Mah."} for b in brands
+        ])
+        store_ids = [r[0] for r in conn.execute(select(A.Store.id))]
+        conn.execute(A.Offer.__table__.insert(), [
+            {"product_id": rnd.randint(1, args.products), "store_id": rnd.choice(store_ids),
+             "price": round(rnd.uniform(10, 900), 2), "currency": "TRY", "quantity": 1.0,
+             "created_at": now - timedelta(minutes=rnd.randint(0, 60 * 24 * 5)),
+             "updated_at": now, "approved": True, "source_mismatch": False,
+             "source_url": "https://example.com/p", "branch_address": "Merkez Mah."}
+            for _ in range(args.offers)
+        ])
+        s.commit()
+    A.catalog.load()
+
+    req = Request({"type": "http", "method": "GET", "path": "/", "query_string": b"",
+                   "headers": [(b"cookie", f"city={city}; district={dist}".encode())]})
+    product_name = "Ürün 1"
+    # eskiden /urun admin scripti her yanıta satır içi gömülürdü
+    legacy_js = "<script>\n" + (A.STATIC_DIR / "js" / "product-admin.js").read_text("utf-8") + "</script>\n"
+
+    def legacy_layout(body: str, title: str) -> bytes:
+        # 031/032 öncesi: seçici HTML her istekte kurulur, tüm belge str olarak
+        # birleştirilip yanıt aşamasında encode edilir
+        p = A._SHELL_PARTS
+        right = A._build_header_right()
+        html = "".join((p[0], title, p[1], p[2], body, p[3], str(datetime.utcnow().year), p[4],
+                        A.personal_fragment_html(req), p[5]))
+        html = html.replace(A._HEADER_RIGHT_HTML, right, 1)
+        return html.encode("utf-8")
+
+    def old_vitrin():
+        title, body = A.render_vitrin(city, dist, None, "hepsi")
+        return legacy_layout(body, title)
+
+    def new_vitrin():
+        title, body = A.cached_fragment(("vitrin", city, dist, "", "hepsi"),
+                                        lambda: A.render_vitrin(city, dist, None, "hepsi"))
+        return A.layout(req, body, title).body
+
+    def old_urun():
+        title, body, _tail = A.render_product(product_name, city, dist, None, False)
+        return legacy_layout(body + legacy_js, title)
+
+    def new_urun():
+        title, body, tail = A.cached_fragment(("urun", city, dist, "", product_name, False),
+                                              lambda: A.render_product(product_name, city, dist, None, False))
+        return A.layout(req, body, title, tail=tail).body
+
+    def cold_vitrin():
+        title, body = A.render_vitrin(city, dist, None, "hepsi")
+        return A.layout(req, body, title).body
+
+    def cold_urun():
+        title, body, tail = A.render_product(product_name, city, dist, None, False)
+        return A.layout(req, body, title, tail=tail).body
+
+    v_title, v_body = A.render_vitrin(city, dist, None, "hepsi")
+    u_title, u_body, u_tail = A.render_product(product_name, city, dist, None, False)
+
+    def shell_old_vitrin():
+        return legacy_layout(v_body, v_title)
+
+    def shell_new_vitrin():
+        return A.layout(req, v_body, v_title).body
+
+    def shell_old_urun():
+        return legacy_layout(u_body, u_title)
+
+    def shell_new_urun():
+        return A.layout(req, u_body, u_title, tail=u_tail).body
+
+    def measure(fn):
+        fn()  # ısınma (yeni yolda önbelleği doldurur)
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - t0) * 1e6)
+        return statistics.median(times), min(times)
+
+    assert old_vitrin() == new_vitrin() == cold_vitrin() == shell_old_vitrin() == shell_new_vitrin()
+    # eski /urun yalnız satır içi admin scriptiyle ayrışır
+    assert old_urun().replace(legacy_js.encode("utf-8"), b"", 1) == new_urun() == cold_urun()
+    assert shell_old_urun() == shell_new_urun() == new_urun()
+
+    print(f"offers={args.offers} products={args.products} repeat={args.repeat}")
+    cases = (("vitrin", shell_old_vitrin, shell_new_vitrin, old_vitrin, cold_vitrin, new_vitrin),
+             ("urun", shell_old_urun, shell_new_urun, old_urun, cold_urun, new_urun))
+    for page, sh_old, sh_new, old, cold, new in cases:
+        so_med, _ = measure(sh_old)
+        sn_med, sn_min = measure(sh_new)
+        o_med, _ = measure(old)
+        c_med, _ = measure(cold)
+        n_med, _ = measure(new)
+        print(f"{page:<7} kabuk: eski={so_med:8.1f} µs  yeni={sn_med:8.1f} µs (min {sn_min:.1f})  "
+              f"x{so_med / sn_med:.2f}  ({len(new())} B)")
+        print(f"{'':<7} tam  : eski={o_med:10.1f} µs  soğuk={c_med:10.1f} µs  x{o_med / c_med:.2f}  "
+              f"(önbellek isabeti {n_med:.1f} µs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Visit tablosundan trafik tekrar oynatma: gerçek path/ilçe dağılımımızla
+kapasite ölçümü.
+
+  export : bir zaman aralığındaki Visit satırlarını (ts, path, visitor_hash)
+           JSON Lines'a yazar. İlk satır meta: aralık, /urun için ürün adları
+           (Visit.path sorgu dizesini tutmaz) ve mağazalardan il/ilçe listesi.
+           app import edilmez (şema migration'ları çalışmaz); DB'ye sadece
+           SELECT atılır, ip_hash dışarı çıkmaz. Tekrar oynatmanın kendi
+           yazdığı satırlar (User-Agent pazarmetre-replay) alınmaz.
+  replay : dosyayı hedef instance'a ziyaretler arası süreleri koruyarak 1x ya da
+           --speed katı hızla oynatır. Ziyaretçi (visitor_hash) başına çerez
+           kutusu tutulur: il/ilçe çerezi ziyaretçinin kendi ilçe path'inden ya
+           da gözlenen ilçe dağılımından seçilir, yanıtların Set-Cookie'leri
+           aynı ziyaretçinin sonraki isteklerinde gönderilir. Path ailesi
+           başına p50/p95/p99 gecikme, hata ve zamanlama gecikmesi (hedef
+           yetişemediğinde artar) raporlanır.
+
+Hedefin Visit tablosu varsayılan olarak kirletilmez: her ziyaretçi
+pz_sess=replay-<hash> çereziyle başlar, log_visit de çerezli isteği yazmaz.
+--write-visits ile çerez verilmez; hedef ziyaretçi başına bir kez (ilk
+yanıtta pz_sess atayıp) Visit yazar, üretimdeki gibi.
+
+Sınır: log_visit yalnızca pz_sess çerezi olmayan istekleri yazar, yani Visit
+çoğunlukla oturumların ilk sayfasıdır. Tekrar oynatılan trafik bu yüzden
+ağırlıkla oturum girişleridir; oturum içi gezinme (ürün detayları, kategori
+geçişleri) ve gerçek toplam istek hacmi içinde yoktur.
+
+Çalıştır:  python bench/replay_visits.py export --db "$PAZAR_DB" --since 2026-10-18T08:00 --until 2026-10-18T20:00 --out visits.jsonl
+           python bench/replay_visits.py replay --input visits.jsonl --url http://127.0.0.1:8000 --speed 10
+"""
+
+from __future__ import annotations
+import argparse, http.client, json, random, re, statistics, threading, time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import CookieError, SimpleCookie
+from datetime import datetime, timedelta
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+_SLUG_TRANS = str.maketrans("çğıöşüâîû", "cgiosuaiu")
+# (aile, desen) — ilk eşleşen kazanır
+FAMILIES = [
+    ("/", re.compile(r"^/$")),
+    ("/urun", re.compile(r"^/urun$")),
+    ("/magazalar", re.compile(r"^/magazalar$")),
+    ("/magaza/*", re.compile(r"^/magaza/[^/]+$")),
+    ("/il/ilçe/", re.compile(r"^/[a-z0-9-]+/[a-z0-9-]+/$")),
+    ("/il/ilçe/urun/*", re.compile(r"^/[a-z0-9-]+/[a-z0-9-]+/urun/[^/]+$")),
+    ("/il/ilçe/magaza/*", re.compile(r"^/[a-z0-9-]+/[a-z0-9-]+/magaza/[^/]+$")),
+    ("/lokasyon", re.compile(r"^/lokasyon")),
+    ("/admin*", re.compile(r"^/admin")),
+]
+_DISTRICT_PATH = re.compile(r"^/([a-z0-9-]+)/([a-z0-9-]+)/")
+REPLAY_UA = "pazarmetre-replay"
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ex = sub.add_parser("export", help="Visit aralığını JSON Lines'a yaz")
+    ex.add_argument("--db", required=True, help="SQLAlchemy URL (PAZAR_DB)")
+    ex.add_argument("--since", help="başlangıç (ISO, UTC); varsayılan --until'den --hours önce")
+    ex.add_argument("--until", help="bitiş (ISO, UTC); varsayılan şimdi")
+    ex.add_argument("--hours", type=float, default=24.0)
+    ex.add_argument("--out", required=True)
+
+    rp = sub.add_parser("replay", help="dosyayı hedefe oynat")
+    rp.add_argument("--input", required=True)
+    rp.add_argument("--url", required=True, help="hedef (ör. http://127.0.0.1:8000)")
+    rp.add_argument("--speed", type=float, default=1.0, help="hız katı (10 = 10x hızlı)")
+    rp.add_argument("--concurrency", type=int, default=64, help="aynı anda en fazla istek")
+    rp.add_argument("--limit", type=int, help="en fazla bu kadar ziyaret")
+    rp.add_argument("--seed", type=int, default=42)
+    rp.add_argument("--write-visits", action="store_true",
+                    help="pz_sess göndermeden oyna; hedef Visit satırı yazar (analitiği kirletir)")
+    rp.add_argument("--out", help="sonuç JSON dosyası")
+    return ap.parse_args()
+
+
+def slugify(s: str) -> str:
+    """app.slugify ile aynı: "Söğütlü" -> "sogutlu"."""
+    s = (s or "").replace("İ", "i").replace("I", "ı").lower().translate(_SLUG_TRANS)
+    return re.sub(r"[^a-z0-9]+", "-", s).strip("-")
+
+
+def family(path: str) -> str:
+    for name, pattern in FAMILIES:
+        if pattern.match(path):
+            return name
+    return "diğer"
+
+
+def export(args):
+    from sqlalchemy import create_engine, text
+
+    until = datetime.fromisoformat(args.until) if args.until else datetime.utcnow()
+    since = datetime.fromisoformat(args.since) if args.since else until - timedelta(hours=args.hours)
+    engine = create_engine(args.db)
+    n = 0
+    with engine.connect() as conn, open(args.out, "w", encoding="utf-8") as f:
+        products = [r[0] for r in conn.execute(text(
+            "SELECT name FROM product WHERE featured AND (is_active OR is_active IS NULL) ORDER BY id"))]
+        locations = [list(r) for r in conn.execute(text(
+            "SELECT DISTINCT city, district FROM store WHERE city IS NOT NULL AND district IS NOT NULL "
+            "ORDER BY city, district"))]
+        f.write(json.dumps({"meta": {"since": since.isoformat(), "until": until.isoformat(),
+                                     "products": products, "locations": locations}}, ensure_ascii=False) + "\n")
+        rows = conn.execution_options(stream_results=True).execute(text(
+            "SELECT ts, path, visitor_hash FROM visit WHERE ts >= :since AND ts < :until "
+            "AND (ua IS NULL OR ua != :ua) ORDER BY ts, id"),
+            {"since": since, "until": until, "ua": REPLAY_UA})
+        for ts, path, visitor in rows:
+            if isinstance(ts, str):
+                ts = datetime.fromisoformat(ts)
+            f.write(json.dumps({"ts": ts.isoformat(), "path": path, "visitor": (visitor or "")[:16]},
+                               ensure_ascii=False) + "\n")
+            n += 1
+    print(f"{n} ziyaret yazıldı: {args.out} ({since.isoformat()} – {until.isoformat()}), "
+          f"{len(products)} ürün adı, {len(locations)} ilçe")
+
+
+class Visitor:
+    __slots__ = ("cookies", "lock")
+
+    def __init__(self, cookies: dict):
+        self.cookies = cookies
+        self.lock = threading.Lock()
+
+
+def replay(args):
+    lines = Path(args.input).read_text(encoding="utf-8").splitlines()
+    meta = json.loads(lines[0])["meta"]
+    visits = [json.loads(l) for l in lines[1:]]
+    if args.limit:
+        visits = visits[:args.limit]
+    if not visits:
+        raise SystemExit("oynatılacak ziyaret yok")
+
+    rnd = random.Random(args.seed)
+    products = meta["products"] or ["Dana Kıyma"]
+    by_slug = {(slugify(c), slugify(d)): (c, d) for c, d in meta["locations"]}
+    # ziyaretçinin ilçesi: kendi ilçe path'i, yoksa gözlenen ilçe path dağılımından
+    own: dict = {}
+    seen = Counter()
+    for v in visits:
+        m = _DISTRICT_PATH.match(v["path"])
+        loc = by_slug.get((m.group(1), m.group(2))) if m else None
+        if loc:
+            own.setdefault(v["visitor"], loc)
+            seen[loc] += 1
+    pool = list(seen) or [tuple(l) for l in meta["locations"]] or [("Sakarya", "Hendek")]
+    weights = [seen[l] or 1 for l in pool]
+    visitors: dict = {}
+    for v in visits:
+        if v["visitor"] not in visitors:
+            city, dist = own.get(v["visitor"]) or rnd.choices(pool, weights)[0]
+            jar = {"city": quote(city), "district": quote(dist)}
+            if not args.write_visits:
+                jar["pz_sess"] = f"replay-{v['visitor'] or len(visitors)}"
+            visitors[v["visitor"]] = Visitor(jar)
+        # Visit.path çözülmüş haldedir (/magaza/BİM); http.client ASCII ister
+        v["path"] = quote(v["path"], safe="/?=&%")
+        # Visit.path sorgu dizesini tutmaz; /urun için ürün adı seçilir
+        if v["path"] == "/urun":
+            v["path"] = f"/urun?name={quote(rnd.choice(products))}"
+
+    target = urlsplit(args.url)
+    conn_cls = http.client.HTTPSConnection if target.scheme == "https" else http.client.HTTPConnection
+    local = threading.local()
+    results: list = []  # (aile, ms, status, gecikme ms)
+    res_lock = threading.Lock()
+
+    def send(v: dict, due: float):
+        lag = (time.perf_counter() - due) * 1000
+        visitor = visitors[v["visitor"]]
+        with visitor.lock:
+            cookie = "; ".join(f"{k}={val}" for k, val in visitor.cookies.items())
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = conn_cls(target.hostname, target.port, timeout=60)
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", v["path"], headers={"Accept": "text/html", "Accept-Encoding": "gzip, br",
+                                                    "Cookie": cookie, "User-Agent": REPLAY_UA})
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+            set_cookie = resp.getheader("set-cookie")
+        except Exception:  # her ziyaret bir sonuç yazsın; bağlantı yarım istekte kalmasın
+            conn.close()
+            local.conn = None
+            status, set_cookie = 0, None
+        ms = (time.perf_counter() - t0) * 1000
+        if set_cookie:
+            jar = SimpleCookie()
+            try:
+                jar.load(set_cookie)
+            except CookieError:
+                jar = {}
+            with visitor.lock:
+                visitor.cookies.update({k: m.value for k, m in jar.items()})
+        with res_lock:
+            results.append((family(v["path"].split("?", 1)[0]), ms, status, lag))
+
+    t_first = datetime.fromisoformat(visits[0]["ts"])
+    span = (datetime.fromisoformat(visits[-1]["ts"]) - t_first).total_seconds()
+    print(f"{len(visits)} ziyaret, {len(visitors)} ziyaretçi, "
+          f"{'Visit yazılır' if args.write_visits else 'Visit yazılmaz (pz_sess=replay-*)'}, kayıt süresi {span / 60:.1f} dk, "
+          f"hız {args.speed}x → ~{span / args.speed / 60:.1f} dk")
+    start = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool_ex:
+        for v in visits:
+            due = start + (datetime.fromisoformat(v["ts"]) - t_first).total_seconds() / args.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool_ex.submit(send, v, due))
+    elapsed = time.perf_counter() - start
+    failed = [f.exception() for f in futures if f.exception() is not None]
+    if failed or len(results) != len(futures):
+        print(f"WARN replay: {len(futures)} gönderildi, {len(results)} sonuç; ilk hata: {failed[:1]!r}")
+
+    def summary(rows: list) -> dict:
+        ms = [r[1] for r in rows if r[2]]
+        out = {"requests": len(rows), "errors": sum(1 for r in rows if r[2] == 0 or r[2] >= 500),
+               "client_errors": sum(1 for r in rows if 400 <= r[2] < 500)}
+        if ms:
+            q = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) >= 2 else ms * 99
+            out.update(p50_ms=round(q[49], 2), p95_ms=round(q[94], 2), p99_ms=round(q[98], 2),
+                       max_ms=round(max(ms), 2))
+        lags = [r[3] for r in rows]
+        if lags:
+            q = statistics.quantiles(lags, n=100, method="inclusive") if len(lags) >= 2 else lags * 99
+            out["lag_p95_ms"] = round(q[94], 2)
+        return out
+
+    fams: dict = {}
+    for r in results:
+        fams.setdefault(r[0], []).append(r)
+    report = {"meta": {**{k: meta[k] for k in ("since", "until")}, "target": args.url, "speed": args.speed,
+                       "visits": len(visits), "visitors": len(visitors),
+                       "traffic": "session_entries_only", "write_visits": args.write_visits, "elapsed_s": round(elapsed, 1),
+                       "unrecorded": len(futures) - len(results)},
+              "total": {**summary(results), "rps": round(len(results) / elapsed, 1)},
+              "families": {name: summary(rows) for name, rows in sorted(fams.items(), key=lambda x: -len(x[1]))}}
+
+    print(f"\n{'aile':<20} {'istek':>7} {'hata':>5} {'4xx':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'gecikme p95':>12}")
+    for name, s in (*report["families"].items(), ("TOPLAM", report["total"])):
+        print(f"{name:<20} {s['requests']:>7} {s['errors']:>5} {s['client_errors']:>5} "
+              f"{s.get('p50_ms', 0):>8.1f} {s.get('p95_ms', 0):>8.1f} {s.get('p99_ms', 0):>8.1f} "
+              f"{s.get('lag_p95_ms', 0):>12.1f}")
+    print(f"{report['total']['rps']} istek/sn, {elapsed:.1f} sn")
+    print("not: Visit çoğunlukla oturum girişlerini tutar; oturum içi istekler bu yüke dahil değil")
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"sonuçlar: {args.out}")
+
+
+def main():
+    args = _parse_args()
+    if args.cmd == "export":
+        export(args)
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()
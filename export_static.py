@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Statik export: her ilçe için vitrin (kategori başına), ürün detay ve marka
+sayfalarını dosya ağacına yazar. Sadece verisi değişen sayfalar yeniden
+render edilir (manifest.json imzaları); --force hepsini yeniden üretir.
+
+Çalıştır:  python export_static.py --out export --workers 4
+Sunmak için:  STATIC_EXPORT_DIR=export uvicorn app:app
+Kontrol:  python export_static.py --out export --check
+          (export sonrası açılan yeni bir süreç gibi; sunulmayacak sayfa varsa çıkış 1)
+"""
+
+from __future__ import annotations
+import argparse, os, sys
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--out", default=os.environ.get("STATIC_EXPORT_DIR") or "export")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--force", action="store_true", help="imzalara bakmadan tüm sayfaları üret")
+    ap.add_argument("--check", action="store_true", help="export etme; mevcut ağaçtan sunulacak sayfaları say")
+    args = ap.parse_args()
+
+    if args.check:
+        os.environ["STATIC_EXPORT_DIR"] = args.out
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as A
+
+    if args.check:
+        return check(A)
+
+    A.catalog.load()
+    res = A.export_static_site(args.out, workers=args.workers, force=args.force)
+    print(f"sayfa={res['pages']} render={res['rendered']} atlanan={res['skipped']} "
+          f"silinen={res['removed']} süre={res['seconds']}s")
+    for rel, err in res["errors"]:
+        print(f"HATA {rel}: {err}")
+    return 1 if res["errors"] else 0
+
+
+def check(A) -> int:
+    """Açılıştaki gibi DB'den ilçe zamanlarını yükleyip manifest'teki her sayfayı dener."""
+    A.district_versions.load()
+    A.static_export.page("", "", "")  # manifest'i yükle
+    pages = A.static_export.pages
+    stale = [rel for rel, meta in pages.items() if A.static_export.page(rel, *meta["district"]) is None]
+    print(f"sayfa={len(pages)} sunulur={len(pages) - len(stale)} sunulmaz={len(stale)}")
+    for rel in stale[:20]:
+        print(f"SUNULMAZ {rel}")
+    return 1 if stale or not pages else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
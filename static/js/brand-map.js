@@ -0,0 +1,40 @@
+/* Pazarmetre – mağaza şubeleri haritası ve yakındaki şubeler */
+const BR = JSON.parse(document.getElementById('branchData').textContent);
+let map, markers=[];
+function initMap(){
+  const center = BR.length ? [BR[0].lat, BR[0].lng] : [40.78, 30.40];
+  map = L.map('map').setView(center, 13);
+  L.tileLayer('https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png', {
+    maxZoom: 19, attribution: '&copy; OpenStreetMap'
+  }).addTo(map);
+  BR.forEach(p=>{
+    const m = L.marker([p.lat, p.lng]).addTo(map)
+      .bindPopup(`<b>${p.name}</b><br>${p.address||''}`);
+    markers.push(m);
+  });
+  if (markers.length > 1){
+    const g = L.featureGroup(markers); map.fitBounds(g.getBounds().pad(0.2));
+  }
+}
+function distKm(lat1, lon1, lat2, lon2){
+  if(!lat1||!lon1||!lat2||!lon2) return null;
+  const R=6371, toRad=d=>d*Math.PI/180;
+  const dLat=toRad(lat2-lat1), dLon=toRad(lon2-lon1);
+  const a=Math.sin(dLat/2)**2 + Math.cos(toRad(lat1))*Math.cos(toRad(lat2))*Math.sin(dLon/2)**2;
+  return R*2*Math.atan2(Math.sqrt(a), Math.sqrt(1-a));
+}
+function showNearby(){
+  if(!navigator.geolocation){ alert('Konum desteklenmiyor'); return; }
+  navigator.geolocation.getCurrentPosition(pos=>{
+    const myLat=pos.coords.latitude, myLng=pos.coords.longitude;
+    if(map) map.setView([myLat,myLng], 13);
+    document.querySelectorAll('[data-lat]').forEach(el=>{
+      const lat=parseFloat(el.getAttribute('data-lat')), lng=parseFloat(el.getAttribute('data-lng'));
+      if(!isNaN(lat) && !isNaN(lng)){
+        const d=distKm(myLat,myLng,lat,lng);
+        if(d) el.textContent = '📍 Size uzaklık: ~' + d.toFixed(1) + ' km';
+      }
+    });
+  }, ()=>alert('Konum alınamadı'));
+}
+window.addEventListener('load', initMap);
@@ -0,0 +1,28 @@
+/* Pazarmetre – başlıktaki il/ilçe seçicisi */
+(function(){
+  const qs=id=>document.getElementById(id);
+  const cookies = Object.fromEntries(
+    document.cookie.split('; ').filter(Boolean).map(s=>s.split('='))
+  );
+  const citySel = qs('cityQuick');
+  const distSel = qs('distQuick');
+
+  // Çerezsiz ilçe sayfalarında (/sakarya/hendek/...) lokasyon sayfadan gelir
+  const pageLoc = document.querySelector('meta[name="pz-loc"]');
+  if(pageLoc){
+    const [c, d] = pageLoc.content.split('|');
+    citySel.value = c; distSel.value = d;
+  }else{
+    if(cookies.city) citySel.value = decodeURIComponent(cookies.city);
+    if(cookies.district) distSel.value = decodeURIComponent(cookies.district);
+  }
+
+  function go(){
+    const next = encodeURIComponent(location.pathname + location.search);
+    location.href =
+      `/setloc?city=${encodeURIComponent(citySel.value)}&district=${encodeURIComponent(distSel.value)}&next=${next}`;
+  }
+
+  citySel.addEventListener('change', go);
+  distSel.addEventListener('change', go);
+})();
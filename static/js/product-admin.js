@@ -0,0 +1,202 @@
+/* Pazarmetre – ürün detay admin araçları (düzenle / sil modalları) */
+/* =======================
+MODAL: SİL
+======================= */
+function showDelModal(id, btn){
+const old = document.getElementById("pm-del-modal");
+if(old) old.remove();
+
+const wrap = document.createElement("div");
+wrap.id = "pm-del-modal";
+wrap.className = "fixed inset-0 z-50 flex items-center justify-center bg-black/40 p-4";
+
+wrap.innerHTML = `
+    <div class="w-full max-w-md rounded-2xl bg-white shadow-xl p-5">
+    <div class="text-lg font-semibold mb-2">Silme işlemi nasıl uygulansın?</div>
+    <div class="text-sm text-gray-600 mb-4">
+        <b>Bu ilçe</b> sadece seçili ilçedeki kaydı siler.<br/>
+        <b>Bütün ilçeler</b> aynı kaydı tüm ilçelerden kaldırır.
+    </div>
+
+    <div class="flex flex-col gap-2">
+        <button id="pm-del-local"
+        class="w-full rounded-xl px-4 py-2 bg-gray-900 text-white hover:bg-gray-800">
+        Bu ilçe
+        </button>
+
+        <button id="pm-del-all"
+        class="w-full rounded-xl px-4 py-2 bg-red-600 text-white hover:bg-red-700">
+        Bütün ilçeler
+        </button>
+
+        <button id="pm-del-cancel"
+        class="w-full rounded-xl px-4 py-2 bg-gray-100 text-gray-800 hover:bg-gray-200">
+        Vazgeç
+        </button>
+    </div>
+    </div>
+`;
+
+wrap.addEventListener("click", (e) => {
+    if(e.target === wrap) wrap.remove();
+});
+
+document.body.appendChild(wrap);
+
+document.getElementById("pm-del-cancel").onclick = () => wrap.remove();
+
+document.getElementById("pm-del-local").onclick = async () => {
+    wrap.remove();
+    await delOffer(id, btn, "local");
+};
+
+document.getElementById("pm-del-all").onclick = async () => {
+    const ok = confirm("Emin misin?\\nBu kayıt TÜM ilçelerde silinecek!");
+    if(!ok) return;
+    wrap.remove();
+    await delOffer(id, btn, "all");
+};
+}
+
+async function delOffer(id, btn, scope){
+const fd = new FormData();
+fd.append("offer_id", id);
+fd.append("scope", scope);
+
+const r = await fetch("/admin/del", {
+    method: "POST",
+    body: fd,
+    credentials: "same-origin"
+});
+
+if(r.status === 401){
+    alert("Admin oturumu yok / süre dolmuş. Giriş ekranına yönlendiriyorum.");
+    location.href = "/admin/login";
+    return;
+}
+
+if(r.ok){
+    if(scope === "local"){
+    const tr = btn.closest("tr");
+    if(tr) tr.remove();
+    } else {
+    location.reload();
+    }
+} else {
+    alert("Silinemedi");
+}
+}
+
+/* =======================
+MODAL: DÜZENLE (scope seçimi)
+======================= */
+function showEditModal(payload){
+// payload: {id, price, url, addr}
+const old = document.getElementById("pm-edit-modal");
+if(old) old.remove();
+
+const wrap = document.createElement("div");
+wrap.id = "pm-edit-modal";
+wrap.className = "fixed inset-0 z-50 flex items-center justify-center bg-black/40 p-4";
+
+wrap.innerHTML = `
+    <div class="w-full max-w-md rounded-2xl bg-white shadow-xl p-5">
+    <div class="text-lg font-semibold mb-2">Düzenleme nasıl uygulansın?</div>
+    <div class="text-sm text-gray-600 mb-4">
+        <b>Bu ilçe</b> sadece seçili ilçedeki kaydı günceller.<br/>
+        <b>Bütün ilçeler</b> aynı ürün + aynı market için tüm ilçeleri günceller.
+    </div>
+
+    <div class="flex flex-col gap-2">
+        <button id="pm-edit-local"
+        class="w-full rounded-xl px-4 py-2 bg-gray-900 text-white hover:bg-gray-800">
+        Bu ilçe
+        </button>
+
+        <button id="pm-edit-all"
+        class="w-full rounded-xl px-4 py-2 bg-indigo-600 text-white hover:bg-indigo-700">
+        Bütün ilçeler
+        </button>
+
+        <button id="pm-edit-cancel"
+        class="w-full rounded-xl px-4 py-2 bg-gray-100 text-gray-800 hover:bg-gray-200">
+        Vazgeç
+        </button>
+    </div>
+    </div>
+`;
+
+wrap.addEventListener("click", (e) => {
+    if(e.target === wrap) wrap.remove();
+});
+
+document.body.appendChild(wrap);
+
+document.getElementById("pm-edit-cancel").onclick = () => wrap.remove();
+
+document.getElementById("pm-edit-local").onclick = async () => {
+    wrap.remove();
+    await applyEdit(payload, "local");
+};
+
+document.getElementById("pm-edit-all").onclick = async () => {
+    const ok = confirm("Emin misin?\\nBu değişiklik TÜM ilçelere uygulanacak!");
+    if(!ok) return;
+    wrap.remove();
+    await applyEdit(payload, "all");
+};
+}
+
+async function applyEdit(payload, scope){
+const fd = new FormData();
+fd.append("offer_id", payload.id);
+fd.append("price", payload.price);
+fd.append("source_url", payload.url);
+fd.append("branch_address", payload.addr);
+fd.append("scope", scope);
+
+const r = await fetch("/admin/edit", {
+    method: "POST",
+    body: fd,
+    credentials: "same-origin"
+});
+
+if(r.status === 401){
+    alert("Admin oturumu yok / süre dolmuş. Giriş ekranına yönlendiriyorum.");
+    location.href = "/admin/login";
+    return;
+}
+
+if(r.ok){
+    location.reload();
+} else {
+    alert("Güncellenemedi");
+}
+}
+
+/* =======================
+DÜZENLE (eski akış aynı: prompt prompt prompt -> sonra scope sor)
+======================= */
+async function editOffer(id, currentPrice, currentUrl, currentAddr){
+// 1) Fiyat
+let p = prompt("Yeni fiyat (örn: 459.90):", String(currentPrice ?? ""));
+if(p === null) return;
+p = p.trim().replace(",", ".");
+if(!p || isNaN(parseFloat(p))){
+    alert("Geçerli bir sayı gir lütfen.");
+    return;
+}
+
+// 2) Adres
+let a = prompt("Şube adresi (boş bırakabilirsin):", currentAddr || "");
+if(a === null) return;
+a = a.trim();
+
+// 3) URL
+let u = prompt("Kaynak URL (boş bırakabilirsin):", currentUrl || "");
+if(u === null) return;
+u = u.trim();
+
+// 4) en sonda scope seçtir
+showEditModal({ id: id, price: p, url: u, addr: a });
+}